@@ -0,0 +1,57 @@
+"""Gunicorn settings for production serving
+
+Every setting can be overridden from the environment, e.g. on Render:
+WEB_CONCURRENCY=4 GUNICORN_THREADS=8. Send SIGHUP to the master process
+for a graceful reload; workers finish in-flight requests before exiting.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Processes x threads = concurrent requests. Keep threads <= DB_POOL_MAX_SIZE
+# so a worker's threads never wait on each other for a database connection.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# gthread by default. LIVE_UPDATES needs GUNICORN_WORKER_CLASS=gevent (gevent and psycogreen are
+# in requirements.txt, and render.yaml selects it): each /events stream is then a greenlet
+# instead of a thread, so idle streams cost memory rather than workers; worker_connections then
+# bounds open connections per process. Under gthread every open page holds a thread.
+# Password hashing is CPU-bound and holds a gevent worker while it runs, so a deployment with
+# heavy login traffic can run a separate gevent service for /events only.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers periodically, staggered so they don't all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Import the app once in the master so workers fork with it loaded. Safe because
+# importing opens no database connections; each worker builds its own pool. Never under
+# gevent or eventlet: they monkey-patch threading in each worker after the fork, so the
+# module-level locks created by an import in the master (db._pool_lock, live._hub_lock, ...)
+# would stay OS locks that block the whole worker instead of one greenlet.
+async_worker = worker_class in ('gevent', 'eventlet')
+preload_app = not async_worker and os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+def post_fork(server, worker):
+    """Under gevent or eventlet, make psycopg2 wait for the network cooperatively"""
+    if not async_worker:
+        return
+    try:
+        if worker_class == 'gevent':
+            from psycogreen.gevent import patch_psycopg
+        else:
+            from psycogreen.eventlet import patch_psycopg
+    except ImportError:
+        server.log.warning("%s worker without psycogreen: database calls block the whole worker", worker_class)
+        return
+    patch_psycopg()
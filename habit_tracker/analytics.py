@@ -0,0 +1,33 @@
+import logging
+
+from flask import Blueprint, render_template, redirect, url_for, session, flash
+
+from .cache import cached_page
+from .db import get_read_connection
+from .insights import load_analytics
+
+bp = Blueprint('analytics', __name__)
+
+logger = logging.getLogger(__name__)
+
+@bp.route('/analytics')
+def analytics():
+    """Analytics and insights page"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    conn = get_read_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('tracking.dashboard'))
+    
+    try:
+        context = cached_page('analytics', session['user_id'], conn, load_analytics)
+        return render_template('analytics.html', **context)
+        
+    except Exception:
+        flash('Error loading analytics.', 'error')
+        logger.exception("Analytics error")
+        return redirect(url_for('tracking.dashboard'))
+    finally:
+        conn.close()
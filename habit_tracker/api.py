@@ -0,0 +1,125 @@
+"""Versioned JSON API over the same payloads the HTML pages render
+
+Every response carries a weak ETag derived from the user's data_version
+(bumped on each toggle or habit edit), so a client revalidating with
+If-None-Match gets a 304 after one primary-key lookup, without the page
+being recomputed or sent again.
+"""
+import hashlib
+import logging
+from datetime import date, datetime
+
+from flask import Blueprint, jsonify, make_response, request, session
+
+from . import queries
+from .cache import cached_page, page_key
+from .db import get_read_connection
+from .insights import compute_dashboard, load_analytics
+from .tracking import heatmap_args, load_heatmap, load_weekly, weekly_args
+
+API_VERSION = 1
+
+bp = Blueprint('api', __name__, url_prefix=f'/api/v{API_VERSION}')
+
+logger = logging.getLogger(__name__)
+
+def _jsonable(value):
+    """Payload with dates as ISO strings (jsonify would send HTTP dates)"""
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _etag(kind, user_id, data_version, variant=None):
+    key = page_key(kind, user_id, datetime.now().date(), data_version, variant)
+    return hashlib.sha1(f'v{API_VERSION}:{key}'.encode()).hexdigest()
+
+def versioned_response(kind, load, variant=None):
+    """JSON for load(user_id, conn, data_version), or 304 if the client's copy is current
+
+    `variant` must tell apart every parameter that changes the payload, so
+    it goes into the ETag.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Database error'}), 503
+
+    try:
+        user_id = session['user_id']
+        data_version = queries.get_data_version(user_id, conn)
+        etag = _etag(kind, user_id, data_version, variant)
+
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            payload = load(user_id, conn, data_version)
+            response = jsonify(dict(_jsonable(payload), success=True, data_version=data_version))
+            if payload.get('stale'):
+                # The fresh payload will carry this same ETag, so this one mustn't be kept
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+
+        response.set_etag(etag, weak=True)
+        # Let clients keep a copy but revalidate it on every use
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except Exception:
+        logger.exception("API %s error", kind)
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+    finally:
+        conn.close()
+
+@bp.route('/dashboard')
+def dashboard():
+    """Dashboard summary"""
+    return versioned_response(
+        'dashboard',
+        lambda user_id, conn, data_version: cached_page('dashboard', user_id, conn, compute_dashboard,
+                                                        data_version=data_version)
+    )
+
+@bp.route('/weekly')
+def weekly():
+    """Weekly grid; takes the same week/weeks parameters as the weekly view"""
+    try:
+        week_offset, weeks = weekly_args()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid week'}), 400
+    return versioned_response(
+        'weekly',
+        lambda user_id, conn, data_version: dict(
+            load_weekly(user_id, week_offset, weeks, conn, data_version=data_version),
+            week_offset=week_offset, weeks=weeks
+        ),
+        variant=f'{week_offset}:{weeks}'
+    )
+
+@bp.route('/heatmap')
+def heatmap():
+    """Heatmap range; takes the same range/offset parameters as the heatmap page"""
+    try:
+        range_kind, offset = heatmap_args()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid offset'}), 400
+    return versioned_response(
+        'heatmap',
+        lambda user_id, conn, data_version: load_heatmap(user_id, range_kind, offset, conn,
+                                                         data_version=data_version),
+        variant=f'{range_kind}:{offset}'
+    )
+
+@bp.route('/analytics')
+def analytics():
+    """Analytics page figures, recommendations and insights"""
+    return versioned_response(
+        'analytics',
+        lambda user_id, conn, data_version: cached_page('analytics', user_id, conn, load_analytics,
+                                                        data_version=data_version)
+    )
@@ -0,0 +1,190 @@
+import logging
+
+import psycopg2
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+
+from . import queries
+from .db import get_db_connection
+from .passwords import HasherBusy, get_hasher
+
+bp = Blueprint('auth', __name__)
+
+logger = logging.getLogger(__name__)
+
+# Sent with 429s when every password hashing slot is taken
+BUSY_HEADERS = {'Retry-After': '1'}
+
+def upgrade_password_hash(user_id, password):
+    """Re-hash a just-verified password with the current parameters (best effort)
+
+    Hashes before borrowing a connection, and holds it only for the update.
+    """
+    try:
+        password_hash = get_hasher().hash(password)
+    except HasherBusy:
+        return  # the next login tries again
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        queries.update_password_hash(user_id, password_hash, conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        logger.warning("Password rehash failed for user %s", user_id, exc_info=True)
+    finally:
+        conn.close()
+
+@bp.route('/')
+def index():
+    """Home page - redirect to dashboard if logged in"""
+    if 'user_id' in session:
+        return redirect(url_for('tracking.dashboard'))
+    return render_template('index.html')
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    """User registration"""
+    logger.debug("Register route called - Method: %s", request.method)
+    
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        
+        logger.debug("Registration attempt - Username: '%s'", username)
+        
+        # Validation
+        if not username or not password:
+            flash('Username and password are required!', 'error')
+            return render_template('register.html')
+        
+        if len(username) < 3:
+            flash('Username must be at least 3 characters long!', 'error')
+            return render_template('register.html')
+        
+        if len(password) < 6:
+            flash('Password must be at least 6 characters long!', 'error')
+            return render_template('register.html')
+        
+        # Turn a burst away before it borrows a connection; no connection is held while hashing
+        hasher = get_hasher()
+        if hasher.busy('hash'):
+            flash('Too many requests right now. Please try again in a moment.', 'error')
+            return render_template('register.html'), 429, BUSY_HEADERS
+        
+        conn = get_db_connection()
+        if not conn:
+            flash('Database error. Please try again.', 'error')
+            return render_template('register.html')
+        
+        try:
+            # Check if username exists
+            user = queries.get_user_by_username(username, conn)
+        except Exception:
+            logger.exception("Registration error")
+            flash('Registration failed. Please try again.', 'error')
+            return render_template('register.html')
+        finally:
+            conn.close()
+        
+        if user:
+            logger.info("Username '%s' already exists", username)
+            flash('Username already exists!', 'error')
+            return render_template('register.html')
+        
+        try:
+            password_hash = hasher.hash(password)
+        except HasherBusy:
+            flash('Too many requests right now. Please try again in a moment.', 'error')
+            return render_template('register.html'), 429, BUSY_HEADERS
+        
+        conn = get_db_connection()
+        if not conn:
+            flash('Database error. Please try again.', 'error')
+            return render_template('register.html')
+        
+        try:
+            # Create new user
+            user_id = queries.create_user(username, password_hash, conn)
+            conn.commit()
+            
+            if user_id:
+                logger.info("User created successfully: %s (ID: %s)", username, user_id)
+                # Create sample habits for new user
+                queries.create_sample_habits(user_id, conn)
+                
+                flash('Registration successful! Please log in.', 'success')
+                return redirect(url_for('auth.login'))
+            else:
+                logger.error("Registration failed: No user ID returned")
+                flash('Registration failed. Please try again.', 'error')
+                
+        except psycopg2.IntegrityError:
+            # Taken by another registration while the password was hashing
+            conn.rollback()
+            flash('Username already exists!', 'error')
+        except Exception:
+            logger.exception("Registration error")
+            flash('Registration failed. Please try again.', 'error')
+        finally:
+            conn.close()
+    
+    return render_template('register.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    """User login"""
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        
+        if not username or not password:
+            flash('Username and password are required!', 'error')
+            return render_template('login.html')
+        
+        # Turn a burst away before it borrows a connection; no connection is held while hashing
+        hasher = get_hasher()
+        if hasher.busy('verify'):
+            flash('Too many login attempts right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 429, BUSY_HEADERS
+        
+        conn = get_db_connection()
+        if not conn:
+            flash('Database error. Please try again.', 'error')
+            return render_template('login.html')
+        
+        try:
+            user = queries.get_user_by_username(username, conn)
+        except Exception:
+            flash('Login failed. Please try again.', 'error')
+            logger.exception("Login error")
+            return render_template('login.html')
+        finally:
+            conn.close()
+        
+        try:
+            if user and hasher.verify(user['password_hash'], password):
+                if hasher.needs_rehash(user['password_hash']):
+                    upgrade_password_hash(user['id'], password)
+                session['user_id'] = user['id']
+                session['username'] = user['username']
+                flash('Login successful!', 'success')
+                return redirect(url_for('tracking.dashboard'))
+            else:
+                flash('Invalid username or password!', 'error')
+                
+        except HasherBusy:
+            flash('Too many login attempts right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 429, BUSY_HEADERS
+        except Exception:
+            flash('Login failed. Please try again.', 'error')
+            logger.exception("Login error")
+    
+    return render_template('login.html')
+
+@bp.route('/logout')
+def logout():
+    """User logout"""
+    session.clear()
+    flash('You have been logged out.', 'info')
+    return redirect(url_for('auth.index'))
@@ -0,0 +1,764 @@
+"""Route benchmarks through Flask's test client
+
+Drives each page and API route as users created by `flask seed-data`,
+recording latency percentiles plus the queries issued and rows fetched
+per request, and writes the results as JSON. A previous results file can
+be passed with --compare to flag regressions: slower p50/p95 past the
+threshold, or any route issuing more queries than before or than its
+QUERY_BUDGETS entry. `flask benchmark-login`
+logs the seeded users in from many threads at once, to see how password
+hashing holds up under a burst, and `flask benchmark-bitmaps` compares the
+habit_bitmaps store with habit_entries rows for size and stats speed.
+`flask benchmark-export` streams the entry export for rows and bytes per
+second, and checks every export hands its connection back.
+
+`flask benchmark-startup` times importing the app and its first request
+in fresh processes, and `flask benchmark-load` runs gunicorn with each
+workers x threads combination and drives it over HTTP for requests/sec.
+"""
+import http.client
+import json
+import math
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from werkzeug.test import EnvironBuilder
+
+from .bitmaps import load_histories, write_habit_bitmaps
+from .cache import NullCache
+from .db import ConnectionPool, ReplicaSet, _pool_options, get_db_connection, get_pool, get_replicas, read_urls
+from .instrumentation import InstrumentedCursor
+from .queries import get_entries_for_habits
+from .seed import SEED_PASSWORD
+from .stats import STATS_WINDOWS, _compute_habit_stats
+from .streaks import _longest_streak_from_entries
+
+# (name, path) of every route benchmarked
+ROUTES = [
+    ('dashboard', '/dashboard'),
+    ('weekly_view', '/weekly_view'),
+    ('weekly_view_quarter', '/weekly_view?weeks=13'),
+    ('heatmap_year', '/heatmap?range=year'),
+    ('analytics', '/analytics'),
+    ('habits', '/habits'),
+    ('api_dashboard', '/api/v1/dashboard'),
+    ('api_weekly', '/api/v1/weekly'),
+    ('api_analytics', '/api/v1/analytics'),
+    ('export_entries_csv', '/export/entries.csv'),
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Most queries a request to these routes may issue, cache or no cache
+QUERY_BUDGETS = {
+    'analytics': 3,
+}
+
+class QueryCounter:
+    """Queries executed and rows fetched since the last reset"""
+
+    queries = 0
+    rows = 0
+
+    @classmethod
+    def reset(cls):
+        cls.queries = cls.rows = 0
+
+class CountingCursor(InstrumentedCursor):
+    """InstrumentedCursor that also reports to QueryCounter"""
+
+    def execute(self, query, vars=None):
+        QueryCounter.queries += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        QueryCounter.queries += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        QueryCounter.queries += 1
+        return super().copy_expert(sql, file, size)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            QueryCounter.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        QueryCounter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        QueryCounter.rows += len(rows)
+        return rows
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def summarize(latencies, queries, rows, errors):
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': round(sum(ordered) / len(ordered), 3) if ordered else None,
+        'max_ms': round(ordered[-1], 3) if ordered else None,
+        'queries_per_request': round(queries / len(latencies), 2) if latencies else None,
+        'rows_per_request': round(rows / len(latencies), 1) if latencies else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        summary[f'p{pct}_ms'] = round(value, 3) if value is not None else None
+    return summary
+
+def seeded_user_ids(prefix, limit, conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, username FROM users WHERE username LIKE %s ORDER BY id LIMIT %s",
+        (prefix.replace('_', r'\_') + r'\_%', limit)
+    )
+    return cursor.fetchall()
+
+def run_route(client, path, users, requests, warmup):
+    """Request `path` round-robin as each user; returns the summary dict"""
+    latencies = []
+    queries = rows = errors = 0
+    for index in range(warmup + requests):
+        user = users[index % len(users)]
+        with client.session_transaction() as session:
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+
+        QueryCounter.reset()
+        started = time.perf_counter()
+        response = client.get(path)
+        response.get_data()  # drain streamed bodies inside the timing
+        response.close()  # as a server would, returning streamed responses' connections
+        elapsed = (time.perf_counter() - started) * 1000
+        if index < warmup:
+            continue
+
+        latencies.append(elapsed)
+        queries += QueryCounter.queries
+        rows += QueryCounter.rows
+        if response.status_code != 200:
+            errors += 1
+    return summarize(latencies, queries, rows, errors)
+
+def over_budget(results):
+    """Routes issuing more queries per request than their QUERY_BUDGETS entry"""
+    return [
+        f"{name} queries: {summary['queries_per_request']} over a budget of {QUERY_BUDGETS[name]}"
+        for name, summary in results['routes'].items()
+        if name in QUERY_BUDGETS and (summary.get('queries_per_request') or 0) > QUERY_BUDGETS[name]
+    ]
+
+def compare(results, baseline, threshold):
+    """Regressions over the baseline: p50/p95 grown by more than `threshold` (a fraction), or more queries"""
+    regressions = []
+    # Cache hits skip queries, so counts only compare between runs with the same --cache
+    same_cache = baseline.get('meta', {}).get('cache') == results['meta']['cache']
+    for name, summary in results['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if before.get(metric) and summary.get(metric) and summary[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {before[metric]} -> {summary[metric]}")
+        # Query counts are deterministic, so any increase is a regression
+        queries_before = before.get('queries_per_request')
+        if same_cache and queries_before is not None and (summary.get('queries_per_request') or 0) > queries_before:
+            regressions.append(f"{name} queries: {queries_before} -> {summary['queries_per_request']}")
+    return regressions
+
+@click.command('benchmark')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix used by seed-data.')
+@click.option('--users', type=int, default=10, show_default=True, help='Seeded users to cycle through.')
+@click.option('--requests', 'requests_per_route', type=int, default=50, show_default=True,
+              help='Timed requests per route.')
+@click.option('--warmup', type=int, default=5, show_default=True, help='Untimed requests per route first.')
+@click.option('--route', 'route_names', multiple=True, help='Only these routes (repeatable).')
+@click.option('--cache/--no-cache', default=False, show_default=True,
+              help='Keep the page cache on (off measures the uncached compute path).')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark.json', show_default=True)
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Earlier results to compare against.')
+@click.option('--threshold', type=float, default=0.2, show_default=True,
+              help='Allowed p50/p95 growth over the baseline before failing.')
+def benchmark_command(prefix, users, requests_per_route, warmup, route_names, cache, output, baseline_path, threshold):
+    """Benchmark every route as seeded users and save the results as JSON"""
+    app = current_app._get_current_object()
+    config = app.config
+    if not config['DATABASE_URL']:
+        raise click.ClickException('DATABASE_URL is not set')
+
+    routes = [(name, path) for name, path in ROUTES if not route_names or name in route_names]
+    if not routes:
+        raise click.ClickException(f"No such route; choose from {', '.join(name for name, _ in ROUTES)}")
+
+    # Count queries and rows on every connection the routes borrow, replicas included
+    for name in ('db_pool', 'db_replicas'):
+        old = app.extensions.pop(name, None)
+        if old is not None:
+            old.closeall()
+    options = _pool_options(config)
+    app.extensions['db_pool'] = ConnectionPool(config['DATABASE_URL'], cursor_factory=CountingCursor, **options)
+    replica_urls = read_urls(config)
+    if replica_urls:
+        app.extensions['db_replicas'] = ReplicaSet(replica_urls, retry_after=config['REPLICA_RETRY_AFTER'],
+                                                   cursor_factory=CountingCursor, **options)
+    if not cache:
+        app.extensions['cache'] = NullCache()
+
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        bench_users = seeded_user_ids(prefix, users, conn)
+    finally:
+        conn.close()
+    if not bench_users:
+        raise click.ClickException(f"No users named '{prefix}_*'; run 'flask seed-data' first")
+
+    client = app.test_client()
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'users': len(bench_users),
+            'requests_per_route': requests_per_route,
+            'warmup': warmup,
+            'cache': cache,
+            'replicas': len(replica_urls),
+        },
+        'routes': {},
+    }
+    for name, path in routes:
+        summary = run_route(client, path, bench_users, requests_per_route, warmup)
+        results['routes'][name] = summary
+        print(f"{name:<22} p50 {summary['p50_ms']:>8.2f}ms  p95 {summary['p95_ms']:>8.2f}ms  "
+              f"{summary['queries_per_request']:>5} queries  {summary['rows_per_request']:>8} rows"
+              + (f"  {summary['errors']} errors" if summary['errors'] else ''))
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    regressions = over_budget(results)
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions += compare(results, json.load(f), threshold)
+    if regressions:
+        for regression in regressions:
+            print(f"❌ {regression}")
+        raise click.ClickException(f'{len(regressions)} regressions')
+    if baseline_path:
+        print(f"✅ No regressions against {baseline_path}")
+
+def timed_login(app, username, password):
+    """(status code, latency in ms) of one login from a fresh client"""
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/login', data={'username': username, 'password': password})
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+@click.command('benchmark-login')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix used by seed-data.')
+@click.option('--users', type=int, default=10, show_default=True, help='Seeded users to cycle through.')
+@click.option('--requests', 'attempts', type=int, default=200, show_default=True, help='Login attempts in total.')
+@click.option('--concurrency', type=int, default=16, show_default=True, help='Logins in flight at once.')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-login.json', show_default=True)
+def benchmark_login_command(prefix, users, attempts, concurrency, output):
+    """Log seeded users in concurrently; reports throughput, 429s and a cheap route's latency meanwhile"""
+    app = current_app._get_current_object()
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        bench_users = seeded_user_ids(prefix, users, conn)
+    finally:
+        conn.close()
+    if not bench_users:
+        raise click.ClickException(f"No users named '{prefix}_*'; run 'flask seed-data' first")
+
+    # Meanwhile, time a page that needs no hashing to see whether logins starve it
+    probe_latencies = []
+    done = threading.Event()
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/')
+            probe_latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(
+            lambda index: timed_login(app, bench_users[index % len(bench_users)]['username'], SEED_PASSWORD),
+            range(attempts),
+        ))
+    seconds = time.perf_counter() - started
+    done.set()
+    prober.join()
+
+    statuses = [status for status, _ in outcomes]
+    logged_in = statuses.count(302)
+    busy = statuses.count(429)
+    login = summarize([latency for _, latency in outcomes], 0, 0, len(statuses) - logged_in - busy)
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'users': len(bench_users),
+            'attempts': attempts,
+            'concurrency': concurrency,
+            'hash_method': app.config['PASSWORD_HASH_METHOD'],
+            'hash_workers': app.config['PASSWORD_HASH_WORKERS'],
+            'hash_queue': app.config['PASSWORD_HASH_QUEUE'],
+        },
+        'seconds': round(seconds, 3),
+        'logins_per_sec': round(logged_in / seconds, 1) if seconds else None,
+        'logged_in': logged_in,
+        'rejected_busy': busy,
+        'login': login,
+        'probe': summarize(probe_latencies, 0, 0, 0),
+    }
+    print(f"login  {results['logins_per_sec']} logins/sec, {logged_in} ok, {busy} busy (429), "
+          f"{login['errors']} other; p50 {login['p50_ms']:.1f}ms  p95 {login['p95_ms']:.1f}ms")
+    if probe_latencies:
+        print(f"probe  p50 {results['probe']['p50_ms']:.1f}ms  p95 {results['probe']['p95_ms']:.1f}ms "
+              f"over {len(probe_latencies)} requests")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+def connections_in_use(app):
+    """Connections checked out of the primary and replica pools"""
+    with app.app_context():
+        in_use = get_pool().stats()['in_use']
+        replicas = get_replicas()
+        if replicas is not None:
+            in_use += sum(pool['in_use'] for pool in replicas.stats())
+    return in_use
+
+def unread_response(app, client, path, method):
+    """Call the app as a server would for `path`, then close the body without reading it"""
+    cookie = client.get_cookie('session')
+    headers = {'Cookie': f'session={cookie.value}'} if cookie else {}
+    environ = EnvironBuilder(path=path, method=method, headers=headers).get_environ()
+    body = app(environ, lambda status, headers, exc_info=None: None)
+    if hasattr(body, 'close'):
+        body.close()
+
+@click.command('benchmark-export')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix used by seed-data.')
+@click.option('--users', type=int, default=10, show_default=True, help='Seeded users to cycle through.')
+@click.option('--requests', 'exports', type=int, default=20, show_default=True, help='Full exports to stream.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-export.json', show_default=True)
+def benchmark_export_command(prefix, users, exports, fmt, output):
+    """Stream entry exports as seeded users; reports rows/sec and bytes/sec"""
+    app = current_app._get_current_object()
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        bench_users = seeded_user_ids(prefix, users, conn)
+    finally:
+        conn.close()
+    if not bench_users:
+        raise click.ClickException(f"No users named '{prefix}_*'; run 'flask seed-data' first")
+
+    client = app.test_client()
+    path = f'/export/entries.{fmt}'
+    latencies = []
+    rows = total_bytes = errors = 0
+    started = time.perf_counter()
+    for index in range(exports):
+        user = bench_users[index % len(bench_users)]
+        with client.session_transaction() as session:
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+        request_started = time.perf_counter()
+        response = client.get(path)
+        body = response.get_data()
+        response.close()
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        if response.status_code != 200:
+            errors += 1
+            continue
+        total_bytes += len(body)
+        rows += body.count(b'\n') - (1 if fmt == 'csv' else 0)
+    seconds = time.perf_counter() - started
+
+    # A HEAD, and a body dropped unread, must hand the connection back too
+    unread_response(app, client, path, 'HEAD')
+    unread_response(app, client, path, 'GET')
+    leaked = connections_in_use(app)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'users': len(bench_users),
+            'exports': exports,
+            'format': fmt,
+            'batch_size': app.config['EXPORT_BATCH_SIZE'],
+        },
+        'seconds': round(seconds, 3),
+        'rows': rows,
+        'bytes': total_bytes,
+        'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+        'bytes_per_sec': round(total_bytes / seconds, 1) if seconds else None,
+        'export': summarize(latencies, 0, rows, errors),
+        'connections_leaked': leaked,
+    }
+    print(f"export  {results['rows_per_sec']:,} rows/sec  {results['bytes_per_sec'] / 1e6:.2f} MB/sec  "
+          f"p50 {results['export']['p50_ms']:.1f}ms  p95 {results['export']['p95_ms']:.1f}ms"
+          + (f"  {errors} errors" if errors else ''))
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+    if leaked:
+        raise click.ClickException(f'{leaked} connections still checked out after the exports')
+
+# Run in a fresh interpreter by benchmark-startup; prints one JSON line
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from wsgi import app
+imported = time.perf_counter()
+connected_at_import = app.extensions.get('db_pool') is not None
+client = app.test_client()
+response = client.get(sys.argv[1])
+response.get_data()
+response.close()
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'status': response.status_code,
+    'connected_at_import': connected_at_import,
+}))
+'''
+
+@click.command('benchmark-startup')
+@click.option('--runs', type=int, default=5, show_default=True, help='Fresh processes to start.')
+@click.option('--path', default='/', show_default=True, help='First request each process serves.')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-startup.json', show_default=True)
+def benchmark_startup_command(runs, path, output):
+    """Time importing the app and serving its first request, each in a fresh process"""
+    app = current_app._get_current_object()
+    project_dir = os.path.dirname(app.root_path)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, path], cwd=project_dir,
+                                   capture_output=True, text=True)
+        process_ms = (time.perf_counter() - started) * 1000
+        if completed.returncode != 0:
+            raise click.ClickException(f'App failed to start:\n{completed.stderr[-2000:]}')
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = process_ms
+        samples.append(sample)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'runs': runs,
+            'path': path,
+        },
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+        'connected_at_import': any(sample['connected_at_import'] for sample in samples),
+    }
+    for metric in ('import_ms', 'first_request_ms', 'process_ms'):
+        values = sorted(sample[metric] for sample in samples)
+        results[metric] = {'p50': round(percentile(values, 50), 1), 'max': round(values[-1], 1)}
+        print(f"{metric:<18} p50 {results[metric]['p50']:>8.1f}ms  max {results[metric]['max']:>8.1f}ms")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+    if results['connected_at_import']:
+        raise click.ClickException('Importing the app opened a database connection')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f'gunicorn exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise click.ClickException(f'gunicorn did not listen on port {port} within {timeout}s')
+
+def login_cookie(port, username, password):
+    """The session cookie of one login over HTTP"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        body = f'username={username}&password={password}'
+        conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie', '')
+    finally:
+        conn.close()
+    if response.status != 302 or not cookie:
+        raise click.ClickException(f'Could not log in as {username} (status {response.status})')
+    return cookie.split(';', 1)[0]
+
+def drive(port, path, cookie, seconds, concurrency):
+    """Keep-alive GETs of `path` from `concurrency` threads; (latencies in ms, status counts)"""
+    deadline = time.monotonic() + seconds
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine, counts = [], {}
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Cookie': cookie})
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    status = 'error'
+                mine.append((time.perf_counter() - started) * 1000)
+                counts[status] = counts.get(status, 0) + 1
+        finally:
+            conn.close()
+        with lock:
+            latencies.extend(mine)
+            for status, count in counts.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+@click.command('benchmark-load')
+@click.option('--workers', 'worker_counts', type=int, multiple=True, help='Worker processes (repeatable; default 1 2 4).')
+@click.option('--threads', 'thread_counts', type=int, multiple=True, help='Threads per worker (repeatable; default 1 4).')
+@click.option('--path', default='/dashboard', show_default=True, help='Route to load.')
+@click.option('--concurrency', type=int, default=16, show_default=True, help='Client connections at once.')
+@click.option('--seconds', type=float, default=10, show_default=True, help='Load duration per combination.')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix used by seed-data.')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-load.json', show_default=True)
+def benchmark_load_command(worker_counts, thread_counts, path, concurrency, seconds, prefix, output):
+    """Serve the app with gunicorn per workers x threads combination and report requests/sec"""
+    app = current_app._get_current_object()
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        bench_users = seeded_user_ids(prefix, 1, conn)
+    finally:
+        conn.close()
+    if not bench_users:
+        raise click.ClickException(f"No users named '{prefix}_*'; run 'flask seed-data' first")
+
+    project_dir = os.path.dirname(app.root_path)
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'path': path,
+            'concurrency': concurrency,
+            'seconds': seconds,
+        },
+        'runs': [],
+    }
+    for workers in worker_counts or (1, 2, 4):
+        for threads in thread_counts or (1, 4):
+            port = free_port()
+            env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+                       GUNICORN_LOG_LEVEL='warning', GUNICORN_MAX_REQUESTS='0')
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null',
+                 'wsgi:app'],
+                cwd=project_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for_port(port, process)
+                cookie = login_cookie(port, bench_users[0]['username'], SEED_PASSWORD)
+                drive(port, path, cookie, min(seconds, 2), concurrency)  # warm every worker up
+                started = time.perf_counter()
+                latencies, statuses = drive(port, path, cookie, seconds, concurrency)
+                elapsed = time.perf_counter() - started
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+
+            ok = statuses.get(200, 0)
+            run = dict(summarize(latencies, 0, 0, len(latencies) - ok), workers=workers, threads=threads,
+                       requests_per_sec=round(ok / elapsed, 1), statuses={str(k): v for k, v in statuses.items()})
+            results['runs'].append(run)
+            print(f"workers {workers:>2} threads {threads:>2}  {run['requests_per_sec']:>8.1f} req/s  "
+                  f"p50 {run['p50_ms']:>8.2f}ms  p95 {run['p95_ms']:>8.2f}ms"
+                  + (f"  {run['errors']} errors" if run['errors'] else ''))
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+def table_bytes(table, conn):
+    """On-disk size of a table with its indexes and TOAST, partitions included"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT pg_total_relation_size(c.oid) + COALESCE((
+            SELECT SUM(pg_total_relation_size(i.inhrelid)) FROM pg_inherits i WHERE i.inhparent = c.oid
+        ), 0) AS bytes
+        FROM pg_class c WHERE c.oid = to_regclass(%s)
+    ''', (table,))
+    row = cursor.fetchone()
+    return int(row['bytes']) if row else 0
+
+def time_ms(fn, repeat):
+    """Mean milliseconds per call of fn() over `repeat` calls"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - started) * 1000 / repeat, 3)
+
+@click.command('benchmark-bitmaps')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix used by seed-data.')
+@click.option('--users', type=int, default=10, show_default=True, help='Seeded users whose habits to use.')
+@click.option('--repeat', type=int, default=20, show_default=True, help='Timed repetitions of each step.')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-bitmaps.json', show_default=True)
+def benchmark_bitmaps_command(prefix, users, repeat, output):
+    """Compare habit_bitmaps with habit_entries rows: size, fetch time and stats computation
+
+    The bitmaps are written in one transaction that is rolled back at the
+    end, so the run leaves habit_bitmaps as it found it whether or not
+    BITMAP_STORE is on.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        bench_users = seeded_user_ids(prefix, users, conn)
+        if not bench_users:
+            raise click.ClickException(f"No users named '{prefix}_*'; run 'flask seed-data' first")
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM habits WHERE user_id = ANY(%s)', ([user['id'] for user in bench_users],))
+        habit_ids = [row['id'] for row in cursor.fetchall()]
+
+        entries_by_habit = get_entries_for_habits(habit_ids, conn)
+        write_habit_bitmaps(entries_by_habit, conn)  # never committed
+        histories = load_histories(habit_ids, conn)
+        today = datetime.now().date()
+
+        # Habits without entries get no bitmap rows, and nothing to compare
+        mismatches = []
+        for habit_id, entries in entries_by_habit.items():
+            expected = _compute_habit_stats(habit_id, entries, today)
+            history = histories.get(habit_id)
+            if entries and (history is None or history.stats(habit_id, today, STATS_WINDOWS) != expected):
+                mismatches.append(habit_id)
+
+        entry_rows = sum(len(entries) for entries in entries_by_habit.values())
+        cursor.execute('SELECT COUNT(*) AS n FROM habit_bitmaps')
+        bitmap_rows = cursor.fetchone()['n']
+        cursor.execute('SELECT COUNT(*) AS n FROM habit_entries')
+        all_entry_rows = cursor.fetchone()['n']
+        entries_bytes = table_bytes('habit_entries', conn)
+        bitmaps_bytes = table_bytes('habit_bitmaps', conn)
+
+        results = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'habits': len(habit_ids),
+                'entries': entry_rows,
+                'repeat': repeat,
+            },
+            'storage': {
+                'entries_table_bytes': entries_bytes,
+                'entries_table_rows': all_entry_rows,
+                'bitmaps_table_bytes': bitmaps_bytes,
+                'bitmaps_table_rows': bitmap_rows,
+                'bytes_per_entry_rows': round(entries_bytes / all_entry_rows, 1) if all_entry_rows else None,
+                'bytes_per_entry_bitmaps': round(bitmaps_bytes / all_entry_rows, 1) if all_entry_rows else None,
+            },
+            'fetch_ms': {
+                'rows': time_ms(lambda: get_entries_for_habits(habit_ids, conn), repeat),
+                'bitmaps': time_ms(lambda: load_histories(habit_ids, conn), repeat),
+            },
+            'longest_streak_ms': {
+                'rows': time_ms(lambda: [_longest_streak_from_entries(entries)
+                                         for entries in entries_by_habit.values()], repeat),
+                'bitmaps': time_ms(lambda: [history.longest_streak() for history in histories.values()], repeat),
+            },
+            'stats_row_ms': {
+                'rows': time_ms(lambda: [_compute_habit_stats(habit_id, entries, today)
+                                         for habit_id, entries in entries_by_habit.items()], repeat),
+                'bitmaps': time_ms(lambda: [history.stats(habit_id, today, STATS_WINDOWS)
+                                            for habit_id, history in histories.items()], repeat),
+            },
+            'mismatches': mismatches,
+        }
+        conn.rollback()
+    finally:
+        conn.close()
+
+    storage = results['storage']
+    print(f"storage        rows {storage['entries_table_bytes']:>12,} B ({storage['bytes_per_entry_rows']} B/entry)  "
+          f"bitmaps {storage['bitmaps_table_bytes']:>10,} B ({storage['bytes_per_entry_bitmaps']} B/entry)")
+    for step in ('fetch_ms', 'longest_streak_ms', 'stats_row_ms'):
+        print(f"{step:<14} rows {results[step]['rows']:>10.3f}ms  bitmaps {results[step]['bitmaps']:>10.3f}ms "
+              f"for {len(habit_ids)} habits")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+    if mismatches:
+        raise click.ClickException(f'Bitmap stats differ from row stats for habits {mismatches[:20]}')
+
+def init_app(app):
+    """Register the benchmark CLI commands"""
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(benchmark_login_command)
+    app.cli.add_command(benchmark_export_command)
+    app.cli.add_command(benchmark_startup_command)
+    app.cli.add_command(benchmark_load_command)
+    app.cli.add_command(benchmark_bitmaps_command)
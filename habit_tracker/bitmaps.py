@@ -0,0 +1,199 @@
+"""Compact habit history: a pair of bitmaps per habit and year
+
+With BITMAP_STORE on, habit_bitmaps holds one row per habit and year next
+to habit_entries: a has-entry bitmap and a completed bitmap, bit i for the
+i-th day of the year, 46 bytes each. A year of check-ins costs one small
+row instead of up to 366, and the figures in habit_stats come from
+shifts, masks and popcounts over the whole history at once.
+
+The rows are rewritten from habit_entries by refresh_habit_stats(), or
+have the bits of changed cells set by update_habit_stats(), so every
+write keeps them current; habit_entries stays the source of truth.
+"""
+from datetime import date, timedelta
+
+from psycopg2.extras import execute_values
+
+# 366 days rounded up to whole bytes
+YEAR_BYTES = 46
+
+def encode_entries(entries):
+    """{year: (has_entry bits, completed bits)} for one habit's entries"""
+    years = {}
+    for entry in entries:
+        day = entry['date']
+        bit = 1 << (day.timetuple().tm_yday - 1)
+        has_entry, completed = years.get(day.year, (0, 0))
+        years[day.year] = (has_entry | bit, completed | bit if entry['completed'] else completed)
+    return years
+
+def _spread(bits):
+    """`bits` with bit i moved to bit 4i, one hex digit per day"""
+    return int(format(bits, 'b'), 16)
+
+def _every_seventh(length):
+    """Bits 0, 7, 14, ... below `length`"""
+    weeks = length // 7 + 1
+    return ((1 << (7 * weeks)) - 1) // 127 & ((1 << length) - 1)
+
+class HabitHistory:
+    """A habit's history as two ints, bit i standing for day start + i"""
+
+    def __init__(self, start, has_entry=0, completed=0):
+        self.start = start
+        self.has_entry = has_entry
+        self.completed = completed
+
+    @classmethod
+    def from_years(cls, years):
+        """History from {year: (has_entry bits, completed bits)}"""
+        if not years:
+            return cls(None)
+        start = date(min(years), 1, 1)
+        has_entry = completed = 0
+        for year, (year_has_entry, year_completed) in years.items():
+            offset = (date(year, 1, 1) - start).days
+            has_entry |= year_has_entry << offset
+            completed |= year_completed << offset
+        return cls(start, has_entry, completed)
+
+    def _index(self, day):
+        return (day - self.start).days
+
+    def _through(self, bits, day):
+        """`bits` for days up to and including `day`"""
+        index = self._index(day)
+        return bits & ((1 << (index + 1)) - 1) if index >= 0 else 0
+
+    def _since(self, bits, day):
+        """`bits` for days from `day` on"""
+        index = self._index(day)
+        return bits >> index << index if index > 0 else bits
+
+    def _last_day(self, bits, today):
+        bits = self._through(bits, today)
+        return self.start + timedelta(days=bits.bit_length() - 1) if bits else None
+
+    def current_streak(self, today):
+        """Completed days back from today, as the row-based walk counts them
+
+        The walk stops at a missed entry or at the second untracked day; the
+        first one (normally today, not tracked yet) is let through.
+        """
+        if self.start is None or self._index(today) < 0:
+            return 0
+        days = (1 << (self._index(today) + 1)) - 1
+        missed = self.has_entry & ~self.completed & days
+        untracked = ~self.has_entry & days
+        if untracked:
+            untracked ^= 1 << (untracked.bit_length() - 1)
+        stop = max(missed.bit_length(), untracked.bit_length())
+        return ((self.completed & days) >> stop).bit_count()
+
+    def longest_streak(self):
+        """Most completed entries in a row; untracked days don't break a run"""
+        # One hex digit per day (0 untracked, 2 missed, 3 completed): with the
+        # untracked days dropped, the longest run of 3s is the streak
+        days = format(2 * _spread(self.has_entry) + _spread(self.completed), 'x').replace('0', '')
+        return max(map(len, days.split('2')))
+
+    def counts(self, since=None):
+        """(completed, entries) for days from `since` on, or overall"""
+        has_entry, completed = self.has_entry, self.completed
+        if since is not None and self.start is not None:
+            has_entry, completed = self._since(has_entry, since), self._since(completed, since)
+        return completed.bit_count(), has_entry.bit_count()
+
+    def weekday_counts(self):
+        """[completed, entries] per weekday, Monday first"""
+        counts = [[0, 0] for _ in range(7)]
+        if self.start is None:
+            return counts
+        mask = _every_seventh(max(self.has_entry.bit_length(), 1))
+        for offset in range(7):
+            weekday = (self.start + timedelta(days=offset)).weekday()
+            counts[weekday] = [((self.completed >> offset) & mask).bit_count(),
+                               ((self.has_entry >> offset) & mask).bit_count()]
+        return counts
+
+    def stats(self, habit_id, today, windows):
+        """The habit_stats row for this history, as stats._compute_habit_stats makes it"""
+        total_completed, total_entries = self.counts()
+        row = {
+            'habit_id': habit_id,
+            'stats_date': today,
+            'current_streak': self.current_streak(today),
+            'longest_streak': self.longest_streak(),
+            'last_completed_date': self._last_day(self.completed, today) if self.start else None,
+            'last_entry_date': self._last_day(self.has_entry, today) if self.start else None,
+            'total_completed': total_completed,
+            'total_entries': total_entries,
+        }
+        for days in windows:
+            row[f'completed_{days}d'], row[f'entries_{days}d'] = self.counts(today - timedelta(days=days))
+        return row
+
+def _load_years(habit_ids, conn):
+    """{habit_id: {year: (has_entry bits, completed bits)}} for the habits that have bitmap rows"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT habit_id, year, has_entry, completed FROM habit_bitmaps
+        WHERE habit_id = ANY(%s)
+    ''', (list(habit_ids),))
+    years_by_habit = {}
+    for row in cursor.fetchall():
+        years_by_habit.setdefault(row['habit_id'], {})[row['year']] = (
+            int.from_bytes(row['has_entry'], 'little'),
+            int.from_bytes(row['completed'], 'little'),
+        )
+    return years_by_habit
+
+def load_histories(habit_ids, conn):
+    """{habit_id: HabitHistory} for the habits that have bitmap rows"""
+    return {habit_id: HabitHistory.from_years(years)
+            for habit_id, years in _load_years(habit_ids, conn).items()}
+
+def update_habit_bitmaps(cells_by_habit, conn):
+    """Set the bits of changed cells in the habits' bitmap rows (no commit)
+
+    `cells_by_habit` maps habit_id -> {date: new state}. Only habits that
+    already have bitmap rows are updated, since a partial set of rows would
+    read as a shorter history; returns {habit_id: HabitHistory} for those.
+    """
+    years_by_habit = _load_years(cells_by_habit, conn)
+    rows = []
+    for habit_id, years in years_by_habit.items():
+        changed_years = set()
+        for day, state in cells_by_habit[habit_id].items():
+            bit = 1 << (day.timetuple().tm_yday - 1)
+            has_entry, completed = years.get(day.year, (0, 0))
+            has_entry = has_entry | bit if state != 'empty' else has_entry & ~bit
+            completed = completed | bit if state == 'completed' else completed & ~bit
+            years[day.year] = (has_entry, completed)
+            changed_years.add(day.year)
+        rows.extend(
+            (habit_id, year, years[year][0].to_bytes(YEAR_BYTES, 'little'),
+             years[year][1].to_bytes(YEAR_BYTES, 'little'))
+            for year in sorted(changed_years)
+        )
+    if rows:
+        execute_values(conn.cursor(), '''
+            INSERT INTO habit_bitmaps (habit_id, year, has_entry, completed) VALUES %s
+            ON CONFLICT (habit_id, year) DO UPDATE
+            SET has_entry = EXCLUDED.has_entry, completed = EXCLUDED.completed
+        ''', rows)
+    return {habit_id: HabitHistory.from_years(years) for habit_id, years in years_by_habit.items()}
+
+def write_habit_bitmaps(entries_by_habit, conn):
+    """Replace the bitmap rows of these habits from their entries (no commit)"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM habit_bitmaps WHERE habit_id = ANY(%s)', (list(entries_by_habit),))
+    rows = [
+        (habit_id, year, has_entry.to_bytes(YEAR_BYTES, 'little'), completed.to_bytes(YEAR_BYTES, 'little'))
+        for habit_id, entries in entries_by_habit.items()
+        for year, (has_entry, completed) in encode_entries(entries).items()
+    ]
+    if rows:
+        execute_values(cursor, '''
+            INSERT INTO habit_bitmaps (habit_id, year, has_entry, completed) VALUES %s
+        ''', rows)
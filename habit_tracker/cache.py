@@ -0,0 +1,225 @@
+"""Result cache for computed page payloads
+
+Backends share one small interface (get/set/delete/stats). Values are
+pickled so the memory backend can bound its size in bytes and both
+backends hand out private copies.
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+
+from . import queries
+
+logger = logging.getLogger(__name__)
+
+class NullCache:
+    """Cache that never stores anything (CACHE_BACKEND=none)"""
+
+    stores = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = snapshot['hits'] / lookups if lookups else 0.0
+        snapshot['backend'] = type(self).__name__
+        return snapshot
+
+class MemoryCache(NullCache):
+    """In-process LRU cache with per-entry TTL, bounded by entry count and bytes"""
+
+    stores = True
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, default_ttl=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            payload = entry[1]
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl=None):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, payload)
+            self._bytes += len(payload)
+            self._stats['sets'] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self):
+        snapshot = super().stats()
+        with self._lock:
+            snapshot.update({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            })
+        return snapshot
+
+class RedisCache(NullCache):
+    """Cache in a Redis-compatible server, shared by every worker (needs `redis`)"""
+
+    stores = True
+
+    def __init__(self, url, default_ttl=300, prefix='habit-tracker:'):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            payload = self._client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning("Cache get error: %s", e)
+            self._count('errors')
+            payload = None
+        if payload is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl=None):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        try:
+            self._client.set(self.prefix + key, payload, ex=int(ttl or self.default_ttl))
+            self._count('sets')
+        except Exception as e:
+            logger.warning("Cache set error: %s", e)
+            self._count('errors')
+
+    def delete(self, key):
+        try:
+            self._client.delete(self.prefix + key)
+        except Exception as e:
+            logger.warning("Cache delete error: %s", e)
+            self._count('errors')
+
+def create_cache(config):
+    """Build the cache backend named by CACHE_BACKEND"""
+    backend = config['CACHE_BACKEND']
+    if backend == 'memory':
+        return MemoryCache(
+            max_entries=config['CACHE_MAX_ENTRIES'],
+            max_bytes=config['CACHE_MAX_BYTES'],
+            default_ttl=config['CACHE_TTL'],
+        )
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], default_ttl=config['CACHE_TTL'])
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend!r}")
+
+def get_cache():
+    """The current app's cache"""
+    return current_app.extensions['cache']
+
+def page_key(kind, user_id, today, data_version, variant=None):
+    """Cache key for a computed page payload
+
+    data_version changes on every write to the user's habits or entries,
+    so a write makes the old key unreachable in every worker at once; the
+    date rolls streaks and windows over at midnight. `variant` tells apart
+    payloads of one kind, such as heatmap ranges.
+    """
+    key = f'{kind}:{user_id}:{today.isoformat()}:{data_version}'
+    return f'{key}:{variant}' if variant else key
+
+PAGE_KINDS = ('dashboard', 'analytics')
+
+def invalidate_user(user_id, data_version, today):
+    """Drop a user's cached pages for a superseded data_version
+
+    The version bump alone already hides them; deleting frees the space now
+    instead of waiting for eviction or TTL. Variant payloads are left to
+    eviction, since their keys aren't known here.
+    """
+    cache = get_cache()
+    for kind in PAGE_KINDS:
+        cache.delete(page_key(kind, user_id, today, data_version))
+
+def cached_page(kind, user_id, conn, compute, variant=None, data_version=None):
+    """Page payload from the cache, or compute(user_id, conn) and cache it
+
+    Costs one primary-key lookup for the user's data_version on a hit, or
+    none when the caller already read it or no cache is configured.
+    Payloads flagged 'stale' aren't cached, since the same data_version
+    will have a fresh one once its job has run.
+    """
+    cache = get_cache()
+    if not cache.stores:
+        cache.get(None)  # counted as a miss
+        return compute(user_id, conn)
+    today = datetime.now().date()
+    if data_version is None:
+        data_version = queries.get_data_version(user_id, conn)
+    key = page_key(kind, user_id, today, data_version, variant)
+    payload = cache.get(key)
+    if payload is None:
+        payload = compute(user_id, conn)
+        if not payload.get('stale'):
+            cache.set(key, payload)
+    return payload
+
+def init_app(app):
+    """Create the cache backend configured for this app"""
+    app.extensions['cache'] = create_cache(app.config)
@@ -0,0 +1,59 @@
+"""gzip/brotli compression of buffered responses
+
+Streamed responses are left alone so they keep flowing as they are
+produced. Brotli is used when the optional `brotli` package is installed
+and the client accepts it; gzip otherwise.
+"""
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a request's Accept-Encoding"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'])
+
+def compress_response(response):
+    """after_request hook: compress large textual responses the client can decode"""
+    config = current_app.config
+    if (response.status_code < 200 or response.status_code >= 300
+            or response.status_code == 204
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+
+    # Whether or not this one is compressed, the body depends on Accept-Encoding
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(compress(data, encoding, config))
+    response.headers['Content-Encoding'] = encoding
+    # Strong validators describe the uncompressed bytes
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    """Compress responses of this app"""
+    app.after_request(compress_response)
@@ -0,0 +1,103 @@
+import os
+
+class Config:
+    """Default settings, read from the environment"""
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
+
+    # Supabase connection - get from environment variable
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+
+    # Read replicas for read-only pages and APIs (comma separated); a user's reads stay on the
+    # primary for READ_YOUR_WRITES_SECONDS after they write, and a failed replica is skipped for
+    # REPLICA_RETRY_AFTER seconds
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL', '')
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+    REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', 30))
+
+    # Connection pool settings
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_MAX_USES = int(os.environ.get('DB_POOL_MAX_USES', 500))
+    DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get('DB_POOL_HEALTHCHECK_AFTER', 30))
+
+    # habit_entries partitions (after `flask partition-entries`): month or quarter,
+    # created this many months ahead
+    PARTITION_INTERVAL = os.environ.get('PARTITION_INTERVAL', 'month')
+    PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+
+    # Keep per-habit, per-year completion bitmaps next to habit_entries (run `flask rebuild-bitmaps`
+    # after turning this on, or after turning it back on)
+    BITMAP_STORE = os.environ.get('BITMAP_STORE', 'false').lower() in ('1', 'true', 'yes')
+
+    # Background jobs: precompute analytics after writes (JOB_DEBOUNCE_SECONDS later, once per
+    # burst) and nightly at JOB_NIGHTLY_HOUR, on JOB_WORKERS threads per process (0 to leave the
+    # queue to `flask run-jobs`); failures retry after JOB_RETRY_BACKOFF seconds, doubling
+    BACKGROUND_JOBS = os.environ.get('BACKGROUND_JOBS', 'false').lower() in ('1', 'true', 'yes')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+    JOB_DEBOUNCE_SECONDS = float(os.environ.get('JOB_DEBOUNCE_SECONDS', 30))
+    JOB_NIGHTLY_HOUR = int(os.environ.get('JOB_NIGHTLY_HOUR', 0))
+    JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 30))
+
+    # Live weekly grid updates over /events (Server-Sent Events fed by LISTEN/NOTIFY). Serve
+    # them with GUNICORN_WORKER_CLASS=gevent, as render.yaml does (see gunicorn.conf.py). LISTEN
+    # needs a session-mode connection: point LIVE_LISTEN_URL past a transaction-mode pooler
+    # (Supabase port 5432, not 6543). Each process holds at most LIVE_MAX_STREAMS streams. Under
+    # gevent a stream is a greenlet, bounded by worker_connections; under gthread every stream
+    # holds one of GUNICORN_THREADS, so by default at most half of them may stream
+    LIVE_UPDATES = os.environ.get('LIVE_UPDATES', 'false').lower() in ('1', 'true', 'yes')
+    LIVE_LISTEN_URL = os.environ.get('LIVE_LISTEN_URL')
+    LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS') or (
+        int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+        if os.environ.get('GUNICORN_WORKER_CLASS', 'gthread') in ('gevent', 'eventlet')
+        else int(os.environ.get('GUNICORN_THREADS', 4)) // 2
+    ))
+    LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', 20))
+    LIVE_STREAM_SECONDS = float(os.environ.get('LIVE_STREAM_SECONDS', 300))
+
+    # Page payload cache: memory (per-process LRU), redis or none
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Sessions: cookie (signed cookie holds the data), memory (this process only) or database
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')
+    SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', 30))
+    SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 10000))
+
+    # Password hashing: werkzeug method string (pbkdf2:<hash>:<iterations> or scrypt:<n>:<r>:<p>),
+    # run on PASSWORD_HASH_WORKERS threads per process with at most PASSWORD_HASH_QUEUE waiting
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+
+    # Largest request body accepted (bulk imports)
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+
+    # Rows per server-side cursor fetch when streaming exports
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 5000))
+
+    # Logging and per-request instrumentation
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    SLOW_REQUEST_QUERIES = int(os.environ.get('SLOW_REQUEST_QUERIES', 25))
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+
+    # /metrics, /pool_stats and /cache_stats answer requests from MONITORING_ALLOWED_IPS (addresses
+    # or networks, comma separated; loopback by default) or with `Authorization: Bearer
+    # <MONITORING_TOKEN>`. Behind a proxy the client address is the proxy's: set a token
+    MONITORING_TOKEN = os.environ.get('MONITORING_TOKEN', '')
+    MONITORING_ALLOWED_IPS = os.environ.get('MONITORING_ALLOWED_IPS', '127.0.0.1,::1')
+
+    # Response compression (brotli when the `brotli` package is installed, else gzip)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    COMPRESS_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript')
@@ -0,0 +1,598 @@
+import logging
+import os
+import re
+import threading
+import time
+
+import click
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from flask import current_app, has_request_context, request, session
+
+from . import metrics
+from .instrumentation import InstrumentedCursor
+
+logger = logging.getLogger(__name__)
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+class PooledConnection:
+    """Connection borrowed from the pool - close() hands it back instead of disconnecting"""
+
+    def __init__(self, pool, conn, replica=False):
+        self._pool = pool
+        self._conn = conn
+        self.replica = replica
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.putconn(self._conn)
+            self._conn = None
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool with health checks and recycling"""
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=5, max_uses=500,
+                 healthcheck_after=30, cursor_factory=InstrumentedCursor):
+        self.dsn = dsn
+        self.cursor_factory = cursor_factory
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.healthcheck_after = healthcheck_after
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, uses, last_used)]
+        self._in_use = {}  # id(conn) -> uses
+        self._size = 0
+        self._stats = {
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'connections_failed_healthcheck': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+        for _ in range(min(min_size, self.max_size)):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                logger.warning("Could not pre-fill connection pool: %s", e)
+                break
+            self._size += 1
+            self._idle.append((conn, 0, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=self.cursor_factory)
+        self._stats['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        """Cheap checks always, a round-trip ping only for long-idle connections"""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Borrow a connection, waiting at most `timeout` seconds for one to free up"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhaustedError(
+                            f"No database connection available after {self.timeout}s "
+                            f"({self._size}/{self.max_size} in use)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, uses, last_used = self._idle.pop()
+                else:
+                    # Reserve a slot, then connect outside the lock
+                    self._size += 1
+                    conn, uses, last_used = None, 0, None
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, last_used):
+                self._discard(conn)
+                with self._cond:
+                    self._stats['connections_failed_healthcheck'] += 1
+                    self._size -= 1
+                    self._cond.notify()
+                continue
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._in_use[id(conn)] = uses + 1
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+            return conn
+
+    def putconn(self, conn):
+        """Return a connection, rolling back leftovers and recycling worn-out ones"""
+        with self._cond:
+            uses = self._in_use.pop(id(conn), self.max_uses)
+
+        worn_out = uses >= self.max_uses
+        keep = not conn.closed and not worn_out
+        if keep:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        if not keep:
+            self._discard(conn)
+
+        with self._cond:
+            if keep:
+                self._idle.append((conn, uses, time.monotonic()))
+            else:
+                self._size -= 1
+                if worn_out:
+                    self._stats['connections_recycled'] += 1
+            self._cond.notify()
+
+    def stats(self):
+        """Snapshot of pool usage for monitoring"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        checkouts = snapshot['checkouts']
+        snapshot['wait_time_avg'] = snapshot['wait_time_total'] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+class ReplicaSet:
+    """One pool per read replica, used round-robin
+
+    A replica that fails to hand out a connection is skipped for
+    `retry_after` seconds, then tried again.
+    """
+
+    def __init__(self, dsns, retry_after=30, **pool_options):
+        self.pid = os.getpid()
+        self.retry_after = retry_after
+        self.pools = [ConnectionPool(dsn, **pool_options) for dsn in dsns]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down_until = [0.0] * len(self.pools)
+
+    def getconn(self):
+        """(pool, connection) from the next replica that answers, or (None, None)"""
+        with self._lock:
+            first = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        for step in range(len(self.pools)):
+            index = (first + step) % len(self.pools)
+            if self._down_until[index] > time.monotonic():
+                continue
+            pool = self.pools[index]
+            try:
+                return pool, pool.getconn()
+            except PoolExhaustedError as e:
+                logger.warning("Replica %d busy: %s", index, e)
+            except Exception as e:
+                logger.warning("Replica %d unavailable for %ss: %s", index, self.retry_after, e)
+                self._down_until[index] = time.monotonic() + self.retry_after
+        return None, None
+
+    def stats(self):
+        now = time.monotonic()
+        return [dict(pool.stats(), up=int(self._down_until[index] <= now)) for index, pool in enumerate(self.pools)]
+
+    def closeall(self):
+        for pool in self.pools:
+            pool.closeall()
+
+_pool_lock = threading.Lock()
+
+def _pool_options(config):
+    return {
+        'min_size': config['DB_POOL_MIN_SIZE'],
+        'max_size': config['DB_POOL_MAX_SIZE'],
+        'timeout': config['DB_POOL_TIMEOUT'],
+        'max_uses': config['DB_POOL_MAX_USES'],
+        'healthcheck_after': config['DB_POOL_HEALTHCHECK_AFTER'],
+    }
+
+def get_pool():
+    """The current app's connection pool, created lazily
+    
+    Re-created when the process id changes so a forked worker never reuses
+    its parent's sockets.
+    """
+    app = current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool(app.config['DATABASE_URL'], **_pool_options(app.config))
+                app.extensions['db_pool'] = pool
+    return pool
+
+def read_urls(config):
+    """Replica connection strings from DATABASE_READ_URL (comma or whitespace separated)"""
+    return [url for url in re.split(r'[\s,]+', config['DATABASE_READ_URL'] or '') if url]
+
+def get_replicas():
+    """The current app's ReplicaSet, or None without DATABASE_READ_URL; per process like get_pool()"""
+    app = current_app._get_current_object()
+    replicas = app.extensions.get('db_replicas')
+    if replicas is None or replicas.pid != os.getpid():
+        urls = read_urls(app.config)
+        if not urls:
+            return None
+        with _pool_lock:
+            replicas = app.extensions.get('db_replicas')
+            if replicas is None or replicas.pid != os.getpid():
+                replicas = ReplicaSet(urls, retry_after=app.config['REPLICA_RETRY_AFTER'],
+                                      **_pool_options(app.config))
+                app.extensions['db_replicas'] = replicas
+    return replicas
+
+def get_db_connection():
+    """Borrow a connection to Supabase PostgreSQL from the pool (close() returns it)"""
+    if not current_app.config['DATABASE_URL']:
+        logger.error("No DATABASE_URL configured")
+        return None
+        
+    started = time.perf_counter()
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except PoolExhaustedError as e:
+        metrics.DB_ACQUIRE_FAILURES.inc(('exhausted',))
+        logger.error("Database pool exhausted: %s", e)
+        return None
+    except Exception as e:
+        metrics.DB_ACQUIRE_FAILURES.inc(('error',))
+        logger.error("Database connection error: %s", e)
+        return None
+    metrics.DB_ACQUIRE.observe(time.perf_counter() - started)
+    return PooledConnection(pool, conn)
+
+# Session key holding the time until which the user's reads stay on the primary
+PRIMARY_PIN_KEY = '_read_primary_until'
+
+def pinned_to_primary():
+    """True while the current user's recent write may not have reached the replicas"""
+    return has_request_context() and session.get(PRIMARY_PIN_KEY, 0) > time.time()
+
+def get_read_connection():
+    """Borrow a connection for read-only work: a replica when one is configured and up
+    
+    Falls back to the primary when every replica is down, and for
+    READ_YOUR_WRITES_SECONDS after the user's last write so they see
+    their own changes despite replication lag. Replicas are read-only, so
+    nothing done on the connection may write.
+    """
+    replicas = get_replicas() if current_app.config['DATABASE_URL'] else None
+    if replicas is None:
+        return get_db_connection()
+    if pinned_to_primary():
+        metrics.DB_READS.inc(('primary_pinned',))
+        return get_db_connection()
+    
+    started = time.perf_counter()
+    pool, conn = replicas.getconn()
+    if conn is None:
+        metrics.DB_READS.inc(('primary_fallback',))
+        return get_db_connection()
+    metrics.DB_ACQUIRE.observe(time.perf_counter() - started)
+    metrics.DB_READS.inc(('replica',))
+    return PooledConnection(pool, conn, replica=True)
+
+def pin_after_write(response):
+    """after_request hook: keep a user who just changed something on the primary for a while"""
+    if (request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400
+            and 'user_id' in session and read_urls(current_app.config)):
+        session[PRIMARY_PIN_KEY] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+    return response
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Arbitrary constant for pg_advisory_lock so concurrent workers migrate one at a time
+MIGRATION_LOCK_ID = 7316001
+
+# First line of migrations that build or drop indexes CONCURRENTLY. Those can't run in a
+# transaction, so each statement runs on its own, and only `flask migrate` applies them:
+# the first request of a worker skips them rather than build indexes while serving
+ONLINE_MARKER = '-- migrate: online'
+
+def is_online(sql):
+    return sql.lstrip().startswith(ONLINE_MARKER)
+
+def split_statements(sql):
+    """The statements of a migration without comment lines; no semicolons inside statements"""
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+def load_migrations():
+    """Ordered [(version, name, sql)] from migrations/NNNN_name.sql"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith('.sql'):
+            continue
+        version, _, name = filename[:-len('.sql')].partition('_')
+        with open(os.path.join(MIGRATIONS_DIR, filename)) as f:
+            migrations.append((int(version), name, f.read()))
+    return migrations
+
+def _lock_migrations(conn):
+    """Take the session-level migration lock, polling outside any transaction
+
+    A session blocked in pg_advisory_lock holds a snapshot, which a
+    concurrent index build in the lock holder would wait on forever.
+    """
+    cursor = conn.cursor()
+    while True:
+        cursor.execute('SELECT pg_try_advisory_lock(%s) AS locked', (MIGRATION_LOCK_ID,))
+        locked = cursor.fetchone()['locked']
+        conn.commit()
+        if locked:
+            return
+        time.sleep(0.5)
+
+def _apply_online(version, name, sql, conn):
+    """Run an online migration statement by statement, outside a transaction"""
+    conn.commit()
+    conn.set_session(autocommit=True)
+    try:
+        cursor = conn.cursor()
+        for statement in split_statements(sql):
+            cursor.execute(statement)
+        cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)', (version, name))
+    finally:
+        conn.set_session(autocommit=False)
+
+def apply_migrations(conn, include_online=True):
+    """Apply pending migrations in order, each in its own transaction
+    
+    Returns the list of versions applied. Safe to run repeatedly and from
+    several processes at once. With include_online=False, online migrations
+    are left pending.
+    """
+    _lock_migrations(conn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        
+        cursor.execute('SELECT version FROM schema_migrations')
+        applied_versions = {row['version'] for row in cursor.fetchall()}
+        
+        applied = []
+        for version, name, sql in load_migrations():
+            if version in applied_versions:
+                continue
+            if is_online(sql):
+                if include_online:
+                    logger.info("Applying online migration %04d_%s...", version, name)
+                    _apply_online(version, name, sql, conn)
+                    applied.append(version)
+                continue
+            logger.info("Applying migration %04d_%s...", version, name)
+            try:
+                cursor.execute(sql)
+                cursor.execute(
+                    'INSERT INTO schema_migrations (version, name) VALUES (%s, %s)',
+                    (version, name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+        return applied
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+        conn.commit()
+
+def init_db():
+    """Initialize database by applying pending migrations"""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("Could not connect to database for initialization")
+        return False
+    
+    try:
+        applied = apply_migrations(conn)
+        if applied:
+            logger.info("Applied %d migrations", len(applied))
+        else:
+            logger.info("Database schema is up to date")
+        return True
+        
+    except Exception:
+        logger.exception("Database initialization error")
+        return False
+    finally:
+        conn.close()
+
+@click.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema"""
+    if not init_db():
+        raise click.ClickException('Database initialization failed')
+
+@click.command('migrate')
+def migrate_command():
+    """Apply pending database migrations"""
+    if not init_db():
+        raise click.ClickException('Migration failed')
+
+# Representative hot-path queries for check-indexes, with sample parameters
+INDEX_CHECK_QUERIES = [
+    ('active habits', '''
+        SELECT id, name, category FROM habits WHERE user_id = %s AND active = true
+    ''', (1,)),
+    ('entry window', '''
+        SELECT he.habit_id, he.date, he.completed
+        FROM habit_entries he
+        JOIN habits h ON he.habit_id = h.id
+        WHERE h.user_id = %s AND he.date >= CURRENT_DATE - 30 AND h.active = true
+    ''', (1,)),
+    ('weekly grid', '''
+        SELECT habit_id, date, completed
+        FROM habit_entries
+        WHERE habit_id IN (SELECT id FROM habits WHERE user_id = %s AND active = true)
+        AND date BETWEEN CURRENT_DATE - 6 AND CURRENT_DATE
+    ''', (1,)),
+    ('habit history', '''
+        SELECT habit_id, date, completed FROM habit_entries
+        WHERE habit_id = ANY(%s)
+        ORDER BY habit_id, date
+    ''', ([1, 2, 3],)),
+    ('habit stats', '''
+        SELECT h.id, hs.* FROM habits h
+        LEFT JOIN habit_stats hs ON hs.habit_id = h.id
+        WHERE h.user_id = %s AND h.active = true
+    ''', (1,)),
+]
+
+def _seq_scans(plan):
+    """Relations read by sequential scan anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        scans.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        scans.extend(_seq_scans(child))
+    return scans
+
+@click.command('check-indexes')
+def check_indexes_command():
+    """EXPLAIN the hot-path queries and fail if any must scan a table sequentially"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    
+    try:
+        cursor = conn.cursor()
+        # Small tables make seq scans cheapest; disable them to prove an index path exists
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        failures = 0
+        for label, sql, params in INDEX_CHECK_QUERIES:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+            scans = _seq_scans(plan)
+            if scans:
+                failures += 1
+                print(f"❌ {label}: sequential scan on {', '.join(scans)}")
+            else:
+                print(f"✅ {label}: index scans only")
+        conn.rollback()
+        if failures:
+            raise click.ClickException(f'{failures} queries cannot use an index')
+    finally:
+        conn.close()
+
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Apply migrations lazily, at most once per process
+    
+    Costs one SELECT on the first request of a worker when the schema is
+    current; DDL only runs when a deployment ships new migrations, and
+    never for online ones, which are left to `flask migrate`.
+    """
+    app = current_app._get_current_object()
+    if app.extensions.get('schema_ready') or not app.config['DATABASE_URL']:
+        return
+    
+    with _schema_lock:
+        if app.extensions.get('schema_ready'):
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('SELECT version FROM schema_migrations')
+                applied_versions = {row['version'] for row in cursor.fetchall()}
+            except psycopg2.errors.UndefinedTable:
+                applied_versions = set()
+            conn.rollback()
+            
+            pending = [(version, sql) for version, _, sql in load_migrations() if version not in applied_versions]
+            online = [version for version, sql in pending if is_online(sql)]
+            if len(online) < len(pending):
+                logger.info("Applying migrations %s...", [version for version, _ in pending if version not in online])
+                apply_migrations(conn, include_online=False)
+            if online:
+                logger.warning("Online migrations %s are pending; run `flask migrate` to apply them", online)
+            app.extensions['schema_ready'] = True
+        except Exception:
+            logger.exception("Schema readiness check failed")
+        finally:
+            conn.close()
+
+def init_app(app):
+    """Register the schema readiness check and database CLI commands"""
+    app.before_request(ensure_schema)
+    app.after_request(pin_after_write)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(check_indexes_command)
@@ -0,0 +1,131 @@
+"""Streaming CSV/NDJSON export of a user's habits and entries
+
+Entries are read through a server-side cursor and written out batch by
+batch from a generator, so an export holds one batch in memory however
+long the user's history is.
+
+Entry exports are ordered by (date, habit_id) and resumable: pass the
+last row received as ?after=YYYY-MM-DD:habit_id (or a bare date to start
+after that whole day) and the stream picks up from the next row. Resumed
+CSV streams leave out the header so they can be appended to the partial
+file.
+
+An export that fails partway must not read as a finished one. NDJSON
+streams end with an {"error": ..., "resume_after": ...} line, and either
+format is then cut off without the end of its chunked body, so clients
+see a broken transfer rather than a short 200.
+"""
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, session
+
+from . import queries
+from .db import get_read_connection
+
+bp = Blueprint('exports', __name__, url_prefix='/export')
+
+logger = logging.getLogger(__name__)
+
+ENTRY_FIELDS = ('date', 'habit_id', 'habit_name', 'category', 'completed')
+HABIT_FIELDS = ('id', 'name', 'description', 'category', 'active', 'created_at')
+
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def format_rows(rows, fields, fmt, header=False):
+    """One chunk of CSV or NDJSON text for a batch of rows"""
+    if fmt == 'ndjson':
+        return ''.join(json.dumps({field: _value(row[field]) for field in fields}) + '\n' for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(fields)
+    writer.writerows([_value(row[field]) for field in fields] for row in rows)
+    return buffer.getvalue()
+
+def parse_after(value):
+    """(after_date, after_habit_id) from an ?after= cursor; raises ValueError if malformed"""
+    if not value:
+        return None, None
+    date_str, _, habit_id = value.partition(':')
+    after_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    return after_date, int(habit_id) if habit_id else None
+
+def _attachment(body, fmt, name):
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(body, mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/entries.<fmt>')
+def export_entries(fmt):
+    """Stream every entry of the user's habits"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    if fmt not in MIMETYPES:
+        return jsonify({'success': False, 'error': 'Unknown format'}), 404
+
+    try:
+        after_date, after_habit_id = parse_after(request.args.get('after'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor, expected YYYY-MM-DD[:habit_id]'}), 400
+
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Database error'}), 503
+
+    user_id = session['user_id']
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    after = request.args.get('after')
+
+    def generate():
+        # Runs after the view returns; the server-side cursor is closed here
+        # when the stream ends or the client goes away
+        resume_after = after
+        batches = queries.iter_export_entries(user_id, after_date, after_habit_id, conn, batch_size)
+        try:
+            if fmt == 'csv' and after_date is None:
+                yield format_rows([], ENTRY_FIELDS, fmt, header=True)
+            for rows in batches:
+                yield format_rows(rows, ENTRY_FIELDS, fmt)
+                resume_after = f"{rows[-1]['date'].isoformat()}:{rows[-1]['habit_id']}"
+        except Exception:
+            logger.exception("Export error")
+            if fmt == 'ndjson':
+                yield json.dumps({'error': 'Export failed', 'resume_after': resume_after}) + '\n'
+            # The status line has gone out, so the server aborting the response is the signal left
+            raise
+        finally:
+            batches.close()
+
+    response = _attachment(generate(), fmt, 'habit-entries')
+    # The server closes the response even when the body is never iterated
+    # (HEAD, a client gone before the first chunk), so return the connection there
+    response.call_on_close(conn.close)
+    return response
+
+@bp.route('/habits.<fmt>')
+def export_habits(fmt):
+    """All of the user's habits, active or not"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    if fmt not in MIMETYPES:
+        return jsonify({'success': False, 'error': 'Unknown format'}), 404
+
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Database error'}), 503
+
+    try:
+        habits = queries.list_habits(session['user_id'], conn)
+        return _attachment(format_rows(habits, HABIT_FIELDS, fmt, header=True), fmt, 'habits')
+    except Exception:
+        logger.exception("Export error")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+    finally:
+        conn.close()
@@ -0,0 +1,105 @@
+"""Compact habits x days grid of entry states for the weekly view and heatmap"""
+from base64 import b64encode
+from datetime import date, timedelta
+
+# Cell values; 'empty' means no habit_entries row
+EMPTY, COMPLETED, MISSED = 0, 1, 2
+STATE_NAMES = ('empty', 'completed', 'missed')
+
+# Cell value -> ASCII bit, for building bitsets with int(digits, 2)
+_HAS_ENTRY_DIGITS = bytes.maketrans(b'\x00\x01\x02', b'011')
+_COMPLETED_DIGITS = bytes.maketrans(b'\x00\x01\x02', b'010')
+
+# Heatmap range kinds and their length in months
+HEATMAP_RANGES = {'month': 1, 'quarter': 3, 'year': 12}
+
+class HabitGrid:
+    """habits x days matrix of tri-state cells stored row-major in one bytearray
+
+    Built in one pass over the query rows using date ordinals, so no date
+    formatting or dict lookups happen per cell. Row and column totals come
+    from bytes.count() over row slices and strided column slices, which run
+    in C and stay linear in the number of cells for any range length.
+    """
+
+    def __init__(self, habit_ids, start_date, days):
+        self.habit_ids = list(habit_ids)
+        self.start_date = start_date
+        self.days = days
+        self.cells = bytearray(len(self.habit_ids) * days)
+        self._rows = {habit_id: index for index, habit_id in enumerate(self.habit_ids)}
+
+    @classmethod
+    def from_entries(cls, habit_ids, start_date, days, entries):
+        """Grid filled from (habit_id, date, completed) rows; others are ignored"""
+        grid = cls(habit_ids, start_date, days)
+        start = start_date.toordinal()
+        for entry in entries:
+            row = grid._rows.get(entry['habit_id'])
+            column = entry['date'].toordinal() - start
+            if row is None or not 0 <= column < days:
+                continue
+            grid.cells[row * days + column] = COMPLETED if entry['completed'] else MISSED
+        return grid
+
+    def dates(self):
+        return [self.start_date + timedelta(days=i) for i in range(self.days)]
+
+    def row(self, index):
+        return self.cells[index * self.days:(index + 1) * self.days]
+
+    def column(self, index):
+        return self.cells[index::self.days]
+
+    @staticmethod
+    def _summary(cells):
+        completed = cells.count(COMPLETED)
+        total = len(cells) - cells.count(EMPTY)  # cells without an entry don't count
+        return {
+            'success_rate': round((completed / total * 100) if total > 0 else 0),
+            'completed': completed,
+            'total': total
+        }
+
+    def row_summaries(self):
+        """Per-habit {success_rate, completed, total} over the whole range"""
+        return [self._summary(self.row(i)) for i in range(len(self.habit_ids))]
+
+    def column_summaries(self):
+        """Per-day {success_rate, completed, total} across habits"""
+        return [self._summary(self.column(j)) for j in range(self.days)]
+
+    def row_states(self, index):
+        """State names for one habit's cells, in date order"""
+        return [STATE_NAMES[value] for value in self.row(index)]
+
+    def row_bitsets(self, index):
+        """(has_entry, completed) bitsets for one habit, base64 encoded
+
+        Bit i (least significant first within each byte) is day start_date + i,
+        so a year is 46 bytes per bitset however many entries it holds.
+        """
+        row = self.row(index)
+        size = (self.days + 7) // 8
+        return tuple(
+            b64encode(int(row.translate(digits)[::-1] or b'0', 2).to_bytes(size, 'little')).decode('ascii')
+            for digits in (_HAS_ENTRY_DIGITS, _COMPLETED_DIGITS)
+        )
+
+def week_range(week_offset, weeks, today):
+    """(start, days) of the `weeks`-long range starting on the Monday `week_offset` weeks from this one"""
+    week_start = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+    return week_start, 7 * weeks
+
+def _add_months(first_of_month, months):
+    month_index = first_of_month.year * 12 + first_of_month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def heatmap_range(kind, offset, today):
+    """(start, end) of the month, quarter or year `offset` periods from today's"""
+    months = HEATMAP_RANGES[kind]
+    # Align to calendar periods: month 1, quarter 1/4/7/10, year 1
+    first_month = (today.month - 1) // months * months + 1
+    start = _add_months(date(today.year, first_month, 1), offset * months)
+    end = _add_months(start, months) - timedelta(days=1)
+    return start, end
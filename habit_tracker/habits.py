@@ -0,0 +1,198 @@
+import logging
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+
+from . import queries
+from .cache import invalidate_user
+from .db import get_db_connection, get_read_connection
+from .importer import IMPORT_FORMATS, decode_lines, detect_format, import_entries
+from .jobs import enqueue_user_refresh
+from .live import notify_changes
+
+bp = Blueprint('habits', __name__)
+
+logger = logging.getLogger(__name__)
+
+@bp.route('/habits')
+def habits():
+    """Manage habits page"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    conn = get_read_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('tracking.dashboard'))
+    
+    try:
+        user_id = session['user_id']
+        
+        habits_raw = queries.list_habits(user_id, conn)
+        
+        # Convert RealDictRow objects to regular dictionaries
+        habits = []
+        for habit in habits_raw:
+            habit_dict = dict(habit)
+            habits.append(habit_dict)
+        
+        logger.debug("Habits route: found %d habits for user %s", len(habits), user_id)
+        
+        return render_template('habits.html', habits=habits)
+        
+    except Exception:
+        logger.exception("Habits route error")
+        flash('Error loading habits.', 'error')
+        return redirect(url_for('tracking.dashboard'))
+    finally:
+        conn.close()
+
+@bp.route('/add_habit', methods=['GET', 'POST'])
+def add_habit():
+    """Add new habit"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        category = request.form.get('category', '').strip()
+        
+        if not name or not category:
+            flash('Habit name and category are required!', 'error')
+            return render_template('add_habit.html')
+        
+        conn = get_db_connection()
+        if not conn:
+            flash('Database error.', 'error')
+            return render_template('add_habit.html')
+        
+        try:
+            queries.insert_habit(session['user_id'], name, description, category, conn)
+            data_version = queries.bump_data_version(session['user_id'], conn)
+            enqueue_user_refresh(session['user_id'], conn)
+            notify_changes(session['user_id'], data_version, conn)
+            conn.commit()
+            invalidate_user(session['user_id'], data_version - 1, datetime.now().date())
+            flash('Habit added successfully!', 'success')
+            return redirect(url_for('habits.habits'))
+            
+        except Exception:
+            flash('Error adding habit.', 'error')
+            logger.exception("Add habit error")
+        finally:
+            conn.close()
+    
+    return render_template('add_habit.html')
+
+@bp.route('/edit_habit/<int:habit_id>', methods=['GET', 'POST'])
+def edit_habit(habit_id):
+    """Edit existing habit"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('habits.habits'))
+    
+    try:
+        # Get habit details
+        habit_raw = queries.get_habit(habit_id, session['user_id'], conn)
+        
+        if not habit_raw:
+            flash('Habit not found!', 'error')
+            return redirect(url_for('habits.habits'))
+        
+        # Convert to regular dictionary
+        habit = dict(habit_raw)
+        
+        if request.method == 'POST':
+            name = request.form.get('name', '').strip()
+            description = request.form.get('description', '').strip()
+            category = request.form.get('category', '').strip()
+            active = request.form.get('active') == 'on'
+            
+            if not name or not category:
+                flash('Habit name and category are required!', 'error')
+                return render_template('edit_habit.html', habit=habit)
+            
+            queries.update_habit(habit_id, session['user_id'], name, description, category, active, conn)
+            data_version = queries.bump_data_version(session['user_id'], conn)
+            enqueue_user_refresh(session['user_id'], conn)
+            notify_changes(session['user_id'], data_version, conn)
+            conn.commit()
+            invalidate_user(session['user_id'], data_version - 1, datetime.now().date())
+            
+            flash('Habit updated successfully!', 'success')
+            return redirect(url_for('habits.habits'))
+        
+        return render_template('edit_habit.html', habit=habit)
+        
+    except Exception:
+        flash('Error editing habit.', 'error')
+        logger.exception("Edit habit error")
+        return redirect(url_for('habits.habits'))
+    finally:
+        conn.close()
+
+@bp.route('/import', methods=['POST'])
+def import_habit_entries():
+    """Bulk import entries from an uploaded file, or a CSV/NDJSON request body
+    
+    File uploads from the habits page get a flash message; API clients
+    posting the data as the body get the import report as JSON.
+    """
+    upload = request.files.get('file')
+    wants_json = upload is None
+    
+    if 'user_id' not in session:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Not logged in'}), 401
+        return redirect(url_for('auth.login'))
+    
+    fmt = request.args.get('format') or request.form.get('format')
+    if upload is not None:
+        if not upload.filename:
+            flash('Choose a CSV or NDJSON file to import.', 'error')
+            return redirect(url_for('habits.habits'))
+        fmt = fmt or detect_format(upload.filename, upload.mimetype)
+        stream = upload.stream
+    else:
+        fmt = fmt or detect_format(mimetype=request.mimetype)
+        stream = request.stream
+    if fmt not in IMPORT_FORMATS:
+        error = f'Unknown format: {fmt}'
+        if wants_json:
+            return jsonify({'success': False, 'error': error}), 400
+        flash(error, 'error')
+        return redirect(url_for('habits.habits'))
+    
+    conn = get_db_connection()
+    if not conn:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Database error'}), 503
+        flash('Database error.', 'error')
+        return redirect(url_for('habits.habits'))
+    
+    try:
+        lines = decode_lines(stream)
+        report = import_entries(session['user_id'], lines, fmt, conn)
+        
+        if wants_json:
+            return jsonify(dict(report, success=True))
+        
+        flash(f"Imported {report['rows_imported']} entries from {report['rows_read']} rows.", 'success')
+        if report['rows_rejected']:
+            first = report['rejects'][0]
+            flash(f"Skipped {report['rows_rejected']} invalid rows (line {first['line']}: {first['error']}).", 'warning')
+        return redirect(url_for('habits.habits'))
+        
+    except Exception:
+        logger.exception("Import error")
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Server error'}), 500
+        flash('Error importing entries.', 'error')
+        return redirect(url_for('habits.habits'))
+    finally:
+        conn.close()
@@ -0,0 +1,270 @@
+"""Bulk import of historical entries from CSV or NDJSON
+
+Rows name their habit by habit_id or habit_name (the columns /export
+writes, so an export can be imported back). Ownership is checked once
+against the user's habits, valid rows are staged with COPY into a temp
+table and merged into habit_entries with one INSERT ... ON CONFLICT, all
+in a single transaction. Bad rows are reported and skipped; they never
+abort the rest of the load.
+"""
+import csv
+import io
+import json
+import tempfile
+import time
+from datetime import datetime
+
+import click
+
+from . import queries
+from .cache import invalidate_user
+from .db import get_db_connection
+from .jobs import enqueue_user_refresh
+from .live import notify_changes
+from .stats import refresh_habit_stats
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Rejected rows listed individually in a report; the rest are only counted
+MAX_REPORTED_REJECTS = 100
+
+# Staged rows stay in memory up to this size, then spill to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+COMPLETED_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True, 'completed': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False, 'missed': False,
+}
+
+# What decode_lines() decodes bytes that aren't UTF-8 to
+INVALID_TEXT = '\ufffd'
+
+class ImportRowError(ValueError):
+    """A row that can't be imported; the message says why"""
+
+def detect_format(filename=None, mimetype=None):
+    """'csv' or 'ndjson' from a file name or content type (csv when unsure)"""
+    if (filename or '').lower().endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return 'csv'
+
+def decode_lines(stream):
+    """Text lines from the bytes of an import file
+
+    Undecodable bytes become U+FFFD instead of failing the whole file, and
+    read_rows() rejects the rows they land in.
+    """
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+def read_rows(lines, fmt):
+    """Yield (line_number, row dict) from CSV (with a header) or NDJSON lines
+
+    Unparseable lines and rows with undecodable bytes come through as
+    (line_number, ImportRowError).
+    """
+    if fmt == 'csv':
+        yield from _read_csv_rows(lines)
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if INVALID_TEXT in line:
+            yield line_number, ImportRowError('Invalid UTF-8')
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('not an object')
+        except ValueError as e:
+            yield line_number, ImportRowError(f'Invalid JSON: {e}')
+            continue
+        yield line_number, row
+
+def _read_csv_rows(lines):
+    # The reader's line_num isn't always moved on when it raises, so errors
+    # are reported at the last line it pulled instead
+    pulled = [0]
+
+    def count(line):
+        pulled[0] += 1
+        return line
+
+    reader = csv.DictReader(map(count, lines))
+    try:
+        if reader.fieldnames is None:
+            return
+    except csv.Error as e:
+        # Without a header no row can be read
+        yield pulled[0], ImportRowError(f'Invalid CSV header: {e}')
+        return
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader starts over on the next line
+            yield pulled[0], ImportRowError(f'Invalid CSV: {e}')
+            continue
+        if any(INVALID_TEXT in value for value in row.values() if isinstance(value, str)):
+            yield reader.line_num, ImportRowError('Invalid UTF-8')
+            continue
+        yield reader.line_num, row
+
+def _habit_lookup(user_id, conn):
+    """(owned habit ids, casefolded name -> id) for all of the user's habits"""
+    habits = queries.list_habits(user_id, conn)
+    by_name = {}
+    # Active habits win over archived ones with the same name
+    for habit in sorted(habits, key=lambda habit: habit['active']):
+        by_name[habit['name'].strip().casefold()] = habit['id']
+    return {habit['id'] for habit in habits}, by_name
+
+def parse_row(row, owned_ids, by_name):
+    """(habit_id, date, completed) for a row, or raise ImportRowError"""
+    habit_id = row.get('habit_id')
+    habit_name = row.get('habit_name', row.get('habit'))
+    if habit_id not in (None, ''):
+        # NDJSON true and 1.5 would pass int() as 1
+        if isinstance(habit_id, (bool, float)):
+            raise ImportRowError(f'Invalid habit_id: {habit_id!r}')
+        try:
+            habit_id = int(habit_id)
+        except (TypeError, ValueError):
+            raise ImportRowError(f'Invalid habit_id: {habit_id!r}')
+        if habit_id not in owned_ids:
+            raise ImportRowError(f'Unknown habit_id: {habit_id}')
+    elif habit_name not in (None, ''):
+        habit_id = by_name.get(str(habit_name).strip().casefold())
+        if habit_id is None:
+            raise ImportRowError(f'Unknown habit: {habit_name!r}')
+    else:
+        raise ImportRowError('Missing habit_id or habit_name')
+
+    try:
+        date = datetime.strptime(str(row.get('date') or '').strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ImportRowError(f"Invalid date: {row.get('date')!r}, expected YYYY-MM-DD")
+
+    completed = row.get('completed')
+    if not isinstance(completed, bool):
+        completed = COMPLETED_VALUES.get(str(completed).strip().lower())
+        if completed is None:
+            raise ImportRowError(f"Invalid completed value: {row.get('completed')!r}")
+
+    return habit_id, date, completed
+
+def stage_rows(rows, owned_ids, by_name, staging):
+    """Write valid rows to `staging` as COPY-ready CSV
+
+    Returns (read, staged, rejected habit ids, rejects) where rejects lists
+    up to MAX_REPORTED_REJECTS {line, error} dicts.
+    """
+    writer = csv.writer(staging, lineterminator='\n')
+    read = staged = 0
+    habit_ids = set()
+    rejects = []
+    for line_number, row in rows:
+        read += 1
+        try:
+            if isinstance(row, ImportRowError):
+                raise row
+            habit_id, date, completed = parse_row(row, owned_ids, by_name)
+        except ImportRowError as e:
+            if len(rejects) < MAX_REPORTED_REJECTS:
+                rejects.append({'line': line_number, 'error': str(e)})
+            continue
+        writer.writerow((habit_id, date.isoformat(), 't' if completed else 'f'))
+        habit_ids.add(habit_id)
+        staged += 1
+    return read, staged, habit_ids, rejects
+
+def merge_staged(staging, conn):
+    """COPY staged rows into a temp table and upsert them into habit_entries
+
+    Later rows for the same (habit_id, date) win. Returns the number of
+    entries inserted or updated. Runs in the caller's transaction.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE import_entries (
+            seq BIGSERIAL,
+            habit_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            completed BOOLEAN NOT NULL
+        ) ON COMMIT DROP
+    ''')
+    staging.seek(0)
+    cursor.copy_expert('COPY import_entries (habit_id, date, completed) FROM STDIN WITH (FORMAT csv)', staging)
+    cursor.execute('''
+        INSERT INTO habit_entries (habit_id, date, completed)
+        SELECT DISTINCT ON (habit_id, date) habit_id, date, completed
+        FROM import_entries
+        ORDER BY habit_id, date, seq DESC
+        ON CONFLICT (habit_id, date) DO UPDATE SET completed = EXCLUDED.completed
+    ''')
+    return cursor.rowcount
+
+def import_entries(user_id, lines, fmt, conn):
+    """Import entries for a user from an iterable of text lines (commits)
+
+    Returns a report: rows read, imported and rejected, the first rejects
+    with their line numbers, and throughput.
+    """
+    started = time.perf_counter()
+    owned_ids, by_name = _habit_lookup(user_id, conn)
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+', newline='') as staging:
+        read, staged, habit_ids, rejects = stage_rows(read_rows(lines, fmt), owned_ids, by_name, staging)
+        imported = 0
+        if staged:
+            try:
+                # Lock the habits before writing, as the grid does, so a concurrent toggle can't deadlock the merge
+                queries.lock_habits(habit_ids, conn)
+                imported = merge_staged(staging, conn)
+                # Keep the summary rows and data version in step with the entries, in the same transaction
+                refresh_habit_stats(habit_ids, conn)
+                data_version = queries.bump_data_version(user_id, conn)
+                enqueue_user_refresh(user_id, conn)
+                notify_changes(user_id, data_version, conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            invalidate_user(user_id, data_version - 1, datetime.now().date())
+
+    seconds = time.perf_counter() - started
+    return {
+        'rows_read': read,
+        'rows_imported': imported,
+        'rows_rejected': read - staged,
+        'rejects': rejects,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(read / seconds) if seconds > 0 else read,
+    }
+
+@click.command('import-entries')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='User whose habits the rows belong to.')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Input format (default: from the file extension).')
+def import_entries_command(path, user_id, fmt):
+    """Bulk import habit entries from a CSV or NDJSON file"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        with decode_lines(open(path, 'rb')) as lines:
+            report = import_entries(user_id, lines, fmt or detect_format(path), conn)
+        for reject in report['rejects']:
+            print(f"⚠️  Line {reject['line']}: {reject['error']}")
+        print(f"✅ Imported {report['rows_imported']} of {report['rows_read']} rows "
+              f"({report['rows_rejected']} rejected) in {report['seconds']}s, "
+              f"{report['rows_per_sec']} rows/sec")
+    finally:
+        conn.close()
+
+def init_app(app):
+    """Register the import CLI command"""
+    app.cli.add_command(import_entries_command)
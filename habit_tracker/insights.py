@@ -0,0 +1,371 @@
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from psycopg2.extras import Json
+
+from . import queries
+from .grid import HabitGrid
+from .jobs import job
+from .stats import get_habit_stats
+
+logger = logging.getLogger(__name__)
+
+# Job kind that stores the analytics payload in user_analytics
+ANALYTICS_JOB = 'analytics'
+
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+def _rate(completed, total):
+    """Whole-number completion percentage, 0 when there is nothing to rate"""
+    return round((completed / total) * 100) if total > 0 else 0
+
+def compute_analytics(user_id, conn):
+    """Everything the analytics page shows, from three queries
+    
+    Streaks come from habit_stats, every windowed figure is derived from one
+    fetch of the last 30 days of entries, and lifetime figures for the
+    progress insights come from one aggregate query.
+    """
+    today = datetime.now().date()
+    thirty_days_ago = today - timedelta(days=30)
+    seven_days_ago = today - timedelta(days=7)
+    fourteen_days_ago = today - timedelta(days=14)
+    three_days_ago = today - timedelta(days=3)
+    
+    stats = get_habit_stats(user_id, conn)
+    
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT he.habit_id, he.date, he.completed
+        FROM habit_entries he
+        JOIN habits h ON he.habit_id = h.id
+        WHERE h.user_id = %s AND he.date >= %s AND h.active = true
+    ''', (user_id, thirty_days_ago))
+    entries = cursor.fetchall()
+    
+    # One pass over the window: [completed, total] counters per bucket
+    overall = [0, 0]
+    this_week = [0, 0]
+    last_week = [0, 0]
+    weekend = [0, 0]
+    weekday = [0, 0]
+    by_day = [[0, 0] for _ in DAY_NAMES]
+    by_habit = {habit_id: [0, 0] for habit_id in stats}
+    recently_tracked = set()
+    
+    for entry in entries:
+        if entry['habit_id'] not in by_habit:
+            continue  # habit deactivated between the two queries
+        done = 1 if entry['completed'] else 0
+        entry_date = entry['date']
+        day = entry_date.weekday()
+        
+        buckets = [overall, by_day[day], weekend if day >= 5 else weekday, by_habit[entry['habit_id']]]
+        if entry_date >= seven_days_ago:
+            buckets.append(this_week)
+        elif entry_date >= fourteen_days_ago:
+            buckets.append(last_week)
+        for bucket in buckets:
+            bucket[0] += done
+            bucket[1] += 1
+        
+        if entry_date >= three_days_ago:
+            recently_tracked.add(entry['habit_id'])
+    
+    best_day = None
+    rated_days = [(completed / total, DAY_NAMES[day], completed, total)
+                  for day, (completed, total) in enumerate(by_day) if total > 0]
+    if rated_days:
+        _, day_name, completed, total = max(rated_days, key=lambda day: day[0])
+        best_day = {'day': day_name, 'rate': _rate(completed, total)}
+    
+    habit_stats = []
+    for habit_id, row in stats.items():
+        completed, total = by_habit[habit_id]
+        habit_stats.append({
+            'habit': {'id': habit_id, 'name': row['name'], 'category': row['category']},
+            'current_streak': row['current_streak'],
+            'longest_streak': row['longest_streak'],
+            'completion_rate': _rate(completed, total),
+            'total_entries': total
+        })
+    
+    summary = {
+        'today': today,
+        'stats': stats,
+        'by_habit': by_habit,
+        'weekend_rate': weekend[0] / weekend[1] * 100 if weekend[1] else None,
+        'weekday_rate': weekday[0] / weekday[1] * 100 if weekday[1] else None,
+        'inactive_habits': [row['name'] for habit_id, row in stats.items()
+                            if habit_id not in recently_tracked],
+        'this_week_rate': _rate(*this_week),
+        'this_week_total': this_week[1],
+    }
+    
+    return {
+        'overall_completion_rate': _rate(*overall),
+        'best_day': best_day,
+        'week_trend': _week_trend(summary['this_week_rate'], _rate(*last_week)),
+        'this_week_rate': summary['this_week_rate'],
+        'last_week_rate': _rate(*last_week),
+        'habit_stats': habit_stats,
+        'recommendations': generate_recommendations(summary),
+        'progress_insights': generate_progress_insights(user_id, conn, summary),
+    }
+
+def load_analytics(user_id, conn):
+    """compute_analytics() payload, from user_analytics when a job already computed it
+    
+    With BACKGROUND_JOBS on that's one primary-key lookup, plus a probe of
+    the pending jobs index. A payload computed today for the user's current
+    data_version is served as is.
+    An older one is served with 'stale': True while an analytics job is
+    pending to replace it, so a write costs the page freshness for up to
+    JOB_DEBOUNCE_SECONDS plus the queue's delay rather than an inline
+    recompute. Without a pending job (none queued yet, or it failed) the
+    payload is computed inline.
+    """
+    if current_app.config['BACKGROUND_JOBS']:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT ua.payload,
+                   ua.data_version = u.data_version AND ua.computed_on = %s as fresh,
+                   EXISTS (
+                       SELECT 1 FROM jobs
+                       WHERE kind = %s AND COALESCE(user_id, 0) = ua.user_id AND status = 'pending'
+                   ) as refreshing
+            FROM user_analytics ua
+            JOIN users u ON u.id = ua.user_id
+            WHERE ua.user_id = %s
+        ''', (datetime.now().date(), ANALYTICS_JOB, user_id))
+        row = cursor.fetchone()
+        if row and row['fresh']:
+            return row['payload']
+        if row and row['refreshing']:
+            return dict(row['payload'], stale=True)
+    return compute_analytics(user_id, conn)
+
+@job(ANALYTICS_JOB, nightly=True)
+def precompute_analytics(user_id, conn):
+    """Background job: store the user's analytics payload for load_analytics()"""
+    today = datetime.now().date()
+    # Read first, so a write landing mid-compute leaves the row behind its data_version, never ahead
+    data_version = queries.get_data_version(user_id, conn)
+    payload = compute_analytics(user_id, conn)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO user_analytics (user_id, data_version, computed_on, payload)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET
+            data_version = EXCLUDED.data_version, computed_on = EXCLUDED.computed_on,
+            payload = EXCLUDED.payload, computed_at = NOW()
+    ''', (user_id, data_version, today, Json(payload)))
+
+def compute_dashboard(user_id, conn):
+    """Everything the dashboard shows: habit_stats rows plus one recent-entries query"""
+    today = datetime.now().date()
+    
+    # Per-habit summary rows instead of scanning habit_entries
+    stats = get_habit_stats(user_id, conn)
+    
+    completed_today = sum(1 for row in stats.values() if row['last_completed_date'] == today)
+    
+    # Overall completion rate (last 30 days)
+    total_entries = sum(row['entries_30d'] for row in stats.values())
+    completed_entries = sum(row['completed_30d'] for row in stats.values())
+    
+    # Count habits with active streaks (current streaks > 0)
+    active_streaks = sum(1 for row in stats.values() if row['current_streak'] > 0)
+    
+    # Get recent activity (last 7 days)
+    week_ago = today - timedelta(days=7)
+    recent_entries = [dict(entry) for entry in queries.get_recent_entries(user_id, week_ago, conn)]
+    
+    return {
+        'total_habits': len(stats),
+        'completed_today': completed_today,
+        'completion_rate': _rate(completed_entries, total_entries),
+        'active_streaks': active_streaks,
+        'recent_entries': recent_entries,
+        'today_str': today.strftime('%Y-%m-%d'),
+    }
+
+def compute_weekly(user_id, conn, week_start, days):
+    """Grid cells plus per-day and per-habit summaries for the weekly view"""
+    # Get active habits in the same order as habits page
+    habits = queries.list_active_habits(user_id, conn)
+    
+    # Get habit entries for the range, laid out as a habits x days grid
+    entries = queries.get_entries_between(user_id, week_start, week_start + timedelta(days=days - 1), conn)
+    grid = HabitGrid.from_entries([habit['id'] for habit in habits], week_start, days, entries)
+    week_dates = grid.dates()
+    
+    # Daily success rates (grid columns) and habit success rates (grid rows)
+    daily_stats = [dict(summary, date=date)
+                   for date, summary in zip(week_dates, grid.column_summaries())]
+    
+    date_strs = [date.strftime('%Y-%m-%d') for date in week_dates]
+    habit_stats = []
+    for index, (habit, summary) in enumerate(zip(habits, grid.row_summaries())):
+        summary['habit'] = dict(habit)
+        summary['cells'] = list(zip(date_strs, grid.row_states(index)))
+        habit_stats.append(summary)
+    
+    return {
+        'habits': [dict(habit) for habit in habits],
+        'week_dates': week_dates,
+        'daily_stats': daily_stats,
+        'habit_stats': habit_stats,
+    }
+
+def compute_heatmap(user_id, conn, start_date, end_date):
+    """Heatmap payload for a date range from one range query
+    
+    Each habit carries its cells as two base64 bitsets (entry_bits and
+    completed_bits, see HabitGrid.row_bitsets) plus its summary for the range.
+    """
+    rows = queries.get_active_habit_entries(user_id, start_date, end_date, conn)
+    
+    habits = {}
+    for row in rows:
+        habits.setdefault(row['habit_id'], {'id': row['habit_id'], 'name': row['name'], 'category': row['category']})
+    days = (end_date - start_date).days + 1
+    grid = HabitGrid.from_entries(habits, start_date, days, [row for row in rows if row['date'] is not None])
+    
+    habit_rows = []
+    for index, (habit, summary) in enumerate(zip(habits.values(), grid.row_summaries())):
+        entry_bits, completed_bits = grid.row_bitsets(index)
+        habit_rows.append(dict(habit, entry_bits=entry_bits, completed_bits=completed_bits, **summary))
+    
+    return {
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d'),
+        'days': days,
+        'habits': habit_rows,
+    }
+
+def _week_trend(this_week_rate, last_week_rate):
+    """Human-readable comparison of this week against last week"""
+    if this_week_rate > 0 and last_week_rate > 0:
+        difference = this_week_rate - last_week_rate
+        if difference > 0:
+            return f"↑ {difference}% improvement"
+        elif difference < 0:
+            return f"↓ {abs(difference)}% decline"
+        return "→ Same as last week"
+    elif this_week_rate > 0:
+        return f"{this_week_rate}% (new data)"
+    return "No data"
+
+def generate_recommendations(summary):
+    """Generate personalized recommendations from the compute_analytics() summary"""
+    recommendations = []
+    
+    try:
+        stats = summary['stats']
+        
+        # Habits with low completion rates (more than 5 entries in the last 30 days)
+        rated_habits = sorted(
+            ((completed / total, habit_id) for habit_id, (completed, total) in summary['by_habit'].items()
+             if total > 5),
+            key=lambda habit: habit[0]
+        )
+        for rate, habit_id in rated_habits[:2]:
+            rate = round(rate * 100)
+            if rate < 70:
+                recommendations.append(f"Focus on '{stats[habit_id]['name']}' - only {rate}% completion rate. Try setting a specific time or linking it to an existing routine.")
+        
+        # Check for weekend vs weekday patterns
+        if summary['weekend_rate'] and summary['weekday_rate']:
+            weekend_rate = round(summary['weekend_rate'])
+            weekday_rate = round(summary['weekday_rate'])
+            
+            if weekday_rate - weekend_rate > 20:
+                recommendations.append(f"Weekend performance ({weekend_rate}%) is much lower than weekdays ({weekday_rate}%). Consider adjusting weekend routines or setting reminders.")
+            elif weekend_rate - weekday_rate > 20:
+                recommendations.append(f"Great weekend consistency ({weekend_rate}%)! Try applying your weekend strategies to weekdays ({weekday_rate}%).")
+        
+        # Check for habits that haven't been tracked recently
+        if summary['inactive_habits']:
+            recommendations.append(f"Haven't tracked '{summary['inactive_habits'][0]}' recently. Consistency is key - even small steps count!")
+        
+        # Positive reinforcement for good streaks
+        max_streak = 0
+        best_habit = None
+        for row in stats.values():
+            if row['current_streak'] > max_streak:
+                max_streak = row['current_streak']
+                best_habit = row['name']
+        
+        if max_streak >= 7:
+            recommendations.append(f"Excellent! You're on a {max_streak}-day streak with '{best_habit}'. Keep the momentum going!")
+        
+        # If no specific recommendations, provide general advice
+        if not recommendations:
+            recommendations.append("You're doing well overall! Try to maintain consistency and celebrate small wins.")
+            recommendations.append("Consider adding a new habit that complements your existing ones.")
+        
+        return recommendations
+        
+    except Exception:
+        logger.exception("Recommendations error")
+        return ["Unable to generate recommendations at this time."]
+
+def generate_progress_insights(user_id, conn, summary):
+    """Generate progress insights (one lifetime aggregate query)"""
+    insights = []
+    today = summary['today']
+    
+    try:
+        cursor = conn.cursor()
+        
+        # First tracked date, that first week's results and the lifetime total together
+        cursor.execute('''
+            WITH user_entries AS (
+                SELECT he.date, he.completed FROM habit_entries he
+                JOIN habits h ON he.habit_id = h.id
+                WHERE h.user_id = %s
+            ),
+            first_entry AS (
+                SELECT MIN(date) as first_date FROM user_entries
+            )
+            SELECT 
+                f.first_date,
+                COUNT(*) FILTER (WHERE ue.date BETWEEN f.first_date AND f.first_date + 7) as first_week_total,
+                COUNT(*) FILTER (WHERE ue.date BETWEEN f.first_date AND f.first_date + 7
+                                 AND ue.completed = true) as first_week_completed,
+                COUNT(*) FILTER (WHERE ue.completed = true) as total_completed
+            FROM first_entry f
+            LEFT JOIN user_entries ue ON true
+            GROUP BY f.first_date
+        ''', (user_id,))
+        lifetime = cursor.fetchone()
+        
+        # Compare first week vs recent week
+        if lifetime and lifetime['first_date']:
+            first_week_start = lifetime['first_date'] + timedelta(days=7)
+            
+            if today > first_week_start:
+                if lifetime['first_week_total'] > 0 and summary['this_week_total'] > 0:
+                    first_rate = _rate(lifetime['first_week_completed'], lifetime['first_week_total'])
+                    recent_rate = summary['this_week_rate']
+                    
+                    if recent_rate > first_rate:
+                        insights.append(f"Great progress! Your completion rate improved from {first_rate}% in your first week to {recent_rate}% recently.")
+                    elif recent_rate == first_rate:
+                        insights.append(f"Consistent performance! You're maintaining a {recent_rate}% completion rate.")
+                    else:
+                        insights.append(f"Your completion rate was {first_rate}% initially and is {recent_rate}% recently. Consider what worked well in the beginning.")
+        
+        # Total habits completed insight
+        total_completed = lifetime['total_completed'] if lifetime else 0
+        
+        if total_completed > 0:
+            insights.append(f"You've completed {total_completed} habit tasks total - every completion builds momentum!")
+        
+        return insights
+        
+    except Exception:
+        logger.exception("Progress insights error")
+        return ["Unable to generate insights at this time."]
@@ -0,0 +1,169 @@
+"""Per-request database instrumentation
+
+Every pooled connection hands out InstrumentedCursor, which adds each
+statement's count, time and rows to the current request's RequestStats.
+After the request, one logfmt line goes to the 'habit_tracker.requests'
+logger (WARNING when the request crossed SLOW_REQUEST_MS or
+SLOW_REQUEST_QUERIES, with its slowest statement) and the totals are sent
+back in a Server-Timing header. Statements slower than SLOW_QUERY_MS are
+logged as they finish.
+
+Streamed responses are logged when the view returns, before their body
+is produced, so fetches made while streaming aren't in the totals.
+"""
+import logging
+import time
+
+from flask import current_app, g, has_app_context, request
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger('habit_tracker.requests')
+
+# Longest statement text kept for the slowest-statement report
+MAX_STATEMENT_CHARS = 200
+
+def _statement_text(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return ' '.join(str(query).split())[:MAX_STATEMENT_CHARS]
+
+class RequestStats:
+    """Database work done on behalf of one request"""
+
+    __slots__ = ('started', 'slow_query_ms', 'queries', 'db_time', 'rows', 'slowest_time', 'slowest_sql')
+
+    def __init__(self, slow_query_ms):
+        self.started = time.perf_counter()
+        self.slow_query_ms = slow_query_ms
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+
+    def record_query(self, query, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_sql = query  # formatted only if it gets reported
+        if elapsed * 1000 > self.slow_query_ms:
+            logger.warning('slow query duration_ms=%.1f sql="%s"', elapsed * 1000, _statement_text(query))
+
+    def record_fetch(self, rows, elapsed):
+        self.rows += rows
+        self.db_time += elapsed
+
+def _current_stats():
+    return g.get('db_stats') if has_app_context() else None
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that reports to the current request's RequestStats"""
+
+    def execute(self, query, vars=None):
+        stats = _current_stats()
+        if stats is None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            stats.record_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        stats = _current_stats()
+        if stats is None:
+            return super().executemany(query, vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            stats.record_query(query, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        stats = _current_stats()
+        if stats is None:
+            return super().copy_expert(sql, file, size)
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            stats.record_query(sql, time.perf_counter() - started)
+
+    # Fetches are timed too: on server-side cursors they are the round-trips
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        stats = _current_stats()
+        if stats is not None:
+            stats.record_fetch(0 if row is None else 1, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        stats = _current_stats()
+        if stats is not None:
+            stats.record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        stats = _current_stats()
+        if stats is not None:
+            stats.record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+def start_request():
+    """before_request hook: start collecting this request's stats"""
+    g.db_stats = RequestStats(current_app.config['SLOW_QUERY_MS'])
+
+def finish_request(response):
+    """after_request hook: Server-Timing header and the request log line"""
+    stats = g.pop('db_stats', None)
+    if stats is None:
+        return response
+    config = current_app.config
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.db_time * 1000
+
+    if config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    slow = total_ms > config['SLOW_REQUEST_MS'] or stats.queries > config['SLOW_REQUEST_QUERIES']
+    if slow:
+        request_logger.warning(
+            'method=%s path=%s status=%s duration_ms=%.1f db_queries=%d db_ms=%.1f db_rows=%d '
+            'slowest_ms=%.1f slow=true slowest_sql="%s"',
+            request.method, request.path, response.status_code, total_ms, stats.queries, db_ms,
+            stats.rows, stats.slowest_time * 1000, _statement_text(stats.slowest_sql or '')
+        )
+    else:
+        request_logger.info(
+            'method=%s path=%s status=%s duration_ms=%.1f db_queries=%d db_ms=%.1f db_rows=%d slowest_ms=%.1f',
+            request.method, request.path, response.status_code, total_ms, stats.queries, db_ms,
+            stats.rows, stats.slowest_time * 1000
+        )
+    return response
+
+def configure_logging(app):
+    """Send the package's log records to stderr at LOG_LEVEL
+
+    Leaves handlers alone if the host (gunicorn, tests) already set some up.
+    """
+    package_logger = logging.getLogger('habit_tracker')
+    package_logger.setLevel(app.config['LOG_LEVEL'])
+    if not package_logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        package_logger.addHandler(handler)
+
+def init_app(app):
+    """Set up logging and instrument this app's requests"""
+    configure_logging(app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
@@ -0,0 +1,333 @@
+"""Background jobs on a PostgreSQL queue
+
+With BACKGROUND_JOBS on, work that doesn't have to happen inside a
+request goes into the jobs table and is picked up by JOB_WORKERS threads
+in each app process (or by `flask run-jobs`). Workers claim jobs with
+FOR UPDATE SKIP LOCKED, so any number of them share one queue without a
+broker. A claimed job is leased for JOB_LEASE_SECONDS; if its worker
+dies the job is claimed again once the lease runs out.
+
+A failed job is retried after JOB_RETRY_BACKOFF seconds, doubling each
+time, until it has been tried max_attempts times; then it stays in the
+table as failed for `flask job-status` and `flask retry-jobs`.
+
+Only one job per kind and user can be pending, so enqueueing on every
+write of a burst queues a single run. Kinds registered with nightly=True
+are also queued for every user once a night, at JOB_NIGHTLY_HOUR.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+import psycopg2
+from flask import current_app
+
+from . import metrics
+from .db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# kind -> (handler(user_id, conn), nightly)
+HANDLERS = {}
+
+NIGHTLY_KIND = 'nightly'
+
+def job(kind, nightly=False):
+    """Register handler(user_id, conn) for jobs of `kind`; it runs in a transaction committed on return"""
+    def register(handler):
+        HANDLERS[kind] = (handler, nightly)
+        return handler
+    return register
+
+def jobs_enabled():
+    return current_app.config['BACKGROUND_JOBS']
+
+def enqueue(kind, conn, user_id=None, delay=0, run_after=None):
+    """Queue a job in the caller's transaction (no commit); a no-op if one is already pending"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (kind, user_id, run_after, max_attempts)
+        VALUES (%s, %s, COALESCE(%s, NOW() + %s * INTERVAL '1 second'), %s)
+        ON CONFLICT (kind, (COALESCE(user_id, 0))) WHERE status = 'pending' DO NOTHING
+    ''', (kind, user_id, run_after, delay, current_app.config['JOB_MAX_ATTEMPTS']))
+    return cursor.rowcount
+
+def enqueue_user_refresh(user_id, conn):
+    """Queue every per-user job after a write, JOB_DEBOUNCE_SECONDS out so a burst of writes runs them once"""
+    if not jobs_enabled():
+        return
+    for kind in HANDLERS:
+        if kind != NIGHTLY_KIND:
+            enqueue(kind, conn, user_id=user_id, delay=current_app.config['JOB_DEBOUNCE_SECONDS'])
+
+def next_nightly_run(now=None):
+    """The next JOB_NIGHTLY_HOUR o'clock, server local time"""
+    now = now or datetime.now().astimezone()
+    run_at = now.replace(hour=current_app.config['JOB_NIGHTLY_HOUR'], minute=0, second=0, microsecond=0)
+    return run_at if run_at > now else run_at + timedelta(days=1)
+
+@job(NIGHTLY_KIND)
+def run_nightly(user_id, conn):
+    """Queue the nightly kinds for every user, then the next night's run"""
+    cursor = conn.cursor()
+    for kind, (_, nightly) in HANDLERS.items():
+        if nightly:
+            cursor.execute('''
+                INSERT INTO jobs (kind, user_id, max_attempts)
+                SELECT %s, id, %s FROM users
+                ON CONFLICT (kind, (COALESCE(user_id, 0))) WHERE status = 'pending' DO NOTHING
+            ''', (kind, current_app.config['JOB_MAX_ATTEMPTS']))
+            logger.info("Queued %d nightly %s jobs", cursor.rowcount, kind)
+    enqueue(NIGHTLY_KIND, conn, run_after=next_nightly_run())
+
+def claim_job(worker_id, conn):
+    """Lease the next due job to this worker (commits); None when nothing is due"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE jobs SET
+            status = 'running', locked_by = %(worker_id)s, attempts = attempts + 1,
+            locked_until = NOW() + %(lease)s * INTERVAL '1 second'
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE (status = 'pending' AND run_after <= NOW())
+               OR (status = 'running' AND locked_until < NOW())
+            ORDER BY run_after, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, user_id, attempts, max_attempts,
+                  EXTRACT(EPOCH FROM NOW() - run_after) as delay_seconds
+    ''', {'worker_id': worker_id, 'lease': current_app.config['JOB_LEASE_SECONDS']})
+    claimed = cursor.fetchone()
+    conn.commit()
+    return claimed
+
+def finish_job(claimed, worker_id, conn):
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM jobs WHERE id = %s AND locked_by = %s', (claimed['id'], worker_id))
+    conn.commit()
+
+def fail_job(claimed, worker_id, error, conn):
+    """Put a failed job back in the queue with backoff, or mark it failed for good
+
+    Returns 'retry' or 'failed'. When a newer job of the same kind and
+    user is already pending the failed one is dropped instead: the
+    pending one redoes its work.
+    """
+    cursor = conn.cursor()
+    if claimed['attempts'] >= claimed['max_attempts']:
+        cursor.execute('''
+            UPDATE jobs SET status = 'failed', locked_by = NULL, locked_until = NULL, last_error = %s
+            WHERE id = %s AND locked_by = %s
+        ''', (error, claimed['id'], worker_id))
+        conn.commit()
+        return 'failed'
+
+    backoff = current_app.config['JOB_RETRY_BACKOFF'] * 2 ** (claimed['attempts'] - 1)
+    try:
+        cursor.execute('''
+            UPDATE jobs SET status = 'pending', locked_by = NULL, locked_until = NULL, last_error = %s,
+                run_after = NOW() + %s * INTERVAL '1 second'
+            WHERE id = %s AND locked_by = %s
+        ''', (error, backoff, claimed['id'], worker_id))
+    except psycopg2.IntegrityError:
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM jobs WHERE id = %s AND locked_by = %s', (claimed['id'], worker_id))
+    conn.commit()
+    return 'retry'
+
+def run_next_job(worker_id):
+    """Claim and run one due job; returns False when there was nothing to do"""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        claimed = claim_job(worker_id, conn)
+        if claimed is None:
+            return False
+        kind = claimed['kind']
+        metrics.JOB_DELAY.observe(max(float(claimed['delay_seconds']), 0.0), (kind,))
+
+        started = time.perf_counter()
+        try:
+            handler, _ = HANDLERS[kind]
+            handler(claimed['user_id'], conn)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            outcome = fail_job(claimed, worker_id, f'{type(e).__name__}: {e}', conn)
+            logger.exception("Job %s %s (user %s, attempt %d/%d) failed",
+                             kind, claimed['id'], claimed['user_id'], claimed['attempts'], claimed['max_attempts'])
+        else:
+            finish_job(claimed, worker_id, conn)
+            outcome = 'ok'
+        metrics.JOB_DURATION.observe(time.perf_counter() - started, (kind,))
+        metrics.JOBS.inc((kind, outcome))
+        return True
+    finally:
+        conn.close()
+
+def schedule_nightly(conn):
+    """Make sure the next nightly run is queued (commits)"""
+    enqueue(NIGHTLY_KIND, conn, run_after=next_nightly_run())
+    conn.commit()
+
+class JobRunner:
+    """Worker threads pulling jobs for one app in this process"""
+
+    def __init__(self, app, workers=1, poll_interval=5):
+        self.app = app
+        self.pid = os.getpid()
+        self.worker_id = f'{socket.gethostname()}:{self.pid}'
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._work, name=f'job-runner-{index}', daemon=True)
+            for index in range(workers)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        worker_id = f'{self.worker_id}:{threading.current_thread().name}'
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    ran = run_next_job(worker_id)
+                except Exception:
+                    logger.exception("Job runner error")
+                    ran = False
+                if not ran:
+                    self._stop.wait(self.poll_interval)
+
+_runner_lock = threading.Lock()
+
+def ensure_job_runner():
+    """before_request hook: start this process' job workers once the schema is ready"""
+    app = current_app._get_current_object()
+    runner = app.extensions.get('job_runner')
+    if (runner is not None and runner.pid == os.getpid()) or not app.extensions.get('schema_ready'):
+        return
+
+    with _runner_lock:
+        runner = app.extensions.get('job_runner')
+        if runner is not None and runner.pid == os.getpid():
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            schedule_nightly(conn)
+        except Exception:
+            conn.rollback()
+            logger.exception("Could not schedule nightly jobs")
+            return
+        finally:
+            conn.close()
+        runner = JobRunner(app, app.config['JOB_WORKERS'], app.config['JOB_POLL_INTERVAL'])
+        runner.start()
+        app.extensions['job_runner'] = runner
+        logger.info("Started %d job workers", app.config['JOB_WORKERS'])
+
+@click.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Worker threads (default JOB_WORKERS, at least 1).')
+@click.option('--drain', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def run_jobs_command(workers, drain):
+    """Work the job queue in the foreground"""
+    app = current_app._get_current_object()
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        schedule_nightly(conn)
+    finally:
+        conn.close()
+
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:cli'
+    if drain:
+        ran = 0
+        while run_next_job(worker_id):
+            ran += 1
+        print(f"✅ Ran {ran} jobs")
+        return
+
+    workers = max(workers or app.config['JOB_WORKERS'], 1)
+    runner = JobRunner(app, workers, app.config['JOB_POLL_INTERVAL'])
+    runner.start()
+    print(f"⏳ Working the job queue with {workers} threads (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        runner.stop()
+
+@click.command('job-status')
+def job_status_command():
+    """Queued, running and failed jobs by kind, with the latest failures"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT kind, status, COUNT(*) as jobs, MIN(run_after) as next_run
+            FROM jobs GROUP BY kind, status ORDER BY kind, status
+        ''')
+        for row in cursor.fetchall():
+            print(f"{row['kind']:<12} {row['status']:<8} {row['jobs']:>8}  next {row['next_run']:%Y-%m-%d %H:%M}")
+        cursor.execute('''
+            SELECT id, kind, user_id, attempts, last_error FROM jobs
+            WHERE status = 'failed' ORDER BY id DESC LIMIT 10
+        ''')
+        for row in cursor.fetchall():
+            print(f"❌ {row['kind']} {row['id']} (user {row['user_id']}, {row['attempts']} attempts): {row['last_error']}")
+    finally:
+        conn.close()
+
+@click.command('retry-jobs')
+def retry_jobs_command():
+    """Queue failed jobs again with a fresh set of attempts"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    try:
+        cursor = conn.cursor()
+        # A failed job with a pending twin is redundant
+        cursor.execute('''
+            DELETE FROM jobs failed USING jobs pending
+            WHERE failed.status = 'failed' AND pending.status = 'pending'
+            AND pending.kind = failed.kind AND COALESCE(pending.user_id, 0) = COALESCE(failed.user_id, 0)
+        ''')
+        cursor.execute('''
+            UPDATE jobs SET status = 'pending', attempts = 0, run_after = NOW()
+            WHERE id IN (
+                SELECT DISTINCT ON (kind, COALESCE(user_id, 0)) id FROM jobs
+                WHERE status = 'failed' ORDER BY kind, COALESCE(user_id, 0), id DESC
+            )
+        ''')
+        retried = cursor.rowcount
+        cursor.execute("DELETE FROM jobs WHERE status = 'failed'")
+        conn.commit()
+        print(f"✅ Queued {retried} failed jobs again")
+    finally:
+        conn.close()
+
+def init_app(app):
+    """Start job workers on first request when BACKGROUND_JOBS is on, and register the CLI commands"""
+    if app.config['BACKGROUND_JOBS'] and app.config['JOB_WORKERS'] > 0:
+        app.before_request(ensure_job_runner)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(job_status_command)
+    app.cli.add_command(retry_jobs_command)
@@ -0,0 +1,216 @@
+"""Live grid updates over Server-Sent Events
+
+Writes to a user's entries send a NOTIFY on the habit_changes channel in
+the writing transaction, so it goes out on commit and never for a rolled
+back write. Each app process holds one LISTEN connection (LiveHub) and
+fans the notifications out to the /events streams of that user open on
+the process. An open stream costs a queue and, under gthread, a thread
+parked in a wait; under the gevent worker it is a greenlet, so a process
+can hold thousands of them (see gunicorn.conf.py).
+
+Toggles carry only the cells that changed. Anything else (habits added or
+edited, imports, notifications the hub may have missed) sends `resync`,
+and the page reloads. Streams end after LIVE_STREAM_SECONDS; EventSource
+reconnects on its own, which keeps threads and connections turning over.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from flask import Blueprint, Response, current_app, jsonify, session
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'habit_changes'
+
+# NOTIFY payloads must stay under 8000 bytes; bigger changes go out as a resync
+MAX_PAYLOAD_BYTES = 7900
+
+# Events a slow stream may fall behind by before it's told to resync instead
+MAX_QUEUED_EVENTS = 100
+
+bp = Blueprint('live', __name__)
+
+def notify_changes(user_id, data_version, conn, cells=None):
+    """NOTIFY the user's open pages on commit (no commit)
+
+    `cells` is an iterable of (habit_id, date, state); without it the
+    pages resync.
+    """
+    if not current_app.config['LIVE_UPDATES']:
+        return
+    message = {'user_id': user_id, 'data_version': data_version}
+    if cells is not None:
+        message['cells'] = [[habit_id, date.strftime('%Y-%m-%d'), state] for habit_id, date, state in cells]
+    payload = json.dumps(message, separators=(',', ':'))
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        payload = json.dumps({'user_id': user_id, 'data_version': data_version}, separators=(',', ':'))
+    cursor = conn.cursor()
+    cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, payload))
+
+class Subscription:
+    """One open stream's queue of (event, data) pairs"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue(MAX_QUEUED_EVENTS)
+
+    def put(self, event, data):
+        try:
+            self.events.put_nowait((event, data))
+        except queue.Full:
+            # Dropped events can't be replayed; start the page over instead
+            with self.events.mutex:
+                self.events.queue.clear()
+            self.events.put_nowait(('resync', {}))
+
+    def get(self, timeout):
+        """The next (event, data), or None after `timeout` seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class LiveHub:
+    """A process' LISTEN connection and the streams it feeds"""
+
+    def __init__(self, dsn, reconnect_delay=5):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._thread = threading.Thread(target=self._listen, name='live-hub', daemon=True)
+        self._thread.start()
+
+    def subscribe(self, user_id, max_streams=None):
+        """A new Subscription, or None if the hub already feeds `max_streams` streams"""
+        subscription = Subscription(user_id)
+        with self._lock:
+            # Counted under the same lock as the add, so concurrent requests can't overshoot
+            if max_streams is not None and self._stream_count() >= max_streams:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def stream_count(self):
+        with self._lock:
+            return self._stream_count()
+
+    def _stream_count(self):
+        # Callers hold self._lock
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _publish(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(event, data)
+
+    def _publish_all(self, event, data):
+        with self._lock:
+            subscribers = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in subscribers:
+            subscription.put(event, data)
+
+    def _dispatch(self, payload):
+        try:
+            message = json.loads(payload)
+            user_id = message.pop('user_id')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("Ignoring malformed %s payload: %.200s", CHANNEL, payload)
+            return
+        self._publish(user_id, 'cells' if 'cells' in message else 'resync', message)
+
+    def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                conn = psycopg2.connect(self.dsn)
+            except psycopg2.Error as e:
+                logger.warning("Live updates: could not connect, retrying in %ss: %s", self.reconnect_delay, e)
+                time.sleep(self.reconnect_delay)
+                continue
+            try:
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f'LISTEN {CHANNEL}')
+                if connected_before:
+                    # Whatever was sent while we were away is lost
+                    self._publish_all('resync', {})
+                connected_before = True
+                while True:
+                    select.select([conn], [], [], 60)
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Live updates: lost the LISTEN connection, reconnecting: %s", e)
+            finally:
+                try:
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+            time.sleep(self.reconnect_delay)
+
+_hub_lock = threading.Lock()
+
+def get_hub():
+    """The current app's LiveHub in this process, started on first use"""
+    app = current_app._get_current_object()
+    hub = app.extensions.get('live_hub')
+    if hub is None or hub.pid != os.getpid():
+        with _hub_lock:
+            hub = app.extensions.get('live_hub')
+            if hub is None or hub.pid != os.getpid():
+                hub = LiveHub(app.config['LIVE_LISTEN_URL'] or app.config['DATABASE_URL'])
+                app.extensions['live_hub'] = hub
+    return hub
+
+def _event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+@bp.route('/events')
+def events():
+    """Server-Sent Events stream of the user's grid changes"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    config = current_app.config
+    if not config['LIVE_UPDATES'] or not config['DATABASE_URL']:
+        return jsonify({'success': False, 'error': 'Live updates are off'}), 404
+
+    hub = get_hub()
+    subscription = hub.subscribe(session['user_id'], config['LIVE_MAX_STREAMS'])
+    if subscription is None:
+        return jsonify({'success': False, 'error': 'Too many live streams'}), 503, {'Retry-After': '30'}
+
+    heartbeat = config['LIVE_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + config['LIVE_STREAM_SECONDS']
+
+    def generate():
+        # Runs after the view returns, with no request context
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            item = subscription.get(min(heartbeat, max(deadline - time.monotonic(), 0)))
+            yield _event(*item) if item else ': ping\n\n'
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Don't let nginx-style proxies buffer the stream
+        'X-Accel-Buffering': 'no',
+    })
+    # Runs when the server closes the response, even if the body was never iterated
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
@@ -0,0 +1,180 @@
+"""In-process Prometheus-style metrics
+
+Counters and histograms are plain dicts behind one lock each, so
+recording costs a lock and a few additions. They live in the worker
+process: with several gunicorn workers each scrape sees the worker that
+answered it, and Prometheus' rate()/sum() over instances does the rest.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Connection acquisition is usually sub-millisecond; waits show up in the upper buckets
+ACQUIRE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Background jobs wait at least JOB_DEBOUNCE_SECONDS and run for seconds to minutes
+JOB_DELAY_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 900, 3600)
+JOB_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, labels)} {value}'
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{format_labels(self.labelnames, labels, [le])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {total}'
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}'
+
+REQUESTS = Counter(
+    'habit_tracker_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = Histogram(
+    'habit_tracker_request_duration_seconds', 'Time to produce a response, by endpoint',
+    ('endpoint',))
+DB_QUERIES = Counter(
+    'habit_tracker_db_queries_total', 'Database statements executed, by endpoint', ('endpoint',))
+DB_TIME = Counter(
+    'habit_tracker_db_seconds_total', 'Time spent in database calls, by endpoint', ('endpoint',))
+DB_ACQUIRE = Histogram(
+    'habit_tracker_db_acquire_seconds', 'Time to borrow a pooled connection, including connecting',
+    buckets=ACQUIRE_BUCKETS)
+DB_ACQUIRE_FAILURES = Counter(
+    'habit_tracker_db_acquire_failures_total', 'Failed attempts to borrow a pooled connection', ('reason',))
+DB_READS = Counter(
+    'habit_tracker_db_reads_total', 'Read-only connections by where they went (with replicas configured)',
+    ('target',))
+ERRORS = Counter(
+    'habit_tracker_errors_total', 'Errors logged by the app (handled exceptions included), by endpoint and logger',
+    ('endpoint', 'logger'))
+PASSWORD_HASHES = Counter(
+    'habit_tracker_password_hashes_total', 'Password hash and verify calls, by outcome (ok or busy)',
+    ('operation', 'outcome'))
+PASSWORD_HASH_LATENCY = Histogram(
+    'habit_tracker_password_hash_seconds', 'Time to hash or verify a password, queueing included',
+    ('operation',))
+JOBS = Counter(
+    'habit_tracker_jobs_total', 'Background jobs run, by kind and outcome (ok, retry or failed)',
+    ('kind', 'outcome'))
+JOB_DURATION = Histogram(
+    'habit_tracker_job_duration_seconds', 'Time to run a background job, by kind',
+    ('kind',), buckets=JOB_DURATION_BUCKETS)
+JOB_DELAY = Histogram(
+    'habit_tracker_job_delay_seconds', 'Time a job waited past its due time before a worker claimed it',
+    ('kind',), buckets=JOB_DELAY_BUCKETS)
+
+REGISTRY = (REQUESTS, REQUEST_LATENCY, DB_QUERIES, DB_TIME, DB_ACQUIRE, DB_ACQUIRE_FAILURES, DB_READS, ERRORS,
+            PASSWORD_HASHES, PASSWORD_HASH_LATENCY, JOBS, JOB_DURATION, JOB_DELAY)
+
+def _endpoint():
+    # Unmatched URLs share one label so scanners can't inflate the series count
+    return request.endpoint or 'unmatched'
+
+class ErrorCountingHandler(logging.Handler):
+    """Counts ERROR and worse records, so every `except` branch that logs is counted"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        endpoint = _endpoint() if has_request_context() else 'none'
+        ERRORS.inc((endpoint, record.name))
+
+def start_timer():
+    """before_request hook"""
+    g.metrics_started = time.perf_counter()
+
+def record_request(response):
+    """after_request hook: count the request and observe its latency and DB use"""
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+    REQUEST_LATENCY.observe(time.perf_counter() - started, (endpoint,))
+    stats = g.get('db_stats')
+    if stats is not None and stats.queries:
+        DB_QUERIES.inc((endpoint,), stats.queries)
+        DB_TIME.inc((endpoint,), stats.db_time)
+    return response
+
+def render(extra_families=()):
+    """Registry plus (name, kind, help, [(labels dict, value)]) families as exposition text"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    for name, kind, documentation, samples in extra_families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            lines.append(f'{name}{format_labels(labels.keys(), labels.values())} {value}')
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    """Record request metrics for this app and count logged errors"""
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    package_logger = logging.getLogger('habit_tracker')
+    if not any(isinstance(handler, ErrorCountingHandler) for handler in package_logger.handlers):
+        package_logger.addHandler(ErrorCountingHandler())
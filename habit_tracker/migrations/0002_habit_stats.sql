@@ -0,0 +1,19 @@
+-- Per-habit summary rows maintained by refresh_habit_stats()
+
+CREATE TABLE IF NOT EXISTS habit_stats (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits(id),
+    stats_date DATE NOT NULL,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_completed_date DATE,
+    last_entry_date DATE,
+    total_completed INTEGER NOT NULL DEFAULT 0,
+    total_entries INTEGER NOT NULL DEFAULT 0,
+    completed_7d INTEGER NOT NULL DEFAULT 0,
+    entries_7d INTEGER NOT NULL DEFAULT 0,
+    completed_14d INTEGER NOT NULL DEFAULT 0,
+    entries_14d INTEGER NOT NULL DEFAULT 0,
+    completed_30d INTEGER NOT NULL DEFAULT 0,
+    entries_30d INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,14 @@
+-- migrate: online
+-- Indexes for the dashboard, weekly view, analytics and habit_stats queries. Built
+-- CONCURRENTLY so writes carry on meanwhile; `flask migrate` applies them. A build that
+-- fails leaves an invalid index behind, so each one is dropped first and re-run is safe.
+-- Date-window scans per habit need nothing new: UNIQUE (habit_id, date) already covers them
+
+-- Habits of a user: every page filters on user_id, most of them with active = true too
+DROP INDEX CONCURRENTLY IF EXISTS idx_habits_user_id;
+CREATE INDEX CONCURRENTLY idx_habits_user_id ON habits (user_id);
+
+-- Completed entries only: completed counts and last completed date
+DROP INDEX CONCURRENTLY IF EXISTS idx_habit_entries_completed;
+CREATE INDEX CONCURRENTLY idx_habit_entries_completed
+    ON habit_entries (habit_id, date) WHERE completed;
@@ -0,0 +1,3 @@
+-- Bumped on every write to a user's habits or entries; keys cached pages
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
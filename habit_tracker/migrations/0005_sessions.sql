@@ -0,0 +1,15 @@
+-- Server-side sessions (SESSION_BACKEND=database); the cookie only carries the id
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Revoking all of a user's sessions
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions (user_id);
+
+-- Purging expired sessions
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
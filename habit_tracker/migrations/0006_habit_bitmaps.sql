@@ -0,0 +1,9 @@
+-- Per-habit, per-year completion bitmaps (BITMAP_STORE), rewritten by refresh_habit_stats()
+
+CREATE TABLE IF NOT EXISTS habit_bitmaps (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    year SMALLINT NOT NULL,
+    has_entry BYTEA NOT NULL,
+    completed BYTEA NOT NULL,
+    PRIMARY KEY (habit_id, year)
+);
@@ -0,0 +1,30 @@
+-- Background job queue (BACKGROUND_JOBS) and the analytics payloads it precomputes
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running or failed
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    locked_by TEXT,
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- At most one pending job per kind and user, so a burst of writes queues one refresh
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_unique
+    ON jobs (kind, (COALESCE(user_id, 0))) WHERE status = 'pending';
+
+-- Claiming the next due job
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (run_after) WHERE status = 'pending';
+
+CREATE TABLE IF NOT EXISTS user_analytics (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    data_version BIGINT NOT NULL,
+    computed_on DATE NOT NULL,
+    payload JSONB NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
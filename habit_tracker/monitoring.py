@@ -0,0 +1,104 @@
+import hmac
+import ipaddress
+import re
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from . import metrics
+from .cache import get_cache
+from .db import get_pool, get_replicas
+
+bp = Blueprint('monitoring', __name__)
+
+def _address_allowed(address, allowed):
+    """True if `address` is in one of the comma separated addresses or networks"""
+    try:
+        address = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    for entry in re.split(r'[\s,]+', allowed or ''):
+        try:
+            if entry and address in ipaddress.ip_network(entry, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+@bp.before_request
+def require_monitoring_access():
+    """Only allowed addresses, or requests bearing MONITORING_TOKEN, may read the stats"""
+    config = current_app.config
+    token = config['MONITORING_TOKEN']
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return None
+    if _address_allowed(request.remote_addr, config['MONITORING_ALLOWED_IPS']):
+        return None
+    return jsonify({'error': 'Forbidden'}), 403
+
+@bp.route('/pool_stats')
+def pool_stats():
+    """Connection pool metrics for monitoring"""
+    if not current_app.config['DATABASE_URL']:
+        return jsonify({'error': 'No DATABASE_URL configured'}), 503
+    replicas = get_replicas()
+    return jsonify(dict(get_pool().stats(), replicas=replicas.stats() if replicas else []))
+
+@bp.route('/cache_stats')
+def cache_stats():
+    """Page cache hit/miss counters and memory use"""
+    return jsonify(get_cache().stats())
+
+# (stats key, metric suffix, type, help) exported from the pool and cache snapshots
+POOL_METRICS = [
+    ('size', 'size', 'gauge', 'Open pooled connections'),
+    ('in_use', 'in_use', 'gauge', 'Connections currently borrowed'),
+    ('idle', 'idle', 'gauge', 'Idle pooled connections'),
+    ('max_size', 'max_size', 'gauge', 'Pool size limit'),
+    ('checkouts', 'checkouts_total', 'counter', 'Connections handed out'),
+    ('waits', 'waits_total', 'counter', 'Checkouts that had to wait for a free connection'),
+    ('timeouts', 'timeouts_total', 'counter', 'Checkouts that gave up waiting'),
+    ('wait_time_total', 'wait_seconds_total', 'counter', 'Time spent waiting for a free connection'),
+]
+
+REPLICA_METRICS = POOL_METRICS + [
+    ('up', 'up', 'gauge', 'Whether the replica is taking reads (0 while skipped after a failure)'),
+]
+
+CACHE_METRICS = [
+    ('hits', 'hits_total', 'counter', 'Page cache hits'),
+    ('misses', 'misses_total', 'counter', 'Page cache misses'),
+    ('sets', 'sets_total', 'counter', 'Page cache writes'),
+    ('evictions', 'evictions_total', 'counter', 'Entries evicted to stay within limits'),
+    ('errors', 'errors_total', 'counter', 'Cache backend errors'),
+    ('hit_rate', 'hit_ratio', 'gauge', 'Hits over lookups since start'),
+    ('entries', 'entries', 'gauge', 'Entries held (in-process cache only)'),
+    ('bytes', 'bytes', 'gauge', 'Bytes held (in-process cache only)'),
+]
+
+def _families(prefix, snapshot, spec, labels):
+    return [
+        (f'{prefix}_{suffix}', kind, documentation, [(labels, snapshot[key])])
+        for key, suffix, kind, documentation in spec if key in snapshot
+    ]
+
+def _labelled_families(prefix, snapshots, spec, label):
+    """Like _families() for several snapshots, one sample per snapshot labelled by its index"""
+    return [
+        (f'{prefix}_{suffix}', kind, documentation,
+         [({label: str(index)}, snapshot[key]) for index, snapshot in enumerate(snapshots)])
+        for key, suffix, kind, documentation in spec
+    ]
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Request, database, error and cache metrics in Prometheus text format"""
+    families = []
+    if current_app.config['DATABASE_URL']:
+        families += _families('habit_tracker_db_pool', get_pool().stats(), POOL_METRICS, {})
+        replicas = get_replicas()
+        if replicas:
+            families += _labelled_families('habit_tracker_db_replica', replicas.stats(), REPLICA_METRICS, 'replica')
+    cache_stats = get_cache().stats()
+    families += _families('habit_tracker_cache', cache_stats, CACHE_METRICS, {'backend': cache_stats['backend']})
+    return Response(metrics.render(families), mimetype='text/plain; version=0.0.4')
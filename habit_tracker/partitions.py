@@ -0,0 +1,331 @@
+"""Range partitioning of habit_entries by month or quarter
+
+Once partitioned, habit_entries is a parent table split on `date`, one
+partition per PARTITION_INTERVAL plus a default partition for dates
+outside them, so `date >= ...` windows only touch the partitions they
+cover. Each partition has its own (habit_id, date) key, so those indexes
+stay small too. Queries that read a habit's whole history probe every
+partition instead. The summary rows in habit_stats keep those reads rare.
+
+`flask partition-entries` converts the existing table online:
+
+1. create habit_entries_partitioned with its partitions;
+2. add a trigger that mirrors every write on habit_entries into it;
+3. copy the existing rows over in id-range batches, one transaction each;
+4. swap the names in one short transaction, keeping the old table as
+   habit_entries_unpartitioned until `--drop-old`.
+
+It can be stopped and re-run at any point before the swap. Partitions
+for the coming PARTITION_MONTHS_AHEAD months are created on the first
+request of each worker and by `flask maintain-partitions`, which can also
+run from cron.
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+
+from .db import get_db_connection
+from .grid import _add_months
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'habit_entries'
+STAGING_TABLE = 'habit_entries_partitioned'
+RETIRED_TABLE = 'habit_entries_unpartitioned'
+
+# Months per partition
+PARTITION_INTERVALS = {'month': 1, 'quarter': 3}
+
+# Arbitrary constant for pg_advisory_xact_lock so workers don't race creating partitions
+PARTITION_LOCK_ID = 7316002
+
+_BOUND_PATTERN = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+def period_start(day, interval):
+    """First day of the month or quarter containing `day`"""
+    months = PARTITION_INTERVALS[interval]
+    return day.replace(month=(day.month - 1) // months * months + 1, day=1)
+
+def partition_name(start):
+    return f'{PARENT_TABLE}_p{start:%Y_%m}'
+
+def is_partitioned(table, conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', (table,))
+    row = cursor.fetchone()
+    return row is not None and row['relkind'] == 'p'
+
+def partition_ranges(parent, conn):
+    """[(name, start, end)] of the range partitions of `parent` (the default partition left out)"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    ''', (parent,))
+    ranges = []
+    for row in cursor.fetchall():
+        match = _BOUND_PATTERN.search(row['bound'])
+        if match:
+            start, end = (datetime.strptime(value, '%Y-%m-%d').date() for value in match.groups())
+            ranges.append((row['relname'], start, end))
+    return sorted(ranges, key=lambda partition: partition[1])
+
+def ensure_partitions(parent, first_day, last_day, interval, conn):
+    """Create the missing partitions of `parent` covering first_day..last_day
+
+    Periods that overlap an existing partition (say after switching from
+    monthly to quarterly) are skipped. Returns the names created. Runs in
+    the caller's transaction.
+    """
+    months = PARTITION_INTERVALS[interval]
+    cursor = conn.cursor()
+    cursor.execute('SELECT pg_advisory_xact_lock(%s)', (PARTITION_LOCK_ID,))
+    existing = partition_ranges(parent, conn)
+
+    created = []
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        end = _add_months(start, months)
+        if not any(start < other_end and other_start < end for _, other_start, other_end in existing):
+            create_partition(parent, partition_name(start), start, end, conn)
+            created.append(partition_name(start))
+        start = end
+    return created
+
+def create_partition(parent, name, start, end, conn):
+    """Add the partition for start <= date < end
+
+    Rows for the period already in the default partition (imports of old
+    or far-future dates) are moved into the new partition first; Postgres
+    refuses to create the partition while they are there.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {PARENT_TABLE}_default WHERE date >= %s AND date < %s) AS stranded',
+        (start, end)
+    )
+    if not cursor.fetchone()['stranded']:
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)', (start, end))
+        return
+    cursor.execute(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)')
+    cursor.execute(f'''
+        WITH moved AS (
+            DELETE FROM {PARENT_TABLE}_default WHERE date >= %s AND date < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    ''', (start, end))
+    cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', (start, end))
+
+def maintain_partitions(conn, today=None):
+    """Create partitions up to PARTITION_MONTHS_AHEAD if habit_entries is partitioned (commits)"""
+    if not is_partitioned(PARENT_TABLE, conn):
+        conn.rollback()
+        return []
+    config = current_app.config
+    today = today or datetime.now().date()
+    created = ensure_partitions(
+        PARENT_TABLE, today, _add_months(today.replace(day=1), config['PARTITION_MONTHS_AHEAD']),
+        config['PARTITION_INTERVAL'], conn
+    )
+    conn.commit()
+    if created:
+        logger.info("Created partitions %s", ', '.join(created))
+    return created
+
+_maintenance_lock = threading.Lock()
+
+def ensure_partitions_ahead():
+    """before_request hook: create upcoming partitions once per process"""
+    app = current_app._get_current_object()
+    if app.extensions.get('partitions_ready') or not app.extensions.get('schema_ready'):
+        return
+
+    with _maintenance_lock:
+        if app.extensions.get('partitions_ready'):
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            maintain_partitions(conn)
+            app.extensions['partitions_ready'] = True
+        except Exception:
+            conn.rollback()
+            logger.exception("Partition maintenance failed")
+        finally:
+            conn.close()
+
+def _entries_sequence(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id') AS seq", (PARENT_TABLE,))
+    return cursor.fetchone()['seq']
+
+def create_staging_table(sequence, conn):
+    """The partitioned copy of habit_entries with its default partition and indexes"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {STAGING_TABLE} (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            habit_id INTEGER NOT NULL REFERENCES habits(id),
+            date DATE NOT NULL,
+            completed BOOLEAN NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (habit_id, date) INCLUDE (completed)
+        ) PARTITION BY RANGE (date)
+    ''')
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {PARENT_TABLE}_default PARTITION OF {STAGING_TABLE} DEFAULT')
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{PARENT_TABLE}_part_completed
+        ON {STAGING_TABLE} (habit_id, date) WHERE completed
+    ''')
+
+def install_mirror_trigger(conn):
+    """Copy every insert, update and delete on habit_entries into the staging table"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION {PARENT_TABLE}_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {STAGING_TABLE} WHERE habit_id = OLD.habit_id AND date = OLD.date;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            INSERT INTO {STAGING_TABLE} (id, habit_id, date, completed, created_at)
+            VALUES (NEW.id, NEW.habit_id, NEW.date, NEW.completed, NEW.created_at)
+            ON CONFLICT (habit_id, date) DO UPDATE SET completed = EXCLUDED.completed;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute(f'DROP TRIGGER IF EXISTS {PARENT_TABLE}_mirror ON {PARENT_TABLE}')
+    cursor.execute(f'''
+        CREATE TRIGGER {PARENT_TABLE}_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON {PARENT_TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {PARENT_TABLE}_mirror()
+    ''')
+
+def copy_batch(low, high, conn):
+    """Copy rows with low < id <= high that the staging table doesn't have yet
+
+    FOR SHARE makes a concurrent update or delete of these rows wait for the
+    copy to commit, so its mirrored change lands after it. Runs in the
+    caller's transaction; returns rows copied.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        INSERT INTO {STAGING_TABLE} (id, habit_id, date, completed, created_at)
+        SELECT id, habit_id, date, completed, created_at FROM {PARENT_TABLE}
+        WHERE id > %s AND id <= %s
+        FOR SHARE
+        ON CONFLICT (habit_id, date) DO NOTHING
+    ''', (low, high))
+    return cursor.rowcount
+
+def swap_tables(sequence, conn, lock_timeout='5s'):
+    """Put the partitioned table in habit_entries' place (commits)"""
+    cursor = conn.cursor()
+    # Give up rather than queue behind long reads, which would block every request behind us
+    cursor.execute('SET LOCAL lock_timeout = %s', (lock_timeout,))
+    cursor.execute(f'LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(f'DROP TRIGGER {PARENT_TABLE}_mirror ON {PARENT_TABLE}')
+    cursor.execute(f'DROP FUNCTION {PARENT_TABLE}_mirror()')
+    cursor.execute(f'ALTER TABLE {PARENT_TABLE} RENAME TO {RETIRED_TABLE}')
+    cursor.execute(f'ALTER TABLE {STAGING_TABLE} RENAME TO {PARENT_TABLE}')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id')
+    conn.commit()
+
+@click.command('partition-entries')
+@click.option('--batch-size', type=int, default=50000, show_default=True, help='Rows copied per transaction.')
+@click.option('--resume-from', type=int, default=0, show_default=True, help='Only copy rows with a larger id.')
+@click.option('--swap/--no-swap', default=True, show_default=True,
+              help='Swap the tables once the copy is done (--no-swap to do it later).')
+@click.option('--drop-old', is_flag=True, help='Drop habit_entries_unpartitioned left by an earlier swap.')
+def partition_entries_command(batch_size, resume_from, swap, drop_old):
+    """Convert habit_entries to a range-partitioned table without downtime"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        config = current_app.config
+        today = datetime.now().date()
+        cursor = conn.cursor()
+        if is_partitioned(PARENT_TABLE, conn):
+            created = maintain_partitions(conn, today)
+            print(f"✅ habit_entries is already partitioned ({len(created)} new partitions)")
+            if drop_old:
+                cursor.execute(f'DROP TABLE IF EXISTS {RETIRED_TABLE}')
+                conn.commit()
+                print(f"🧹 Dropped {RETIRED_TABLE}")
+            return
+
+        sequence = _entries_sequence(conn)
+        create_staging_table(sequence, conn)
+        install_mirror_trigger(conn)
+        conn.commit()
+
+        # Every id handed out before the trigger existed is at most the sequence's current value
+        cursor.execute(f'SELECT last_value FROM {sequence}')
+        last_id = cursor.fetchone()['last_value']
+        cursor.execute(f'SELECT MIN(date) AS first_day FROM {PARENT_TABLE}')
+        first_day = cursor.fetchone()['first_day'] or today
+        created = ensure_partitions(
+            STAGING_TABLE, first_day, _add_months(today.replace(day=1), config['PARTITION_MONTHS_AHEAD']),
+            config['PARTITION_INTERVAL'], conn
+        )
+        conn.commit()
+        print(f"📦 {len(created)} partitions ready; copying rows with id {resume_from + 1}..{last_id}")
+
+        started = time.perf_counter()
+        copied = 0
+        low = resume_from
+        while low < last_id:
+            high = min(low + batch_size, last_id)
+            copied += copy_batch(low, high, conn)
+            conn.commit()
+            low = high
+            print(f"   ... up to id {high} ({copied} rows, {copied / (time.perf_counter() - started):.0f} rows/sec)")
+
+        if not swap:
+            print("✅ Copy done; writes are mirrored until you run this again with --swap")
+            return
+        swap_tables(sequence, conn)
+        print(f"✅ habit_entries is now partitioned by {config['PARTITION_INTERVAL']}; "
+              f"the old table is kept as {RETIRED_TABLE}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@click.command('maintain-partitions')
+def maintain_partitions_command():
+    """Create habit_entries partitions for the coming months"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        if not is_partitioned(PARENT_TABLE, conn):
+            raise click.ClickException("habit_entries isn't partitioned; run 'flask partition-entries' first")
+        created = maintain_partitions(conn)
+        print(f"✅ {len(created)} partitions created" + (f": {', '.join(created)}" if created else ''))
+    finally:
+        conn.close()
+
+def init_app(app):
+    """Register the partition maintenance hook and CLI commands"""
+    interval = app.config['PARTITION_INTERVAL']
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"Unknown PARTITION_INTERVAL: {interval!r}, expected one of {', '.join(PARTITION_INTERVALS)}")
+    app.before_request(ensure_partitions_ahead)
+    app.cli.add_command(partition_entries_command)
+    app.cli.add_command(maintain_partitions_command)
@@ -0,0 +1,103 @@
+"""Password hashing off the request threads, with a bounded queue
+
+Hashes are deliberately slow, so a burst of logins can eat every CPU a
+worker has. Each worker process runs them on a small thread pool instead
+(hashlib's pbkdf2 and scrypt release the GIL, so the threads hash in
+parallel) and admits at most PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE
+at once; past that, callers get HasherBusy straight away and the routes
+answer 429. The routes ask busy() before borrowing a database
+connection and never hold one while a hash runs; with the default sizes,
+queued hashes could otherwise hold every connection in the pool. Hashes
+made with other parameters than PASSWORD_HASH_METHOD still verify, and
+are replaced on the next successful login.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class HasherBusy(Exception):
+    """Every hashing slot is taken; try again shortly"""
+
+def canonical_method(method):
+    """The method string werkzeug writes into hashes made with `method`
+
+    Fills in the defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1', so stored
+    hashes can be compared with the configured method.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        defaults = [str(2 ** 15), '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join([name] + args + defaults[len(args):])
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded thread pool"""
+
+    def __init__(self, method='pbkdf2:sha256:600000', salt_length=16, workers=2, queue_size=8):
+        self.method = canonical_method(method)
+        self.salt_length = salt_length
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.PASSWORD_HASHES.inc((operation, 'busy'))
+            raise HasherBusy()
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        result = future.result()
+        metrics.PASSWORD_HASHES.inc((operation, 'ok'))
+        metrics.PASSWORD_HASH_LATENCY.observe(time.perf_counter() - started, (operation,))
+        return result
+
+    def busy(self, operation):
+        """True if every slot is taken right now, so `operation` would raise HasherBusy"""
+        if not self._slots.acquire(blocking=False):
+            metrics.PASSWORD_HASHES.inc((operation, 'busy'))
+            return True
+        self._slots.release()
+        return False
+
+    def hash(self, password):
+        """A new hash of `password` with the configured parameters"""
+        return self._run('hash', generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with other parameters than configured"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+def get_hasher():
+    """The current app's password hasher"""
+    return current_app.extensions['password_hasher']
+
+def init_app(app):
+    """Create the password hashing pool for this app"""
+    config = app.config
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=config['PASSWORD_HASH_METHOD'],
+        salt_length=config['PASSWORD_SALT_LENGTH'],
+        workers=config['PASSWORD_HASH_WORKERS'],
+        queue_size=config['PASSWORD_HASH_QUEUE'],
+    )
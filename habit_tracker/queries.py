@@ -0,0 +1,340 @@
+"""Data access for users, habits and habit_entries
+
+Every function takes the connection to run on as its last argument and
+leaves committing to the caller unless noted otherwise.
+"""
+import logging
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Habit display order shared by the habits page, weekly view and analytics
+CATEGORY_ORDER_SQL = '''
+    CASE category
+        WHEN 'Health' THEN 1
+        WHEN 'Fitness' THEN 2
+        WHEN 'Learning' THEN 3
+        WHEN 'Wellness' THEN 4
+        WHEN 'Personal' THEN 5
+        ELSE 6
+    END, name
+'''
+
+SAMPLE_HABITS = [
+    ("Drink 8 glasses of water", "Stay hydrated throughout the day", "Health"),
+    ("Exercise for 30 minutes", "Daily physical activity", "Fitness"),
+    ("Read for 20 minutes", "Daily reading habit", "Learning"),
+    ("Meditate for 10 minutes", "Mindfulness and relaxation", "Wellness"),
+    ("Write in journal", "Daily reflection and thoughts", "Personal")
+]
+
+def get_user_by_username(username, conn):
+    """User row (id, username, password_hash) or None"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, username, password_hash FROM users WHERE username = %s',
+        (username,)
+    )
+    return cursor.fetchone()
+
+def create_user(username, password_hash, conn):
+    """Insert a user and return the new id"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id',
+        (username, password_hash)
+    )
+    result = cursor.fetchone()
+    return result['id'] if result else None
+
+def update_password_hash(user_id, password_hash, conn):
+    """Replace a user's password hash"""
+    cursor = conn.cursor()
+    cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s', (password_hash, user_id))
+
+def create_sample_habits(user_id, conn):
+    """Create sample habits for new users (commits)"""
+    try:
+        cursor = conn.cursor()
+        for name, description, category in SAMPLE_HABITS:
+            cursor.execute(
+                'INSERT INTO habits (user_id, name, description, category) VALUES (%s, %s, %s, %s)',
+                (user_id, name, description, category)
+            )
+        conn.commit()
+        logger.info("Sample habits created for user: %s", user_id)
+    except Exception:
+        conn.rollback()
+        logger.exception("Error creating sample habits")
+
+def get_data_version(user_id, conn):
+    """The user's data_version (0 for unknown users)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT data_version FROM users WHERE id = %s', (user_id,))
+    row = cursor.fetchone()
+    return row['data_version'] if row else 0
+
+def bump_data_version(user_id, conn):
+    """Mark the user's data as changed; returns the new data_version
+
+    Call in the same transaction as the write so readers never pair new
+    data with an old version.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE users SET data_version = data_version + 1 WHERE id = %s RETURNING data_version',
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    return row['data_version'] if row else 0
+
+def list_habits(user_id, conn):
+    """All of a user's habits, active or not, in display order"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT id, name, description, category, active, created_at
+        FROM habits
+        WHERE user_id = %s
+        ORDER BY {CATEGORY_ORDER_SQL}
+    ''', (user_id,))
+    return cursor.fetchall()
+
+def list_active_habits(user_id, conn):
+    """A user's active habits (id, name, category) in display order"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT id, name, category
+        FROM habits
+        WHERE user_id = %s AND active = true
+        ORDER BY {CATEGORY_ORDER_SQL}
+    ''', (user_id,))
+    return cursor.fetchall()
+
+def get_habit(habit_id, user_id, conn):
+    """A habit owned by the user, or None"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT * FROM habits WHERE id = %s AND user_id = %s',
+        (habit_id, user_id)
+    )
+    return cursor.fetchone()
+
+def insert_habit(user_id, name, description, category, conn):
+    """Insert a new active habit"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO habits (user_id, name, description, category) VALUES (%s, %s, %s, %s)',
+        (user_id, name, description, category)
+    )
+
+def update_habit(habit_id, user_id, name, description, category, active, conn):
+    """Update a habit owned by the user"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE habits
+        SET name = %s, description = %s, category = %s, active = %s
+        WHERE id = %s AND user_id = %s
+    ''', (name, description, category, active, habit_id, user_id))
+
+def get_entries_between(user_id, start_date, end_date, conn):
+    """Entries of the user's active habits with start_date <= date <= end_date"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT habit_id, date, completed
+        FROM habit_entries
+        WHERE habit_id IN (SELECT id FROM habits WHERE user_id = %s AND active = true)
+        AND date BETWEEN %s AND %s
+    ''', (user_id, start_date, end_date))
+    return cursor.fetchall()
+
+def get_entries_for_habits(habit_ids, conn):
+    """{habit_id: entries oldest first} with every entry of the given habits"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT habit_id, date, completed FROM habit_entries
+        WHERE habit_id = ANY(%s)
+        ORDER BY habit_id, date
+    ''', (list(habit_ids),))
+    
+    entries_by_habit = {habit_id: [] for habit_id in habit_ids}
+    for row in cursor.fetchall():
+        entries_by_habit[row['habit_id']].append(row)
+    return entries_by_habit
+
+def get_active_habit_entries(user_id, start_date, end_date, conn):
+    """Active habits in display order, each joined to its entries in the range
+
+    One row per entry (habit_id, name, category, date, completed), or one
+    row with date NULL for a habit with no entries in the range.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT h.id as habit_id, h.name, h.category, he.date, he.completed
+        FROM habits h
+        LEFT JOIN habit_entries he
+            ON he.habit_id = h.id AND he.date BETWEEN %s AND %s
+        WHERE h.user_id = %s AND h.active = true
+        ORDER BY {CATEGORY_ORDER_SQL}
+    ''', (start_date, end_date, user_id))
+    return cursor.fetchall()
+
+def get_recent_entries(user_id, since, conn):
+    """Entries since a date with their habit names, newest first"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT he.date, he.completed, h.name as habit_name
+        FROM habit_entries he
+        JOIN habits h ON he.habit_id = h.id
+        WHERE h.user_id = %s AND he.date >= %s AND h.active = true
+        ORDER BY he.date DESC, h.name
+    ''', (user_id, since))
+    return cursor.fetchall()
+
+def iter_export_entries(user_id, after_date, after_habit_id, conn, batch_size=5000):
+    """Yield lists of the user's entries, habits active or not, ordered by (date, habit_id)
+
+    Rows come from a server-side cursor `batch_size` at a time, so memory
+    stays flat however long the history is. Starts after the cursor
+    (after_date, after_habit_id): with only a date, after that whole day;
+    with neither, from the first entry.
+    """
+    cursor = conn.cursor(name=f'export_entries_{user_id}')
+    cursor.itersize = batch_size
+    try:
+        cursor.execute('''
+            SELECT he.date, he.habit_id, h.name as habit_name, h.category, he.completed
+            FROM habit_entries he
+            JOIN habits h ON he.habit_id = h.id
+            WHERE h.user_id = %(user_id)s
+            AND (%(after_date)s::date IS NULL
+                 OR he.date > %(after_date)s::date
+                 OR (he.date = %(after_date)s::date AND he.habit_id > %(after_habit_id)s))
+            ORDER BY he.date, he.habit_id
+        ''', {'user_id': user_id, 'after_date': after_date, 'after_habit_id': after_habit_id})
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+# Entry states as the weekly grid names them; 'empty' means no row. Also the
+# order toggle_entry() cycles through
+ENTRY_STATES = ('empty', 'completed', 'missed')
+
+def previous_toggle_state(status):
+    """The state toggle_entry() moved a cell from, given the status it returned"""
+    return ENTRY_STATES[ENTRY_STATES.index(status) - 1]
+
+def lock_habits(habit_ids, conn):
+    """Row-lock habits until the caller's transaction ends
+
+    Writers lock a habit before touching its entries, so the entry states
+    they read and the habit_stats they derive can't be overtaken by a
+    concurrent writer. FOR NO KEY UPDATE leaves the foreign key checks of
+    entry writes alone, and locking in id order keeps overlapping batches
+    from deadlocking.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM habits WHERE id = ANY(%s) ORDER BY id FOR NO KEY UPDATE',
+                   (sorted(habit_ids),))
+
+def get_entry_states(cells, conn):
+    """{(habit_id, date): state} for (habit_id, date) cells, 'empty' where there is no entry"""
+    states = {cell: 'empty' for cell in cells}
+    if not states:
+        return states
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT he.habit_id, he.date, he.completed
+        FROM habit_entries he
+        JOIN unnest(%s::int[], %s::date[]) AS cells(habit_id, date)
+            ON he.habit_id = cells.habit_id AND he.date = cells.date
+    ''', ([habit_id for habit_id, _ in states], [date for _, date in states]))
+    for row in cursor.fetchall():
+        states[(row['habit_id'], row['date'])] = 'completed' if row['completed'] else 'missed'
+    return states
+
+def toggle_entry(habit_id, user_id, date, conn):
+    """Cycle an entry empty -> completed -> missed -> empty in one statement
+
+    Returns the new status, or None if the habit is not an active habit of
+    the user.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        WITH habit AS (
+            SELECT id FROM habits
+            WHERE id = %(habit_id)s AND user_id = %(user_id)s AND active = true
+        ),
+        deleted AS (
+            -- missed -> empty
+            DELETE FROM habit_entries he
+            USING habit
+            WHERE he.habit_id = habit.id AND he.date = %(date)s AND he.completed = false
+            RETURNING 'empty'::text as status
+        ),
+        upserted AS (
+            -- empty -> completed, completed -> missed
+            INSERT INTO habit_entries (habit_id, date, completed)
+            SELECT habit.id, %(date)s, true FROM habit
+            WHERE NOT EXISTS (
+                SELECT 1 FROM habit_entries
+                WHERE habit_id = habit.id AND date = %(date)s AND completed = false
+            )
+            ON CONFLICT (habit_id, date) DO UPDATE SET completed = false
+            WHERE habit_entries.completed = true
+            RETURNING CASE WHEN completed THEN 'completed' ELSE 'missed' END as status
+        )
+        SELECT status FROM deleted
+        UNION ALL
+        SELECT status FROM upserted
+    ''', {'habit_id': habit_id, 'user_id': user_id, 'date': date})
+    row = cursor.fetchone()
+    return row['status'] if row else None
+
+def set_entries(user_id, changes, conn):
+    """Set many entries to a desired state in three statements
+
+    `changes` is an iterable of (habit_id, date, state) with state one of
+    ENTRY_STATES; later changes to the same cell win. Returns
+    (applied, rejected): applied maps (habit_id, date) -> state for cells of
+    the user's active habits, rejected lists the habit ids that are not.
+    """
+    desired = {}
+    for habit_id, date, state in changes:
+        desired[(habit_id, date)] = state
+    if not desired:
+        return {}, []
+
+    # Validate ownership once for every habit in the batch
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id FROM habits
+        WHERE id = ANY(%s) AND user_id = %s AND active = true
+    ''', (list({habit_id for habit_id, _ in desired}), user_id))
+    owned = {row['id'] for row in cursor.fetchall()}
+
+    applied = {cell: state for cell, state in desired.items() if cell[0] in owned}
+    rejected = sorted({habit_id for habit_id, _ in desired} - owned)
+
+    upserts = [(habit_id, date, state == 'completed')
+               for (habit_id, date), state in applied.items() if state != 'empty']
+    deletes = [(habit_id, date)
+               for (habit_id, date), state in applied.items() if state == 'empty']
+
+    if upserts:
+        execute_values(cursor, '''
+            INSERT INTO habit_entries (habit_id, date, completed) VALUES %s
+            ON CONFLICT (habit_id, date) DO UPDATE SET completed = EXCLUDED.completed
+        ''', upserts)
+    if deletes:
+        execute_values(cursor, '''
+            DELETE FROM habit_entries he
+            USING (VALUES %s) as cells(habit_id, date)
+            WHERE he.habit_id = cells.habit_id AND he.date = cells.date::date
+        ''', deletes)
+
+    return applied, rejected
@@ -0,0 +1,119 @@
+"""Synthetic users, habits and entries for benchmarking
+
+Generates N users x M habits x D days of entries ending today and loads
+them with COPY. Each habit gets its own adherence rate, streaky day-to-day
+behaviour, weaker weekends and some untracked days, so streaks, weekday
+breakdowns and windowed rates all see realistic inputs. Seeded users share
+a username prefix and the password 'benchmark'.
+"""
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from .db import get_db_connection
+from .passwords import get_hasher
+from .queries import SAMPLE_HABITS
+from .stats import refresh_habit_stats
+
+SEED_PASSWORD = 'benchmark'
+
+def habit_days(rng, days, today):
+    """Yield (date, completed) for one habit over the `days` days up to today"""
+    adherence = rng.uniform(0.35, 0.95)
+    untracked = rng.uniform(0.02, 0.2)
+    completed = rng.random() < adherence
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        if rng.random() < untracked:
+            continue
+        # Habits are sticky: yesterday's outcome pulls today's towards it
+        chance = (adherence + 1) / 2 if completed else adherence / 2
+        if day.weekday() >= 5:
+            chance *= 0.85
+        completed = rng.random() < chance
+        yield day, completed
+
+def delete_seeded(prefix, conn):
+    """Delete every user named '<prefix>_*' with their habits, entries and stats"""
+    cursor = conn.cursor()
+    seeded = "SELECT id FROM habits WHERE user_id IN (SELECT id FROM users WHERE username LIKE %(pattern)s)"
+    params = {'pattern': prefix.replace('_', r'\_') + r'\_%'}
+    cursor.execute(f'DELETE FROM habit_stats WHERE habit_id IN ({seeded})', params)
+    cursor.execute(f'DELETE FROM habit_entries WHERE habit_id IN ({seeded})', params)
+    cursor.execute('DELETE FROM habits WHERE user_id IN (SELECT id FROM users WHERE username LIKE %(pattern)s)', params)
+    cursor.execute('DELETE FROM users WHERE username LIKE %(pattern)s', params)
+    return cursor.rowcount
+
+def seed_user(username, password_hash, habits, days, rng, conn, today):
+    """Create one user with `habits` habits and their entries; returns entries written"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id',
+        (username, password_hash)
+    )
+    user_id = cursor.fetchone()['id']
+
+    habit_ids = []
+    for index in range(habits):
+        name, description, category = SAMPLE_HABITS[index % len(SAMPLE_HABITS)]
+        if index >= len(SAMPLE_HABITS):
+            name = f'{name} #{index // len(SAMPLE_HABITS) + 1}'
+        cursor.execute(
+            'INSERT INTO habits (user_id, name, description, category, created_at) VALUES (%s, %s, %s, %s, %s) RETURNING id',
+            (user_id, name, description, category, today - timedelta(days=days))
+        )
+        habit_ids.append(cursor.fetchone()['id'])
+
+    buffer = io.StringIO()
+    entries = 0
+    for habit_id in habit_ids:
+        for day, completed in habit_days(rng, days, today):
+            buffer.write(f"{habit_id},{day.isoformat()},{'t' if completed else 'f'}\n")
+            entries += 1
+    buffer.seek(0)
+    cursor.copy_expert('COPY habit_entries (habit_id, date, completed) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    refresh_habit_stats(habit_ids, conn, today)
+    return entries
+
+@click.command('seed-data')
+@click.option('--users', type=int, default=10, show_default=True, help='Users to create.')
+@click.option('--habits', type=int, default=5, show_default=True, help='Habits per user.')
+@click.option('--days', type=int, default=365, show_default=True, help='Days of history per habit.')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix for seeded users.')
+@click.option('--seed', type=int, default=42, show_default=True, help='Random seed, for repeatable data.')
+@click.option('--reset/--no-reset', default=True, show_default=True,
+              help='Delete users seeded earlier with the same prefix first.')
+def seed_data_command(users, habits, days, prefix, seed, reset):
+    """Generate synthetic users, habits and entries"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        if reset:
+            removed = delete_seeded(prefix, conn)
+            conn.commit()
+            if removed:
+                print(f"🧹 Removed {removed} previously seeded users")
+
+        rng = random.Random(seed)
+        password_hash = get_hasher().hash(SEED_PASSWORD)
+        today = datetime.now().date()
+        started = time.perf_counter()
+        entries = 0
+        for index in range(users):
+            entries += seed_user(f'{prefix}_{index}', password_hash, habits, days, rng, conn, today)
+            conn.commit()  # one transaction per user keeps each COPY bounded
+        seconds = time.perf_counter() - started
+        print(f"✅ Seeded {users} users, {users * habits} habits and {entries} entries "
+              f"in {seconds:.1f}s ({entries / seconds if seconds else entries:.0f} entries/sec)")
+    finally:
+        conn.close()
+
+def init_app(app):
+    """Register the seeding CLI command"""
+    app.cli.add_command(seed_data_command)
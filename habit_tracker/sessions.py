@@ -0,0 +1,296 @@
+"""Server-side sessions
+
+With SESSION_BACKEND=memory or database the cookie carries only a random
+session id; the session data lives in the store. That keeps the cookie the
+same size however much goes into the session, and lets sessions be revoked.
+The database store keeps an in-process read-through cache, so most requests
+read their session from memory; a revocation reaches other workers once
+their cached copy is older than SESSION_CACHE_TTL. The memory store is for
+a single process (development, one-worker deployments).
+
+A session gets a fresh id whenever the user it belongs to changes, so an
+id handed out before login is never the one that's authenticated.
+"""
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import click
+import psycopg2
+from flask import current_app
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+from .db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Session ids are secrets.token_urlsafe(32); anything longer isn't worth a lookup
+MAX_SID_LENGTH = 64
+
+# Expired sessions are swept at most this often per process, on save
+PURGE_INTERVAL = 3600
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data plus the id and expiry it was stored under"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.expires_at = expires_at
+        self.owner = self.get('user_id')
+        self.modified = False
+
+class MemorySessionStore:
+    """Sessions in a dict in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # sid -> (payload, user_id, expires_at)
+        self._purged_at = time.monotonic()
+
+    def load(self, sid):
+        """(data, expires_at) of a live session, or None"""
+        with self._lock:
+            record = self._sessions.get(sid)
+        if record is None or record[2] <= datetime.now(timezone.utc):
+            return None
+        return session_json_serializer.loads(record[0]), record[2]
+
+    def save(self, sid, data, user_id, expires_at):
+        with self._lock:
+            self._sessions[sid] = (session_json_serializer.dumps(data), user_id, expires_at)
+        self._maybe_purge()
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke_user(self, user_id):
+        """End every session of a user; returns how many"""
+        with self._lock:
+            sids = [sid for sid, record in self._sessions.items() if record[1] == user_id]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+    def purge_expired(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            expired = [sid for sid, record in self._sessions.items() if record[2] <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._purged_at < PURGE_INTERVAL:
+                return
+            self._purged_at = now
+        try:
+            removed = self.purge_expired()
+        except Exception as e:
+            logger.warning("Session purge error: %s", e)
+            return
+        if removed:
+            logger.info("Purged %d expired sessions", removed)
+
+class DatabaseSessionStore(MemorySessionStore):
+    """Sessions in the sessions table, read through a bounded in-process cache"""
+
+    def __init__(self, cache_ttl=30, cache_max_entries=10000):
+        super().__init__()
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self._cache = OrderedDict()  # sid -> (cached_until, payload, user_id, expires_at)
+
+    def _remember(self, sid, payload, user_id, expires_at):
+        with self._lock:
+            self._cache[sid] = (time.monotonic() + self.cache_ttl, payload, user_id, expires_at)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def load(self, sid):
+        with self._lock:
+            cached = self._cache.get(sid)
+            # Past either deadline, ask the database: another worker may have renewed it
+            if cached is not None and (cached[0] <= time.monotonic() or cached[3] <= datetime.now(timezone.utc)):
+                del self._cache[sid]
+                cached = None
+            if cached is not None:
+                self._cache.move_to_end(sid)
+        if cached is not None:
+            return session_json_serializer.loads(cached[1]), cached[3]
+
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT data, user_id, expires_at FROM sessions WHERE id = %s AND expires_at > NOW()',
+                (sid,)
+            )
+            row = cursor.fetchone()
+        except psycopg2.Error as e:
+            # The first request after a deploy can arrive before the sessions migration
+            logger.warning("Session load error: %s", e)
+            return None
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        self._remember(sid, row['data'], row['user_id'], row['expires_at'])
+        return session_json_serializer.loads(row['data']), row['expires_at']
+
+    def save(self, sid, data, user_id, expires_at):
+        payload = session_json_serializer.dumps(data)
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Could not connect to database to save the session')
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO sessions (id, user_id, data, expires_at) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET
+                    user_id = EXCLUDED.user_id, data = EXCLUDED.data,
+                    expires_at = EXCLUDED.expires_at, updated_at = CURRENT_TIMESTAMP
+            ''', (sid, user_id, payload, expires_at))
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(sid, payload, user_id, expires_at)
+        self._maybe_purge()
+
+    def _execute(self, sql, params=()):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Could not connect to database')
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+        self._execute('DELETE FROM sessions WHERE id = %s', (sid,))
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            for sid in [sid for sid, cached in self._cache.items() if cached[2] == user_id]:
+                del self._cache[sid]
+        return self._execute('DELETE FROM sessions WHERE user_id = %s', (user_id,))
+
+    def purge_expired(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for sid in [sid for sid, cached in self._cache.items() if cached[3] <= now]:
+                del self._cache[sid]
+        return self._execute('DELETE FROM sessions WHERE expires_at <= NOW()')
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in a store and only its id in the cookie"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and len(sid) <= MAX_SID_LENGTH:
+            record = self.store.load(sid)
+            if record is not None:
+                data, expires_at = record
+                return ServerSession(data, sid=sid, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        now = datetime.now(timezone.utc)
+        lifetime = app.permanent_session_lifetime
+        # Unchanged sessions are written back only once half their lifetime has gone
+        renew = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or renew):
+            return
+
+        sid = session.sid
+        if sid is None or session.get('user_id') != session.owner:
+            if sid is not None:
+                self.store.delete(sid)
+            sid = secrets.token_urlsafe(32)
+        self.store.save(sid, dict(session), session.get('user_id'), now + lifetime)
+        response.set_cookie(
+            name, sid, expires=self.get_expiration_time(app, session), httponly=httponly,
+            domain=domain, path=path, secure=secure, samesite=samesite,
+        )
+
+def create_session_store(config):
+    """Build the store named by SESSION_BACKEND (None for signed-cookie sessions)"""
+    backend = config['SESSION_BACKEND']
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'database':
+        return DatabaseSessionStore(
+            cache_ttl=config['SESSION_CACHE_TTL'],
+            cache_max_entries=config['SESSION_CACHE_MAX_ENTRIES'],
+        )
+    if backend == 'cookie':
+        return None
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+
+def get_session_store():
+    """The current app's session store, or None with cookie sessions"""
+    return current_app.extensions.get('session_store')
+
+def revoke_user_sessions(user_id):
+    """Log a user out everywhere; returns sessions ended (0 with cookie sessions)"""
+    store = get_session_store()
+    if store is None:
+        return 0
+    return store.revoke_user(user_id)
+
+@click.command('clear-sessions')
+@click.option('--user-id', type=int, default=None, help='End every session of this user instead.')
+def clear_sessions_command(user_id):
+    """Delete expired server-side sessions, or all of one user's"""
+    store = get_session_store()
+    if store is None:
+        raise click.ClickException('SESSION_BACKEND=cookie keeps no sessions on the server')
+    if user_id is not None:
+        print(f"✅ Ended {store.revoke_user(user_id)} sessions of user {user_id}")
+    else:
+        print(f"✅ Deleted {store.purge_expired()} expired sessions")
+
+def init_app(app):
+    """Use the configured server-side session store, if any"""
+    store = create_session_store(app.config)
+    app.extensions['session_store'] = store
+    if store is not None:
+        app.session_interface = ServerSessionInterface(store)
+    app.cli.add_command(clear_sessions_command)
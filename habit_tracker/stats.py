@@ -0,0 +1,418 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from psycopg2.extras import execute_values
+
+from .bitmaps import load_histories, update_habit_bitmaps, write_habit_bitmaps
+from .db import get_db_connection
+from .queries import CATEGORY_ORDER_SQL, get_entries_for_habits, lock_habits
+from .streaks import _current_streak_from_entries, _longest_streak_from_entries
+
+# Rolling windows kept in habit_stats, in days back from stats_date
+STATS_WINDOWS = (7, 14, 30)
+
+HABIT_STATS_COLUMNS = (
+    'habit_id', 'stats_date', 'current_streak', 'longest_streak',
+    'last_completed_date', 'last_entry_date', 'total_completed', 'total_entries',
+    'completed_7d', 'entries_7d', 'completed_14d', 'entries_14d',
+    'completed_30d', 'entries_30d',
+)
+
+def _compute_habit_stats(habit_id, entries, today):
+    """Full habit_stats row from a habit's entries ordered oldest first"""
+    past_entries = [entry for entry in reversed(entries) if entry['date'] <= today]
+    stats = {
+        'habit_id': habit_id,
+        'stats_date': today,
+        'current_streak': _current_streak_from_entries(past_entries, today),
+        'longest_streak': _longest_streak_from_entries(entries),
+        'last_completed_date': next((e['date'] for e in past_entries if e['completed']), None),
+        'last_entry_date': past_entries[0]['date'] if past_entries else None,
+        'total_completed': sum(1 for e in entries if e['completed']),
+        'total_entries': len(entries),
+    }
+    for days in STATS_WINDOWS:
+        window_start = today - timedelta(days=days)
+        window = [e for e in entries if e['date'] >= window_start]
+        stats[f'completed_{days}d'] = sum(1 for e in window if e['completed'])
+        stats[f'entries_{days}d'] = len(window)
+    return stats
+
+def compute_habit_stats(habit_ids, conn, today=None):
+    """Recompute habit_stats rows for the given habits from habit_entries in one query"""
+    today = today or datetime.now().date()
+    if not habit_ids:
+        return {}
+    
+    entries_by_habit = get_entries_for_habits(habit_ids, conn)
+    return {habit_id: _compute_habit_stats(habit_id, entries, today)
+            for habit_id, entries in entries_by_habit.items()}
+
+def _recompute_habit_stats(habit_ids, conn, today):
+    """habit_stats rows from the habits' whole entry history
+    
+    With BITMAP_STORE on, the habits' bitmap rows are rewritten from the
+    same fetch of their entries.
+    """
+    entries_by_habit = get_entries_for_habits(habit_ids, conn)
+    if current_app.config['BITMAP_STORE']:
+        write_habit_bitmaps(entries_by_habit, conn)
+    return {habit_id: _compute_habit_stats(habit_id, entries, today)
+            for habit_id, entries in entries_by_habit.items()}
+
+def refresh_habit_stats(habit_ids, conn, today=None):
+    """Recompute and upsert habit_stats rows inside the caller's transaction (no commit)
+    
+    Reads each habit's whole history, so it suits bulk writes and backfills;
+    single cells go through update_habit_stats(). The habits stay locked
+    until the caller's transaction ends.
+    """
+    today = today or datetime.now().date()
+    if not habit_ids:
+        return {}
+    
+    lock_habits(habit_ids, conn)
+    stats = _recompute_habit_stats(habit_ids, conn, today)
+    _upsert_habit_stats(stats, conn)
+    return stats
+
+def update_habit_stats(changes, conn, today=None):
+    """Apply written entry changes to habit_stats rows inside the caller's transaction (no commit)
+    
+    `changes` maps (habit_id, date) -> (old state, new state), with the
+    habits locked by lock_habits() before the entries were written. Totals
+    and windows move by each change, and the streaks re-walk only the runs
+    of entries around the changed days. With BITMAP_STORE on, the changed
+    bits are set and the row comes from the bitmaps instead. Habits without
+    a row for today, without bitmap rows, or whose longest streak may have
+    shrunk are recomputed from their whole history.
+    """
+    today = today or datetime.now().date()
+    cells_by_habit = {}
+    for (habit_id, day), (old, new) in changes.items():
+        if old != new:
+            cells_by_habit.setdefault(habit_id, {})[day] = (old, new)
+    if not cells_by_habit:
+        return {}
+    
+    if current_app.config['BITMAP_STORE']:
+        histories = update_habit_bitmaps(
+            {habit_id: {day: new for day, (_, new) in cells.items()} for habit_id, cells in cells_by_habit.items()},
+            conn)
+        stats = {habit_id: history.stats(habit_id, today, STATS_WINDOWS) for habit_id, history in histories.items()}
+    else:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM habit_stats WHERE habit_id = ANY(%s) AND stats_date = %s',
+                       (list(cells_by_habit), today))
+        stats = {}
+        for row in cursor.fetchall():
+            updated = _apply_entry_changes({column: row[column] for column in HABIT_STATS_COLUMNS},
+                                           cells_by_habit[row['habit_id']], conn, today)
+            if updated is not None:
+                stats[row['habit_id']] = updated
+    
+    rest = [habit_id for habit_id in cells_by_habit if habit_id not in stats]
+    if rest:
+        stats.update(_recompute_habit_stats(rest, conn, today))
+    _upsert_habit_stats(stats, conn)
+    return stats
+
+def _apply_entry_changes(row, cells, conn, today):
+    """`row` moved on by {date: (old state, new state)}, or None if it needs a full recompute"""
+    habit_id = row['habit_id']
+    longest = _longest_streak_after(row['longest_streak'], habit_id, cells, conn)
+    if longest is None:
+        return None
+    row['longest_streak'] = longest
+    
+    for day, (old, new) in cells.items():
+        entry = (new != 'empty') - (old != 'empty')
+        completed = (new == 'completed') - (old == 'completed')
+        row['total_entries'] += entry
+        row['total_completed'] += completed
+        for days in STATS_WINDOWS:
+            if day >= today - timedelta(days=days):
+                row[f'entries_{days}d'] += entry
+                row[f'completed_{days}d'] += completed
+        if day > today:
+            continue
+        if new != 'empty' and (row['last_entry_date'] is None or day > row['last_entry_date']):
+            row['last_entry_date'] = day
+        if new == 'completed' and (row['last_completed_date'] is None or day > row['last_completed_date']):
+            row['last_completed_date'] = day
+    
+    past = [(day, old, new) for day, (old, new) in cells.items() if day <= today]
+    if past:
+        if any(old != 'empty' and new == 'empty' and day == row['last_entry_date'] for day, old, new in past):
+            row['last_entry_date'] = _latest_entry_date(habit_id, today, conn)
+        if any(old == 'completed' and new != 'completed' and day == row['last_completed_date']
+               for day, old, new in past):
+            row['last_completed_date'] = _latest_entry_date(habit_id, today, conn, completed=True)
+        row['current_streak'] = _walk_current_streak(habit_id, today, row['current_streak'] + len(past), conn)
+    return row
+
+def _longest_streak_after(longest, habit_id, cells, conn):
+    """The longest streak after the changes, or None if it may have shrunk
+    
+    A run only breaks at a missed entry. A change that completes a day or
+    removes a missed entry can only lengthen the run through that day. One
+    that breaks or shortens a run is checked against the run's old length:
+    if that run was the longest, another one may now be.
+    """
+    shrinking = [day for day, (old, new) in cells.items()
+                 if old == 'completed' or (old == 'empty' and new == 'missed')]
+    if shrinking and len(cells) > 1:
+        return None
+    
+    for day, (old, new) in cells.items():
+        around = _completed_run(habit_id, day, True, conn) + _completed_run(habit_id, day, False, conn)
+        if new == 'completed':
+            longest = max(longest, around + 1)
+        elif old == 'missed':
+            longest = max(longest, around)
+        elif (around + 1 if old == 'completed' else around) >= longest:
+            return None
+    return longest
+
+def _completed_run(habit_id, day, backwards, conn, batch_size=32):
+    """Completed entries next to `day` (exclusive), one way, up to the nearest missed one"""
+    cursor = conn.cursor()
+    run = 0
+    while True:
+        if backwards:
+            cursor.execute('''
+                SELECT date, completed FROM habit_entries
+                WHERE habit_id = %s AND date < %s ORDER BY date DESC LIMIT %s
+            ''', (habit_id, day, batch_size))
+        else:
+            cursor.execute('''
+                SELECT date, completed FROM habit_entries
+                WHERE habit_id = %s AND date > %s ORDER BY date LIMIT %s
+            ''', (habit_id, day, batch_size))
+        entries = cursor.fetchall()
+        for entry in entries:
+            if not entry['completed']:
+                return run
+            run += 1
+        if len(entries) < batch_size:
+            return run
+        day = entries[-1]['date']
+        batch_size *= 2
+
+def _walk_current_streak(habit_id, today, expected, conn):
+    """Current streak from the newest entries, fetching more while the walk hasn't stopped"""
+    cursor = conn.cursor()
+    limit = expected + 8
+    while True:
+        cursor.execute('''
+            SELECT date, completed FROM habit_entries
+            WHERE habit_id = %s AND date <= %s ORDER BY date DESC LIMIT %s
+        ''', (habit_id, today, limit))
+        entries = cursor.fetchall()
+        streak = _current_streak_from_entries(entries, today)
+        # Each entry the walk doesn't stop at adds one, so a shorter streak means it stopped
+        if streak < len(entries) or len(entries) < limit:
+            return streak
+        limit *= 2
+
+def _latest_entry_date(habit_id, today, conn, completed=False):
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT date FROM habit_entries
+        WHERE habit_id = %s AND date <= %s {'AND completed' if completed else ''}
+        ORDER BY date DESC LIMIT 1
+    ''', (habit_id, today))
+    row = cursor.fetchone()
+    return row['date'] if row else None
+
+def refresh_stale_habit_stats(habit_ids, conn, today):
+    """Roll habit_stats rows over to today after the date changed
+    
+    Nothing was written, only the day moved on, so with BITMAP_STORE on
+    the rows come from the habits' bitmaps instead of their whole entry
+    history. Habits without bitmap rows yet take the full path, which
+    writes them. Rows a writer already brought up to today are left as
+    they are.
+    """
+    lock_habits(habit_ids, conn)
+    stats = {}
+    if current_app.config['BITMAP_STORE']:
+        stats = {habit_id: history.stats(habit_id, today, STATS_WINDOWS)
+                 for habit_id, history in load_histories(habit_ids, conn).items()}
+    rest = [habit_id for habit_id in habit_ids if habit_id not in stats]
+    if rest:
+        stats.update(_recompute_habit_stats(rest, conn, today))
+    _upsert_habit_stats(stats, conn, stale_only=True)
+    return stats
+
+def _upsert_habit_stats(stats, conn, stale_only=False):
+    if not stats:
+        return
+    
+    columns = ', '.join(HABIT_STATS_COLUMNS)
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in HABIT_STATS_COLUMNS[1:])
+    cursor = conn.cursor()
+    execute_values(cursor, f'''
+        INSERT INTO habit_stats ({columns}) VALUES %s
+        ON CONFLICT (habit_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+        {'WHERE habit_stats.stats_date < EXCLUDED.stats_date' if stale_only else ''}
+    ''', [tuple(row[column] for column in HABIT_STATS_COLUMNS) for row in stats.values()])
+def get_habit_stats(user_id, conn):
+    """habit_stats rows for a user's active habits, refreshing missing or stale ones
+    
+    Rows are computed as of stats_date; the first read on a new day recomputes
+    them so streaks and rolling windows stay correct. Returns {habit_id: row}
+    with the habit's name and category merged in, in weekly view order.
+    """
+    today = datetime.now().date()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT h.id, h.name, h.category, hs.*
+        FROM habits h
+        LEFT JOIN habit_stats hs ON hs.habit_id = h.id
+        WHERE h.user_id = %s AND h.active = true
+        ORDER BY {CATEGORY_ORDER_SQL}
+    ''', (user_id,))
+    rows = cursor.fetchall()
+    
+    habits = {row['id']: {'name': row['name'], 'category': row['category']} for row in rows}
+    stats = {row['id']: dict(row) for row in rows if row['stats_date'] == today}
+    
+    stale_ids = [habit_id for habit_id in habits if habit_id not in stats]
+    if stale_ids:
+        stats.update(_refresh_stale(stale_ids, conn, today))
+    
+    for habit_id, habit in habits.items():
+        stats[habit_id].update(habit)
+    return {habit_id: stats[habit_id] for habit_id in habits}
+
+def _refresh_stale(habit_ids, conn, today):
+    """refresh_stale_habit_stats() and commit, on the primary when `conn` is a replica
+    
+    Without a primary connection the rows are computed on the replica for
+    this request only.
+    """
+    if not getattr(conn, 'replica', False):
+        stats = refresh_stale_habit_stats(habit_ids, conn, today)
+        conn.commit()
+        return stats
+    
+    primary = get_db_connection()
+    if not primary:
+        return compute_habit_stats(habit_ids, conn, today)
+    try:
+        stats = refresh_stale_habit_stats(habit_ids, primary, today)
+        primary.commit()
+        return stats
+    finally:
+        primary.close()
+
+def check_habit_stats(habit_ids, conn):
+    """Compare stored habit_stats rows against a full recompute
+    
+    Returns (mismatches, missing) where mismatches is a list of
+    (habit_id, column, stored, expected) and missing counts habits without a row.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM habit_stats WHERE habit_id = ANY(%s)
+    ''', (list(habit_ids),))
+    stored = {row['habit_id']: row for row in cursor.fetchall()}
+    
+    # Recompute as of each row's own stats_date, one query per distinct date
+    ids_by_date = {}
+    for habit_id, row in stored.items():
+        ids_by_date.setdefault(row['stats_date'], []).append(habit_id)
+    
+    mismatches = []
+    for stats_date, ids in ids_by_date.items():
+        expected_rows = compute_habit_stats(ids, conn, stats_date)
+        for habit_id in ids:
+            for column in HABIT_STATS_COLUMNS:
+                if stored[habit_id][column] != expected_rows[habit_id][column]:
+                    mismatches.append((habit_id, column, stored[habit_id][column],
+                                       expected_rows[habit_id][column]))
+    
+    return mismatches, len(habit_ids) - len(stored)
+
+def _habit_id_batches(conn, user_id=None, batch_size=500):
+    """Yield lists of habit ids, optionally limited to one user"""
+    cursor = conn.cursor()
+    if user_id is None:
+        cursor.execute('SELECT id FROM habits ORDER BY id')
+    else:
+        cursor.execute('SELECT id FROM habits WHERE user_id = %s ORDER BY id', (user_id,))
+    habit_ids = [row['id'] for row in cursor.fetchall()]
+    for start in range(0, len(habit_ids), batch_size):
+        yield habit_ids[start:start + batch_size]
+
+@click.command('rebuild-stats')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s habits.')
+def rebuild_stats_command(user_id):
+    """Backfill habit_stats from habit_entries"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    
+    try:
+        rebuilt = 0
+        for batch in _habit_id_batches(conn, user_id):
+            refresh_habit_stats(batch, conn)
+            conn.commit()
+            rebuilt += len(batch)
+        print(f"✅ Rebuilt stats for {rebuilt} habits")
+    finally:
+        conn.close()
+
+@click.command('rebuild-bitmaps')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s habits.')
+def rebuild_bitmaps_command(user_id):
+    """Backfill habit_bitmaps from habit_entries (after turning BITMAP_STORE on)"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    
+    try:
+        rebuilt = 0
+        for batch in _habit_id_batches(conn, user_id):
+            write_habit_bitmaps(get_entries_for_habits(batch, conn), conn)
+            conn.commit()
+            rebuilt += len(batch)
+        print(f"✅ Rebuilt bitmaps for {rebuilt} habits")
+    finally:
+        conn.close()
+
+@click.command('check-stats')
+@click.option('--user-id', type=int, default=None, help='Only check this user\'s habits.')
+def check_stats_command(user_id):
+    """Verify habit_stats against a full recompute from habit_entries"""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('Could not connect to database')
+    
+    try:
+        checked = 0
+        missing = 0
+        mismatches = []
+        for batch in _habit_id_batches(conn, user_id):
+            batch_mismatches, batch_missing = check_habit_stats(batch, conn)
+            mismatches.extend(batch_mismatches)
+            missing += batch_missing
+            checked += len(batch)
+        
+        for habit_id, column, stored, expected in mismatches:
+            print(f"❌ Habit {habit_id}: {column} is {stored!r}, expected {expected!r}")
+        if missing:
+            print(f"⚠️ {missing} habits have no stats row yet (run rebuild-stats to backfill)")
+        if mismatches:
+            raise click.ClickException(f'{len(mismatches)} mismatches in {checked} habits')
+        print(f"✅ Stats consistent for {checked} habits")
+    finally:
+        conn.close()
+
+def init_app(app):
+    """Register the habit_stats CLI commands"""
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(check_stats_command)
+    app.cli.add_command(rebuild_bitmaps_command)
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+def _current_streak_from_entries(entries, today):
+    """Current streak from entries ordered newest first (dates on or before today)"""
+    streak = 0
+    current_date = today
+    
+    for entry in entries:
+        entry_date = entry['date']
+        
+        if entry_date < current_date - timedelta(days=1):
+            break
+        
+        if entry_date == current_date and entry['completed']:
+            streak += 1
+            current_date -= timedelta(days=1)
+        elif entry_date == current_date and not entry['completed']:
+            break
+        elif entry_date < current_date:
+            current_date = entry_date
+            if entry['completed']:
+                streak += 1
+            else:
+                break
+    
+    return streak
+
+def _longest_streak_from_entries(entries):
+    """Longest run of completed entries, ordered oldest first"""
+    max_streak = 0
+    current_streak = 0
+    
+    for entry in entries:
+        if entry['completed']:
+            current_streak += 1
+            max_streak = max(max_streak, current_streak)
+        else:
+            current_streak = 0
+    
+    return max_streak
+
+def calculate_current_streak(habit_id, conn):
+    """Calculate current streak for a habit"""
+    today = datetime.now().date()
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT date, completed FROM habit_entries 
+            WHERE habit_id = %s AND date <= %s
+            ORDER BY date DESC
+        ''', (habit_id, today))
+        entries = cursor.fetchall()
+        
+        return _current_streak_from_entries(entries, today)
+    except Exception:
+        logger.exception("Calculate streak error")
+        return 0
+
+def calculate_longest_streak(habit_id, conn):
+    """Calculate longest streak for a habit"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT date, completed FROM habit_entries 
+            WHERE habit_id = %s 
+            ORDER BY date
+        ''', (habit_id,))
+        entries = cursor.fetchall()
+        
+        return _longest_streak_from_entries(entries)
+    except Exception:
+        logger.exception("Calculate longest streak error")
+        return 0
+
+def calculate_streaks(user_id, conn):
+    """Current and longest streaks for all of a user's active habits in one query
+    
+    Returns {habit_id: {'name': str, 'current_streak': int, 'longest_streak': int}}.
+    """
+    today = datetime.now().date()
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT h.id as habit_id, h.name, he.date, he.completed
+            FROM habits h
+            LEFT JOIN habit_entries he ON he.habit_id = h.id
+            WHERE h.user_id = %s AND h.active = true
+            ORDER BY h.id, he.date
+        ''', (user_id,))
+        rows = cursor.fetchall()
+    except Exception:
+        logger.exception("Calculate streaks error")
+        return {}
+    
+    entries_by_habit = {}
+    names = {}
+    for row in rows:
+        habit_entries = entries_by_habit.setdefault(row['habit_id'], [])
+        names[row['habit_id']] = row['name']
+        if row['date'] is not None:
+            habit_entries.append(row)
+    
+    streaks = {}
+    for habit_id, entries in entries_by_habit.items():
+        past_entries = [entry for entry in reversed(entries) if entry['date'] <= today]
+        streaks[habit_id] = {
+            'name': names[habit_id],
+            'current_streak': _current_streak_from_entries(past_entries, today),
+            'longest_streak': _longest_streak_from_entries(entries),
+        }
+    
+    return streaks
@@ -0,0 +1,259 @@
+import logging
+
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+
+from . import queries
+from .cache import cached_page, invalidate_user
+from .db import get_db_connection, get_read_connection
+from .grid import HEATMAP_RANGES, heatmap_range, week_range
+from .insights import compute_dashboard, compute_heatmap, compute_weekly
+from .jobs import enqueue_user_refresh
+from .live import notify_changes
+from .stats import update_habit_stats
+
+bp = Blueprint('tracking', __name__)
+
+logger = logging.getLogger(__name__)
+
+# Longest range the grid view renders (a quarter)
+MAX_GRID_WEEKS = 13
+
+@bp.route('/dashboard')
+def dashboard():
+    """Main dashboard with summary statistics"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    conn = get_read_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('auth.index'))
+    
+    try:
+        context = cached_page('dashboard', session['user_id'], conn, compute_dashboard)
+        return render_template('dashboard.html', **context)
+        
+    except Exception:
+        flash('Error loading dashboard.', 'error')
+        logger.exception("Dashboard error")
+        return redirect(url_for('auth.index'))
+    finally:
+        conn.close()
+
+def weekly_args():
+    """(week_offset, weeks) from the query string, weeks clamped to 1..MAX_GRID_WEEKS"""
+    week_offset = int(request.args.get('week', 0))
+    weeks = min(max(int(request.args.get('weeks', 1)), 1), MAX_GRID_WEEKS)
+    return week_offset, weeks
+
+def load_weekly(user_id, week_offset, weeks, conn, data_version=None):
+    """Cached weekly grid payload for the range starting `week_offset` weeks from this one"""
+    week_start, days = week_range(week_offset, weeks, datetime.now().date())
+    return cached_page(
+        'weekly', user_id, conn,
+        lambda user_id, conn: compute_weekly(user_id, conn, week_start, days),
+        variant=f'{week_start}:{days}', data_version=data_version
+    )
+
+@bp.route('/weekly_view')
+def weekly_view():
+    """Weekly grid view of habits"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    # Get week offset and range length (in weeks) from query parameters
+    week_offset, weeks = weekly_args()
+    
+    conn = get_read_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('tracking.dashboard'))
+    
+    try:
+        context = load_weekly(session['user_id'], week_offset, weeks, conn)
+        return render_template('weekly_view.html',
+                             week_offset=week_offset,
+                             weeks=weeks,
+                             **context)
+        
+    except Exception:
+        flash('Error loading weekly view.', 'error')
+        logger.exception("Weekly view error")
+        return redirect(url_for('tracking.dashboard'))
+    finally:
+        conn.close()
+
+def load_heatmap(user_id, range_kind, offset, conn, data_version=None):
+    """Cached heatmap payload for the range `offset` months/quarters/years from now"""
+    start_date, end_date = heatmap_range(range_kind, offset, datetime.now().date())
+    payload = cached_page(
+        'heatmap', user_id, conn,
+        lambda user_id, conn: compute_heatmap(user_id, conn, start_date, end_date),
+        variant=f'{start_date}:{end_date}', data_version=data_version
+    )
+    return dict(payload, range=range_kind, offset=offset)
+
+def heatmap_args():
+    """(range_kind, offset) from the query string, falling back to the current month"""
+    range_kind = request.args.get('range', 'month')
+    if range_kind not in HEATMAP_RANGES:
+        range_kind = 'month'
+    return range_kind, int(request.args.get('offset', 0))
+
+@bp.route('/heatmap')
+def heatmap():
+    """Month, quarter or year heatmap of every active habit"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    conn = get_read_connection()
+    if not conn:
+        flash('Database error.', 'error')
+        return redirect(url_for('tracking.dashboard'))
+    
+    try:
+        range_kind, offset = heatmap_args()
+        # The first range is rendered into the page; the rest arrive via /heatmap_data
+        payload = load_heatmap(session['user_id'], range_kind, offset, conn)
+        return render_template('heatmap.html', payload=payload, ranges=list(HEATMAP_RANGES))
+        
+    except Exception:
+        flash('Error loading heatmap.', 'error')
+        logger.exception("Heatmap error")
+        return redirect(url_for('tracking.dashboard'))
+    finally:
+        conn.close()
+
+@bp.route('/heatmap_data')
+def heatmap_data():
+    """Heatmap payload for one range, for in-page navigation and prefetching"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    try:
+        range_kind, offset = heatmap_args()
+        
+        conn = get_read_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database error'})
+        
+        try:
+            payload = load_heatmap(session['user_id'], range_kind, offset, conn)
+            return jsonify(dict(payload, success=True))
+        finally:
+            conn.close()
+        
+    except (ValueError, OverflowError, Exception):
+        logger.exception("Heatmap data error")
+        return jsonify({'success': False, 'error': 'Server error'})
+
+@bp.route('/toggle_habit', methods=['POST'])
+def toggle_habit():
+    """Toggle habit completion for a specific date via AJAX"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    try:
+        data = request.get_json()
+        habit_id = int(data['habit_id'])
+        date_str = data['date']
+        
+        # Validate date format
+        try:
+            date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid date format'})
+        
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database error'})
+        
+        try:
+            queries.lock_habits([habit_id], conn)
+            new_status = queries.toggle_entry(habit_id, session['user_id'], date_obj, conn)
+            
+            if new_status is None:
+                return jsonify({'success': False, 'error': 'Habit not found'})
+            
+            # Keep the summary row and data version in step with the entry, in the same transaction
+            update_habit_stats({(habit_id, date_obj): (queries.previous_toggle_state(new_status), new_status)}, conn)
+            data_version = queries.bump_data_version(session['user_id'], conn)
+            enqueue_user_refresh(session['user_id'], conn)
+            notify_changes(session['user_id'], data_version, conn, [(habit_id, date_obj, new_status)])
+            
+            conn.commit()
+            invalidate_user(session['user_id'], data_version - 1, datetime.now().date())
+            return jsonify({'success': True, 'status': new_status})
+            
+        finally:
+            conn.close()
+        
+    except (ValueError, KeyError, Exception):
+        logger.exception("Toggle habit error")
+        return jsonify({'success': False, 'error': 'Server error'})
+
+# Upper bound on cells per /toggle_habits request
+MAX_BATCH_CHANGES = 500
+
+@bp.route('/toggle_habits', methods=['POST'])
+def toggle_habits():
+    """Set many grid cells at once, in one transaction
+    
+    Expects {"changes": [{"habit_id": 1, "date": "2024-01-01", "state": "completed"}, ...]}
+    where state is the desired final state: completed, missed or empty.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    try:
+        data = request.get_json()
+        raw_changes = data['changes']
+        if not isinstance(raw_changes, list) or not 0 < len(raw_changes) <= MAX_BATCH_CHANGES:
+            return jsonify({'success': False, 'error': f'Send between 1 and {MAX_BATCH_CHANGES} changes'})
+        
+        changes = []
+        for change in raw_changes:
+            state = change['state']
+            if state not in queries.ENTRY_STATES:
+                return jsonify({'success': False, 'error': f'Invalid state: {state}'})
+            try:
+                date_obj = datetime.strptime(change['date'], '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Invalid date format'})
+            changes.append((int(change['habit_id']), date_obj, state))
+        
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database error'})
+        
+        try:
+            queries.lock_habits({habit_id for habit_id, _, _ in changes}, conn)
+            previous = queries.get_entry_states({(habit_id, date) for habit_id, date, _ in changes}, conn)
+            applied, rejected = queries.set_entries(session['user_id'], changes, conn)
+            
+            # Keep the summary rows and data version in step with the entries, in the same transaction
+            update_habit_stats({cell: (previous[cell], state) for cell, state in applied.items()}, conn)
+            data_version = queries.bump_data_version(session['user_id'], conn)
+            enqueue_user_refresh(session['user_id'], conn)
+            notify_changes(session['user_id'], data_version, conn,
+                           [(habit_id, date, state) for (habit_id, date), state in applied.items()])
+            
+            conn.commit()
+            invalidate_user(session['user_id'], data_version - 1, datetime.now().date())
+            return jsonify({
+                'success': True,
+                'results': [
+                    {'habit_id': habit_id, 'date': date.strftime('%Y-%m-%d'), 'status': state}
+                    for (habit_id, date), state in applied.items()
+                ],
+                'rejected': rejected
+            })
+            
+        finally:
+            conn.close()
+        
+    except (ValueError, KeyError, TypeError, Exception):
+        logger.exception("Toggle habits error")
+        return jsonify({'success': False, 'error': 'Server error'})
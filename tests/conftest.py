@@ -0,0 +1,89 @@
+"""Shared fixtures
+
+Tests that need PostgreSQL run against TEST_DATABASE_URL and are skipped
+without it. That database is migrated once per run and emptied before
+each test, so point it at a scratch database.
+"""
+import os
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from habit_tracker import create_app, queries
+from habit_tracker.db import apply_migrations, get_db_connection
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'test',
+    'DATABASE_URL': None,
+    'DATABASE_READ_URL': '',
+    'CACHE_BACKEND': 'none',
+    'SESSION_BACKEND': 'cookie',
+    'LIVE_UPDATES': False,
+    'BACKGROUND_JOBS': False,
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+}
+
+@pytest.fixture
+def app():
+    """An app without a database"""
+    return create_app(TEST_CONFIG)
+
+@pytest.fixture(scope='session')
+def database_url():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    conn = psycopg2.connect(TEST_DATABASE_URL, cursor_factory=RealDictCursor)
+    try:
+        apply_migrations(conn)
+    finally:
+        conn.close()
+    return TEST_DATABASE_URL
+
+@pytest.fixture
+def db_app(database_url):
+    """An app on the emptied test database"""
+    conn = psycopg2.connect(database_url)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('TRUNCATE users, habits, jobs RESTART IDENTITY CASCADE')
+        conn.commit()
+    finally:
+        conn.close()
+
+    app = create_app(dict(TEST_CONFIG, DATABASE_URL=database_url))
+    yield app
+    pool = app.extensions.get('db_pool')
+    if pool is not None:
+        pool.closeall()
+
+@pytest.fixture
+def conn(db_app):
+    """A pooled connection, inside an app context"""
+    with db_app.app_context():
+        conn = get_db_connection()
+        yield conn
+        conn.close()
+
+@pytest.fixture
+def user(conn):
+    """A user with one active habit: {'id', 'username', 'habit_id'}"""
+    user_id = queries.create_user('tester', 'unused-hash', conn)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO habits (user_id, name, category) VALUES (%s, 'Read', 'Learning') RETURNING id",
+                   (user_id,))
+    habit_id = cursor.fetchone()['id']
+    conn.commit()
+    return {'id': user_id, 'username': 'tester', 'habit_id': habit_id}
+
+@pytest.fixture
+def client(db_app, user):
+    """A test client logged in as `user`"""
+    client = db_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user['id']
+        session['username'] = user['username']
+    return client
@@ -0,0 +1,34 @@
+from habit_tracker import queries
+
+def test_api_needs_a_login(app):
+    response = app.test_client().get('/api/v1/weekly')
+    assert response.status_code == 401
+
+def test_current_etag_gets_304(client):
+    first = client.get('/api/v1/weekly')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    revalidated = client.get('/api/v1/weekly', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+
+def test_write_changes_the_etag(client, conn, user):
+    etag = client.get('/api/v1/weekly').headers['ETag']
+
+    queries.bump_data_version(user['id'], conn)
+    conn.commit()
+
+    response = client.get('/api/v1/weekly', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['data_version'] == 1
+
+def test_etag_differs_per_variant(client):
+    one_week = client.get('/api/v1/weekly').headers['ETag']
+    response = client.get('/api/v1/weekly?weeks=4', headers={'If-None-Match': one_week})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != one_week
@@ -0,0 +1,37 @@
+from habit_tracker.benchmark import QUERY_BUDGETS, CountingCursor, QueryCounter, compare, over_budget
+from habit_tracker.db import ConnectionPool
+
+def results(cache=False, **routes):
+    return {'meta': {'cache': cache}, 'routes': routes}
+
+def test_compare_flags_slower_percentiles_past_the_threshold():
+    baseline = results(dashboard={'p50_ms': 10, 'p95_ms': 20, 'queries_per_request': 2})
+    assert compare(results(dashboard={'p50_ms': 11, 'p95_ms': 23, 'queries_per_request': 2}), baseline, 0.2) == []
+    assert compare(results(dashboard={'p50_ms': 13, 'p95_ms': 20, 'queries_per_request': 2}), baseline, 0.2) == \
+        ['dashboard p50_ms: 10 -> 13']
+
+def test_compare_ignores_routes_without_a_baseline():
+    assert compare(results(heatmap={'p50_ms': 50, 'p95_ms': 90}), results(), 0.2) == []
+
+def test_compare_fails_any_query_increase():
+    baseline = results(dashboard={'queries_per_request': 2})
+    assert compare(results(dashboard={'queries_per_request': 2.1}), baseline, 0.2) == \
+        ['dashboard queries: 2 -> 2.1']
+    assert compare(results(dashboard={'queries_per_request': 1}), baseline, 0.2) == []
+
+def test_compare_skips_query_counts_across_cache_settings():
+    baseline = results(cache=True, dashboard={'queries_per_request': 1})
+    assert compare(results(dashboard={'queries_per_request': 2}), baseline, 0.2) == []
+
+def test_over_budget():
+    assert over_budget(results(analytics={'queries_per_request': QUERY_BUDGETS['analytics']})) == []
+    assert over_budget(results(analytics={'queries_per_request': QUERY_BUDGETS['analytics'] + 1})) != []
+
+def test_analytics_page_stays_within_its_query_budget(db_app, client):
+    db_app.extensions['db_pool'] = ConnectionPool(db_app.config['DATABASE_URL'], min_size=0,
+                                                  cursor_factory=CountingCursor)
+    assert client.get('/analytics').status_code == 200  # first request checks the schema
+
+    QueryCounter.reset()
+    assert client.get('/analytics').status_code == 200
+    assert QueryCounter.queries <= QUERY_BUDGETS['analytics']
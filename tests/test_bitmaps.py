@@ -0,0 +1,59 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from habit_tracker.bitmaps import HabitHistory, encode_entries
+from habit_tracker.stats import STATS_WINDOWS, _compute_habit_stats
+from habit_tracker.streaks import _current_streak_from_entries, _longest_streak_from_entries
+
+TODAY = date(2024, 3, 1)
+
+def history(entries):
+    return HabitHistory.from_years(encode_entries(entries))
+
+def entries_from(pattern, end=TODAY):
+    """Entries ending on `end`, one character per day: c completed, m missed, . untracked"""
+    start = end - timedelta(days=len(pattern) - 1)
+    return [{'date': start + timedelta(days=offset), 'completed': state == 'c'}
+            for offset, state in enumerate(pattern) if state != '.']
+
+def random_entries(rng, start, days):
+    entries = []
+    for offset in range(days):
+        roll = rng.random()
+        if roll < 0.6:
+            entries.append({'date': start + timedelta(days=offset), 'completed': True})
+        elif roll < 0.8:
+            entries.append({'date': start + timedelta(days=offset), 'completed': False})
+    return entries
+
+@pytest.mark.parametrize('pattern', [
+    '', 'c', 'ccc', 'ccc.', 'cc..', 'ccm', 'cmc', 'c.c.c', 'cc.c', 'm', 'mc.', '.',
+])
+def test_streaks_match_the_row_walk(pattern):
+    entries = entries_from(pattern)
+    newest_first = list(reversed(entries))
+    assert history(entries).current_streak(TODAY) == _current_streak_from_entries(newest_first, TODAY)
+    assert history(entries).longest_streak() == _longest_streak_from_entries(entries)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_stats_match_the_row_path_across_years(seed):
+    rng = random.Random(seed)
+    # Starts in 2022 and runs past today, through the 2024 leap day
+    start = date(2022, 1, 1) + timedelta(days=rng.randrange(365))
+    entries = random_entries(rng, start, (TODAY - start).days + rng.randrange(10))
+    today = TODAY - timedelta(days=rng.randrange(3))
+    assert history(entries).stats(1, today, STATS_WINDOWS) == _compute_habit_stats(1, entries, today)
+
+def test_empty_history_matches_no_entries():
+    assert history([]).stats(1, TODAY, STATS_WINDOWS) == _compute_habit_stats(1, [], TODAY)
+
+def test_weekday_counts():
+    entries = entries_from('cmc.ccm' * 3)
+    expected = [[0, 0] for _ in range(7)]
+    for entry in entries:
+        counts = expected[entry['date'].weekday()]
+        counts[0] += entry['completed']
+        counts[1] += 1
+    assert history(entries).weekday_counts() == expected
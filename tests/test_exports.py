@@ -0,0 +1,53 @@
+import json
+from datetime import date, timedelta
+
+import psycopg2
+import pytest
+
+from habit_tracker import queries
+
+@pytest.fixture
+def failing_export(db_app, conn, user, monkeypatch):
+    """Three entries exported one per batch, with the read failing after the first"""
+    for offset in range(3):
+        queries.toggle_entry(user['habit_id'], user['id'], date(2024, 3, 5) + timedelta(days=offset), conn)
+    conn.commit()
+    db_app.config['EXPORT_BATCH_SIZE'] = 1
+
+    iter_export_entries = queries.iter_export_entries
+
+    def failing(*args, **kwargs):
+        batches = iter_export_entries(*args, **kwargs)
+        try:
+            yield next(batches)
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        finally:
+            batches.close()
+
+    monkeypatch.setattr(queries, 'iter_export_entries', failing)
+
+def read_until_failure(response):
+    chunks = []
+    try:
+        with pytest.raises(psycopg2.OperationalError):
+            for chunk in response.response:
+                chunks.append(chunk)
+    finally:
+        response.close()
+    return b''.join(chunks).decode()
+
+def test_failed_ndjson_export_ends_with_an_error_line(client, user, failing_export):
+    response = client.get('/export/entries.ndjson')
+    assert response.status_code == 200
+
+    lines = [json.loads(line) for line in read_until_failure(response).splitlines()]
+    assert [line.get('date') for line in lines[:-1]] == ['2024-03-05']
+    assert lines[-1] == {'error': 'Export failed', 'resume_after': f"2024-03-05:{user['habit_id']}"}
+
+def test_failed_csv_export_is_cut_off(client, failing_export):
+    response = client.get('/export/entries.csv')
+    assert response.status_code == 200
+
+    body = read_until_failure(response)
+    assert body.splitlines()[0] == 'date,habit_id,habit_name,category,completed'
+    assert len(body.splitlines()) == 2
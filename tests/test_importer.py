@@ -0,0 +1,87 @@
+import csv
+import io
+from datetime import date
+
+import pytest
+
+from habit_tracker import importer
+from habit_tracker.importer import ImportRowError, decode_lines, parse_row, read_rows, stage_rows
+
+OWNED = {1, 2}
+BY_NAME = {'read': 1, 'run': 2}
+
+def test_parse_row_by_id_and_by_name():
+    assert parse_row({'habit_id': '1', 'date': '2024-03-05', 'completed': 'true'}, OWNED, BY_NAME) == \
+        (1, date(2024, 3, 5), True)
+    assert parse_row({'habit_name': ' Run ', 'date': '2024-03-05', 'completed': False}, OWNED, BY_NAME) == \
+        (2, date(2024, 3, 5), False)
+
+@pytest.mark.parametrize('row, error', [
+    ({'habit_id': 'x', 'date': '2024-03-05', 'completed': '1'}, 'Invalid habit_id'),
+    ({'habit_id': '9', 'date': '2024-03-05', 'completed': '1'}, 'Unknown habit_id'),
+    ({'habit_id': True, 'date': '2024-03-05', 'completed': '1'}, 'Invalid habit_id'),
+    ({'habit_id': 1.5, 'date': '2024-03-05', 'completed': '1'}, 'Invalid habit_id'),
+    ({'habit_name': 'Swim', 'date': '2024-03-05', 'completed': '1'}, 'Unknown habit'),
+    ({'date': '2024-03-05', 'completed': '1'}, 'Missing habit_id or habit_name'),
+    ({'habit_id': '1', 'date': '05/03/2024', 'completed': '1'}, 'Invalid date'),
+    ({'habit_id': '1', 'completed': '1'}, 'Invalid date'),
+    ({'habit_id': '1', 'date': '2024-03-05', 'completed': 'maybe'}, 'Invalid completed value'),
+    ({'habit_id': '1', 'date': '2024-03-05'}, 'Invalid completed value'),
+])
+def test_parse_row_rejects(row, error):
+    with pytest.raises(ImportRowError, match=error):
+        parse_row(row, OWNED, BY_NAME)
+
+def test_stage_rows_reports_rejects_with_line_numbers():
+    lines = [
+        'habit_id,date,completed\n',
+        '1,2024-03-05,true\n',
+        '9,2024-03-05,true\n',
+        '2,not-a-date,false\n',
+        '2,2024-03-06,false\n',
+    ]
+    staging = io.StringIO()
+    read, staged, habit_ids, rejects = stage_rows(read_rows(lines, 'csv'), OWNED, BY_NAME, staging)
+
+    assert (read, staged, habit_ids) == (4, 2, {1, 2})
+    assert [reject['line'] for reject in rejects] == [3, 4]
+    assert 'Unknown habit_id' in rejects[0]['error']
+    assert staging.getvalue() == '1,2024-03-05,t\n2,2024-03-06,f\n'
+
+def test_stage_rows_rejects_unparseable_ndjson():
+    lines = ['{"habit_id": 1, "date": "2024-03-05", "completed": true}\n', '{oops\n', '[1, 2]\n', '\n']
+    read, staged, _, rejects = stage_rows(read_rows(lines, 'ndjson'), OWNED, BY_NAME, io.StringIO())
+    assert (read, staged) == (3, 1)
+    assert [reject['line'] for reject in rejects] == [2, 3]
+    assert all(reject['error'].startswith('Invalid JSON') for reject in rejects)
+
+def test_undecodable_bytes_reject_only_their_rows():
+    data = b'habit_id,date,completed\n1,2024-03-05,true\n2,2024-03-06,\xff\n2,2024-03-07,false\n'
+    read, staged, _, rejects = stage_rows(read_rows(decode_lines(io.BytesIO(data)), 'csv'),
+                                          OWNED, BY_NAME, io.StringIO())
+    assert (read, staged) == (3, 2)
+    assert rejects == [{'line': 3, 'error': 'Invalid UTF-8'}]
+
+    data = b'{"habit_id": 1, "date": "2024-03-05", "completed": true}\n{"habit_name": "R\xe9ad"}\n'
+    read, staged, _, rejects = stage_rows(read_rows(decode_lines(io.BytesIO(data)), 'ndjson'),
+                                          OWNED, BY_NAME, io.StringIO())
+    assert (read, staged) == (2, 1)
+    assert rejects == [{'line': 2, 'error': 'Invalid UTF-8'}]
+
+def test_csv_errors_reject_only_their_rows():
+    lines = [
+        'habit_id,date,completed\n',
+        '1,2024-03-05,true\n',
+        f'1,2024-03-06,{"x" * (csv.field_size_limit() + 1)}\n',
+        '2,2024-03-07,false\n',
+    ]
+    read, staged, _, rejects = stage_rows(read_rows(lines, 'csv'), OWNED, BY_NAME, io.StringIO())
+    assert (read, staged) == (3, 2)
+    assert rejects[0]['line'] == 3
+    assert rejects[0]['error'].startswith('Invalid CSV')
+
+def test_stage_rows_caps_reported_rejects(monkeypatch):
+    monkeypatch.setattr(importer, 'MAX_REPORTED_REJECTS', 2)
+    rows = [(line, {'habit_id': '9', 'date': '2024-03-05', 'completed': '1'}) for line in range(5)]
+    read, staged, _, rejects = stage_rows(rows, OWNED, BY_NAME, io.StringIO())
+    assert (read, staged, len(rejects)) == (5, 0, 2)
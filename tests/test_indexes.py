@@ -0,0 +1,15 @@
+import pytest
+
+from habit_tracker.db import INDEX_CHECK_QUERIES, _seq_scans
+
+@pytest.mark.parametrize('label, sql, params', INDEX_CHECK_QUERIES, ids=[query[0] for query in INDEX_CHECK_QUERIES])
+def test_hot_path_queries_have_an_index_path(conn, label, sql, params):
+    cursor = conn.cursor()
+    try:
+        # As check-indexes does: an empty table is cheapest to scan, so make the planner show an index path
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+    finally:
+        conn.rollback()
+    assert _seq_scans(plan) == []
@@ -0,0 +1,43 @@
+import pytest
+
+from habit_tracker import queries
+from habit_tracker.insights import ANALYTICS_JOB, load_analytics, precompute_analytics
+from habit_tracker.jobs import enqueue
+
+@pytest.fixture
+def jobs_app(db_app):
+    db_app.config['BACKGROUND_JOBS'] = True
+    return db_app
+
+def stored_payload(conn, user):
+    precompute_analytics(user['id'], conn)
+    conn.commit()
+    payload = load_analytics(user['id'], conn)
+    assert 'stale' not in payload
+    return payload
+
+def test_previous_payload_is_served_stale_while_its_job_is_pending(jobs_app, conn, user):
+    payload = stored_payload(conn, user)
+    queries.bump_data_version(user['id'], conn)
+    enqueue(ANALYTICS_JOB, conn, user_id=user['id'], delay=30)
+    conn.commit()
+
+    assert load_analytics(user['id'], conn) == dict(payload, stale=True)
+
+def test_outdated_payload_without_a_pending_job_is_recomputed(jobs_app, conn, user):
+    stored_payload(conn, user)
+    queries.bump_data_version(user['id'], conn)
+    conn.commit()
+
+    assert 'stale' not in load_analytics(user['id'], conn)
+
+def test_api_does_not_let_clients_keep_a_stale_payload(jobs_app, conn, user, client):
+    stored_payload(conn, user)
+    queries.bump_data_version(user['id'], conn)
+    enqueue(ANALYTICS_JOB, conn, user_id=user['id'], delay=30)
+    conn.commit()
+
+    response = client.get('/api/v1/analytics')
+    assert response.get_json()['stale'] is True
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
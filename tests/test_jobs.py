@@ -0,0 +1,104 @@
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from habit_tracker import jobs
+from habit_tracker.jobs import claim_job, enqueue, fail_job, finish_job, run_next_job
+
+@pytest.fixture
+def kind():
+    """A registered job kind whose handler fails while `failing` is set"""
+    calls = []
+
+    def handler(user_id, conn):
+        calls.append(user_id)
+        if handler.failing:
+            raise RuntimeError('boom')
+
+    handler.failing = False
+    handler.calls = calls
+    jobs.HANDLERS['test'] = (handler, False)
+    yield handler
+    del jobs.HANDLERS['test']
+
+def job_rows(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT status, attempts, last_error, run_after > NOW() as delayed FROM jobs WHERE kind = 'test'")
+    return cursor.fetchall()
+
+def make_due(conn):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE jobs SET run_after = NOW() WHERE kind = 'test'")
+    conn.commit()
+
+def test_pending_jobs_are_queued_once(conn, user):
+    assert enqueue('test', conn, user_id=user['id']) == 1
+    assert enqueue('test', conn, user_id=user['id']) == 0
+    conn.commit()
+    assert len(job_rows(conn)) == 1
+
+def test_a_claimed_job_is_skipped_by_other_workers(db_app, conn, user, database_url):
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+
+    other = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        claimed = claim_job('worker-1', conn)
+        assert claimed['user_id'] == user['id'] and claimed['attempts'] == 1
+        assert claim_job('worker-2', other) is None
+    finally:
+        other.close()
+
+    finish_job(claimed, 'worker-1', conn)
+    assert job_rows(conn) == []
+
+def test_an_expired_lease_is_claimed_again(conn, user):
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+    first = claim_job('worker-1', conn)
+
+    cursor = conn.cursor()
+    cursor.execute("UPDATE jobs SET locked_until = NOW() - INTERVAL '1 second'")
+    conn.commit()
+    second = claim_job('worker-2', conn)
+    assert (second['id'], second['attempts']) == (first['id'], 2)
+
+    # The first worker lost its lease, so its finish is ignored
+    finish_job(first, 'worker-1', conn)
+    assert len(job_rows(conn)) == 1
+
+def test_failures_retry_with_backoff_then_stay_failed(db_app, conn, user, kind):
+    db_app.config['JOB_MAX_ATTEMPTS'] = 2
+    kind.failing = True
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+
+    assert run_next_job('worker-1')
+    [row] = job_rows(conn)
+    assert (row['status'], row['attempts'], row['delayed']) == ('pending', 1, True)
+    assert row['last_error'] == 'RuntimeError: boom'
+    assert not run_next_job('worker-1')
+
+    make_due(conn)
+    assert run_next_job('worker-1')
+    [row] = job_rows(conn)
+    assert (row['status'], row['attempts']) == ('failed', 2)
+    assert kind.calls == [user['id'], user['id']]
+
+def test_a_retry_yields_to_a_newer_pending_job(conn, user):
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+    claimed = claim_job('worker-1', conn)
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+
+    assert fail_job(claimed, 'worker-1', 'RuntimeError: boom', conn) == 'retry'
+    [row] = job_rows(conn)
+    assert (row['status'], row['attempts']) == ('pending', 0)
+
+def test_a_job_that_succeeds_is_removed(conn, user, kind):
+    enqueue('test', conn, user_id=user['id'])
+    conn.commit()
+    assert run_next_job('worker-1')
+    assert job_rows(conn) == []
+    assert kind.calls == [user['id']]
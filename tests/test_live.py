@@ -0,0 +1,33 @@
+import threading
+
+from habit_tracker.live import LiveHub
+
+def test_concurrent_subscribes_stop_at_max_streams(database_url):
+    hub = LiveHub(database_url)
+    barrier = threading.Barrier(20)
+    subscriptions = []
+
+    def subscribe(user_id):
+        barrier.wait()
+        subscriptions.append(hub.subscribe(user_id, max_streams=3))
+
+    threads = [threading.Thread(target=subscribe, args=(user_id,)) for user_id in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([s for s in subscriptions if s is not None]) == 3
+    assert hub.stream_count() == 3
+
+def test_events_refuses_streams_over_the_limit_until_one_closes(db_app, client):
+    db_app.config.update(LIVE_UPDATES=True, LIVE_MAX_STREAMS=1)
+
+    first = client.get('/events')
+    assert first.status_code == 200
+    refused = client.get('/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+
+    first.close()
+    assert client.get('/events').status_code == 200
@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+
+import pytest
+
+from habit_tracker import create_app, partitions, queries
+from habit_tracker.partitions import PARENT_TABLE, RETIRED_TABLE, STAGING_TABLE, is_partitioned, partition_entries_command
+
+from .conftest import TEST_CONFIG
+
+def test_unknown_partition_interval_fails_at_startup():
+    with pytest.raises(ValueError, match="Unknown PARTITION_INTERVAL: 'monthly'"):
+        create_app(dict(TEST_CONFIG, PARTITION_INTERVAL='monthly'))
+
+@pytest.fixture
+def unpartitioned(conn):
+    """Puts the plain habit_entries table back after a test converts it"""
+    yield
+    conn.rollback()
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+    cursor.execute(f'DROP FUNCTION IF EXISTS {PARENT_TABLE}_mirror() CASCADE')
+    if is_partitioned(PARENT_TABLE, conn):
+        # The sequence belongs to the partitioned table now and would be dropped with it
+        cursor.execute(f'ALTER SEQUENCE {PARENT_TABLE}_id_seq OWNED BY {RETIRED_TABLE}.id')
+        cursor.execute(f'DROP TABLE {PARENT_TABLE}')
+        cursor.execute(f'ALTER TABLE {RETIRED_TABLE} RENAME TO {PARENT_TABLE}')
+        cursor.execute(f'ALTER SEQUENCE {PARENT_TABLE}_id_seq OWNED BY {PARENT_TABLE}.id')
+    conn.commit()
+
+def entries(table, conn):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT habit_id, date, completed FROM {table} ORDER BY habit_id, date')
+    return [tuple(row.values()) for row in cursor.fetchall()]
+
+def test_partition_entries_copies_rows_and_mirrors_writes_made_during_the_copy(
+        db_app, conn, user, unpartitioned, monkeypatch):
+    db_app.config['PARTITION_INTERVAL'] = 'quarter'
+    habit_id = user['habit_id']
+    start = date(2024, 1, 30)
+    days = [start + timedelta(days=offset * 9) for offset in range(12)]
+    for day in days:
+        queries.toggle_entry(habit_id, user['id'], day, conn)  # completed
+    conn.commit()
+
+    copy_batch = partitions.copy_batch
+    batches = []
+
+    def copy_batch_after_writes(low, high, copy_conn):
+        if len(batches) == 1:
+            # Writes between two batches: only the trigger carries those to rows already copied
+            queries.toggle_entry(habit_id, user['id'], days[0], conn)  # updated to missed
+            queries.toggle_entry(habit_id, user['id'], days[1], conn)
+            queries.toggle_entry(habit_id, user['id'], days[1], conn)  # deleted
+            queries.toggle_entry(habit_id, user['id'], days[-1], conn)
+            queries.toggle_entry(habit_id, user['id'], days[-1], conn)  # deleted before its copy
+            queries.toggle_entry(habit_id, user['id'], date(2024, 12, 25), conn)  # inserted
+            conn.commit()
+        batches.append((low, high))
+        return copy_batch(low, high, copy_conn)
+
+    monkeypatch.setattr(partitions, 'copy_batch', copy_batch_after_writes)
+    result = db_app.test_cli_runner().invoke(partition_entries_command, ['--batch-size', '5'])
+    assert result.exit_code == 0, result.output
+    assert len(batches) == 3
+
+    assert is_partitioned(PARENT_TABLE, conn)
+    expected = sorted(
+        [(habit_id, days[0], False)]
+        + [(habit_id, day, True) for day in days[2:-1]]
+        + [(habit_id, date(2024, 12, 25), True)]
+    )
+    assert entries(PARENT_TABLE, conn) == expected
+    assert entries(RETIRED_TABLE, conn) == expected
+
+    # The swapped table takes writes through its partitioned primary key
+    assert queries.toggle_entry(habit_id, user['id'], days[2], conn) == 'missed'
+    assert queries.toggle_entry(habit_id, user['id'], date(2025, 2, 3), conn) == 'completed'
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT tableoid::regclass::text AS partition FROM {PARENT_TABLE} WHERE date = %s',
+                   (date(2025, 2, 3),))
+    assert cursor.fetchone()['partition'] == f'{PARENT_TABLE}_p2025_01'
+    assert len(entries(PARENT_TABLE, conn)) == len(expected) + 1
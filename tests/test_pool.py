@@ -0,0 +1,125 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from habit_tracker import db
+from habit_tracker.db import ConnectionPool, PoolExhaustedError
+
+class FakeInfo:
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, vars=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.info = FakeInfo()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Every FakeConnection the pool opens, in order"""
+    opened = []
+
+    def connect(dsn, cursor_factory=None):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    return opened
+
+def test_returned_connection_is_reused(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+
+def test_exhausted_pool_raises_after_timeout(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1, timeout=0.05)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolExhaustedError):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 1
+
+def test_waiter_gets_the_returned_connection(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1, timeout=5)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+    assert pool.stats()['waits'] == 1
+
+def test_worn_out_connection_is_recycled(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1, max_uses=2)
+    first = pool.getconn()
+    pool.putconn(first)
+    assert pool.getconn() is first
+    pool.putconn(first)
+
+    assert first.closed
+    assert pool.getconn() is not first
+    stats = pool.stats()
+    assert stats['connections_recycled'] == 1
+    assert stats['connections_created'] == 2
+
+def test_closed_connection_is_not_kept(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.closed = 2
+    pool.putconn(conn)
+    assert pool.stats()['size'] == 0
+    assert pool.getconn() is not conn
+
+def test_idle_connection_failing_its_ping_is_replaced(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1, healthcheck_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()['connections_failed_healthcheck'] == 1
+
+def test_open_transaction_is_rolled_back_on_return(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+def test_pooled_connection_close_returns_it_once(connections):
+    pool = ConnectionPool('fake', min_size=0, max_size=1)
+    wrapped = db.PooledConnection(pool, pool.getconn())
+    wrapped.close()
+    wrapped.close()
+    assert pool.stats()['idle'] == 1
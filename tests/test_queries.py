@@ -0,0 +1,75 @@
+from datetime import date
+
+from habit_tracker import queries
+
+DAY = date(2024, 3, 5)
+
+def entry(habit_id, day, conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT completed FROM habit_entries WHERE habit_id = %s AND date = %s', (habit_id, day))
+    row = cursor.fetchone()
+    return None if row is None else row['completed']
+
+def test_toggle_cycles_empty_completed_missed_empty(conn, user):
+    habit_id = user['habit_id']
+    assert queries.toggle_entry(habit_id, user['id'], DAY, conn) == 'completed'
+    assert entry(habit_id, DAY, conn) is True
+    assert queries.toggle_entry(habit_id, user['id'], DAY, conn) == 'missed'
+    assert entry(habit_id, DAY, conn) is False
+    assert queries.toggle_entry(habit_id, user['id'], DAY, conn) == 'empty'
+    assert entry(habit_id, DAY, conn) is None
+    assert queries.toggle_entry(habit_id, user['id'], DAY, conn) == 'completed'
+
+def test_toggle_ignores_other_users_and_inactive_habits(conn, user):
+    other_id = queries.create_user('someone_else', 'unused-hash', conn)
+    assert queries.toggle_entry(user['habit_id'], other_id, DAY, conn) is None
+
+    cursor = conn.cursor()
+    cursor.execute('UPDATE habits SET active = false WHERE id = %s', (user['habit_id'],))
+    assert queries.toggle_entry(user['habit_id'], user['id'], DAY, conn) is None
+    assert entry(user['habit_id'], DAY, conn) is None
+
+def test_set_entries_applies_every_state(conn, user):
+    habit_id = user['habit_id']
+    queries.toggle_entry(habit_id, user['id'], date(2024, 3, 3), conn)  # completed, about to be cleared
+    applied, rejected = queries.set_entries(user['id'], [
+        (habit_id, date(2024, 3, 1), 'completed'),
+        (habit_id, date(2024, 3, 2), 'missed'),
+        (habit_id, date(2024, 3, 3), 'empty'),
+    ], conn)
+
+    assert rejected == []
+    assert applied == {
+        (habit_id, date(2024, 3, 1)): 'completed',
+        (habit_id, date(2024, 3, 2)): 'missed',
+        (habit_id, date(2024, 3, 3)): 'empty',
+    }
+    assert entry(habit_id, date(2024, 3, 1), conn) is True
+    assert entry(habit_id, date(2024, 3, 2), conn) is False
+    assert entry(habit_id, date(2024, 3, 3), conn) is None
+
+def test_set_entries_last_change_to_a_cell_wins(conn, user):
+    habit_id = user['habit_id']
+    applied, _ = queries.set_entries(user['id'], [
+        (habit_id, DAY, 'completed'),
+        (habit_id, DAY, 'missed'),
+    ], conn)
+    assert applied == {(habit_id, DAY): 'missed'}
+    assert entry(habit_id, DAY, conn) is False
+
+def test_set_entries_rejects_habits_the_user_does_not_own(conn, user):
+    other_id = queries.create_user('someone_else', 'unused-hash', conn)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO habits (user_id, name, category) VALUES (%s, 'Theirs', 'Health') RETURNING id", (other_id,))
+    their_habit = cursor.fetchone()['id']
+
+    applied, rejected = queries.set_entries(user['id'], [
+        (user['habit_id'], DAY, 'completed'),
+        (their_habit, DAY, 'completed'),
+    ], conn)
+    assert rejected == [their_habit]
+    assert applied == {(user['habit_id'], DAY): 'completed'}
+    assert entry(their_habit, DAY, conn) is None
+
+def test_set_entries_with_no_changes_runs_nothing(conn, user):
+    assert queries.set_entries(user['id'], [], conn) == ({}, [])
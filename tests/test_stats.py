@@ -0,0 +1,74 @@
+import random
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from habit_tracker import queries
+from habit_tracker.db import get_db_connection
+from habit_tracker.stats import (check_habit_stats, refresh_habit_stats, refresh_stale_habit_stats,
+                                 update_habit_stats)
+
+DAY = date(2024, 3, 5)
+
+def test_concurrent_writes_to_one_habit_keep_its_stats_consistent(db_app, conn, user):
+    habit_id = user['habit_id']
+    queries.toggle_entry(habit_id, user['id'], DAY, conn)
+    refresh_habit_stats([habit_id], conn, DAY)
+
+    def second_writer():
+        with db_app.app_context():
+            other = get_db_connection()
+            try:
+                queries.toggle_entry(habit_id, user['id'], DAY - timedelta(days=1), other)
+                refresh_habit_stats([habit_id], other, DAY)
+                other.commit()
+            finally:
+                other.close()
+
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive()  # waiting for the first writer's lock on the habit
+    conn.commit()
+    thread.join(5)
+    assert not thread.is_alive()
+
+    mismatches, missing = check_habit_stats([habit_id], conn)
+    assert (mismatches, missing) == ([], 0)
+    cursor = conn.cursor()
+    cursor.execute('SELECT current_streak, total_completed FROM habit_stats WHERE habit_id = %s', (habit_id,))
+    assert cursor.fetchone() == {'current_streak': 2, 'total_completed': 2}
+
+def write(cells, conn, user):
+    """Set {date: state} on the user's habit the way /toggle_habits does, stats included"""
+    habit_id = user['habit_id']
+    changes = [(habit_id, day, state) for day, state in cells.items()]
+    queries.lock_habits([habit_id], conn)
+    previous = queries.get_entry_states({(habit_id, day) for day in cells}, conn)
+    applied, _ = queries.set_entries(user['id'], changes, conn)
+    update_habit_stats({cell: (previous[cell], state) for cell, state in applied.items()}, conn, DAY)
+    conn.commit()
+
+@pytest.mark.parametrize('bitmaps', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_updates_match_a_full_recompute(db_app, conn, user, bitmaps, seed):
+    db_app.config['BITMAP_STORE'] = bitmaps
+    rng = random.Random(seed)
+    days = [DAY - timedelta(days=offset) for offset in range(-3, 60)]
+    write({day: rng.choice(queries.ENTRY_STATES) for day in days}, conn, user)
+    refresh_habit_stats([user['habit_id']], conn, DAY)
+    conn.commit()
+
+    for _ in range(40):
+        count = rng.choice([1, 1, 1, 3])
+        write({rng.choice(days): rng.choice(queries.ENTRY_STATES) for _ in range(count)}, conn, user)
+        assert check_habit_stats([user['habit_id']], conn) == ([], 0)
+
+def test_rollover_leaves_a_newer_row_alone(conn, user):
+    habit_id = user['habit_id']
+    write({DAY: 'completed'}, conn, user)
+    refresh_stale_habit_stats([habit_id], conn, DAY - timedelta(days=1))
+    cursor = conn.cursor()
+    cursor.execute('SELECT stats_date, current_streak FROM habit_stats WHERE habit_id = %s', (habit_id,))
+    assert cursor.fetchone() == {'stats_date': DAY, 'current_streak': 1}
@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers: gunicorn -c gunicorn.conf.py wsgi:app"""
+from habit_tracker import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    app.run()